@@ -0,0 +1,223 @@
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Defaults match Alpha Vantage's free plan; raise them to match a premium plan
+ALPHA_VANTAGE_REQUESTS_PER_MINUTE = int(os.getenv("ALPHA_VANTAGE_REQUESTS_PER_MINUTE", 5))
+ALPHA_VANTAGE_REQUESTS_PER_DAY = int(os.getenv("ALPHA_VANTAGE_REQUESTS_PER_DAY", 25))
+ALPHA_VANTAGE_MAX_CONCURRENCY = int(os.getenv("ALPHA_VANTAGE_MAX_CONCURRENCY", 4))
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_PREFETCH = 1
+
+# Fragments of the "Note"/"Information" messages Alpha Vantage returns instead of data when throttled
+_RATE_LIMIT_MESSAGES = ("rate limit", "call frequency", "requests per minute", "requests per day")
+
+
+class AlphaVantageQuotaExceeded(Exception):
+    """Raised when the Alpha Vantage call budget cannot serve a request."""
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Job:
+    __slots__ = ("key", "func", "future", "started")
+
+    def __init__(self, key: str, func, future: Future):
+        self.key = key
+        self.func = func
+        self.future = future
+        self.started = False
+
+
+class AlphaVantageScheduler:
+    """
+    Single gate for Alpha Vantage calls.
+
+    - A token bucket enforces the per-minute limit; a persisted counter enforces the per-day limit.
+    - Queued calls are dispatched by priority (PRIORITY_INTERACTIVE before PRIORITY_PREFETCH),
+      FIFO within a priority, on a small worker pool.
+    - Calls are coalesced by key: submitting a key that is already queued or running returns the
+      existing Future (and raises its priority if the new request is more urgent).
+    - When the daily budget is spent, or the provider reports throttling, queued calls fail with
+      AlphaVantageQuotaExceeded so callers can fall back to cached data.
+    """
+
+    def __init__(self, requests_per_minute: int = ALPHA_VANTAGE_REQUESTS_PER_MINUTE,
+                 requests_per_day: int = ALPHA_VANTAGE_REQUESTS_PER_DAY,
+                 max_concurrency: int = ALPHA_VANTAGE_MAX_CONCURRENCY, state_path: str | None = None):
+        self.requests_per_minute = max(1, requests_per_minute)
+        self.requests_per_day = max(1, requests_per_day)
+        market_data_dir = os.getenv("MARKET_DATA_DIR", os.path.join(PROJECT_ROOT, 'data', 'market_data'))
+        self.state_path = state_path or os.path.join(market_data_dir, 'alpha_vantage_quota.json')
+
+        self._tokens = float(self.requests_per_minute)
+        self._refilled_at = time.monotonic()
+        self._day, self._used_today = self._load_day_usage()
+
+        self._queue = [] # (priority, sequence, job)
+        self._sequence = itertools.count()
+        self._in_flight = {} # key -> (job, priority)
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix="alpha-vantage")
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="alpha-vantage-scheduler", daemon=True)
+        self._dispatcher.start()
+
+    # --- Daily budget -------------------------------------------------------------------
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(tz=timezone.utc).date().isoformat()
+
+    def _load_day_usage(self) -> tuple[str, int]:
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get("day") == self._today():
+                return state["day"], int(state.get("used", 0))
+        except (OSError, ValueError, KeyError):
+            pass
+        return self._today(), 0
+
+    def _save_day_usage(self):
+        try:
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"day": self._day, "used": self._used_today}, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            print(f"AlphaVantageScheduler: Could not persist daily usage: {e}")
+
+    def _daily_remaining(self) -> int:
+        if self._day != self._today():
+            self._day, self._used_today = self._today(), 0
+        return self.requests_per_day - self._used_today
+
+    @staticmethod
+    def _seconds_until_utc_midnight() -> float:
+        now = datetime.now(tz=timezone.utc)
+        return 86400 - (now.hour * 3600 + now.minute * 60 + now.second)
+
+    # --- Per-minute bucket ----------------------------------------------------------------
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(float(self.requests_per_minute), self._tokens + (now - self._refilled_at) * self.requests_per_minute / 60.0)
+        self._refilled_at = now
+
+    def _seconds_until_token(self) -> float:
+        self._refill()
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) * 60.0 / self.requests_per_minute
+
+    # --- Public API -------------------------------------------------------------------------
+
+    def submit(self, key: str, func, priority: int = PRIORITY_INTERACTIVE) -> Future:
+        """Queues `func()` under `key` and returns a Future for its result."""
+        with self._condition:
+            existing = self._in_flight.get(key)
+            if existing:
+                job, queued_priority = existing
+                if not job.started and priority < queued_priority:
+                    # Re-queue at the more urgent priority; the stale heap entry is skipped when popped
+                    heapq.heappush(self._queue, (priority, next(self._sequence), job))
+                    self._in_flight[key] = (job, priority)
+                    self._condition.notify()
+                return job.future
+
+            job = _Job(key, func, Future())
+            self._in_flight[key] = (job, priority)
+            heapq.heappush(self._queue, (priority, next(self._sequence), job))
+            self._condition.notify()
+            return job.future
+
+    def retry_after(self) -> float:
+        """Seconds until the next call could be dispatched."""
+        with self._condition:
+            if self._daily_remaining() <= 0:
+                return self._seconds_until_utc_midnight()
+            return self._seconds_until_token()
+
+    def status(self) -> dict:
+        with self._condition:
+            self._refill()
+            return {
+                "requests_per_minute": self.requests_per_minute,
+                "requests_per_day": self.requests_per_day,
+                "tokens_available": round(self._tokens, 2),
+                "used_today": self._used_today,
+                "remaining_today": max(0, self._daily_remaining()),
+                "queued": sum(1 for job, _ in self._in_flight.values() if not job.started),
+                "running": sum(1 for job, _ in self._in_flight.values() if job.started),
+            }
+
+    # --- Dispatching ----------------------------------------------------------------------
+
+    def _fail(self, job: _Job, error: Exception):
+        self._in_flight.pop(job.key, None)
+        job.started = True
+        job.future.set_exception(error)
+
+    def _dispatch_loop(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                priority, _, job = self._queue[0]
+                if job.started or self._in_flight.get(job.key, (None, None))[0] is not job:
+                    heapq.heappop(self._queue) # Superseded or already handled
+                    continue
+
+                if self._daily_remaining() <= 0:
+                    heapq.heappop(self._queue)
+                    self._fail(job, AlphaVantageQuotaExceeded(
+                        f"Alpha Vantage daily budget of {self.requests_per_day} requests is used up.",
+                        retry_after=self._seconds_until_utc_midnight()))
+                    continue
+
+                wait = self._seconds_until_token()
+                if wait > 0:
+                    # Wake early if something more urgent is queued meanwhile
+                    self._condition.wait(timeout=wait)
+                    continue
+
+                heapq.heappop(self._queue)
+                self._tokens -= 1
+                self._used_today += 1
+                self._save_day_usage()
+                job.started = True
+            self._executor.submit(self._run, job)
+
+    def _run(self, job: _Job):
+        try:
+            result = job.func()
+        except Exception as e:
+            error = e
+            message = str(e).lower()
+            if any(fragment in message for fragment in _RATE_LIMIT_MESSAGES):
+                with self._condition:
+                    if "per day" in message:
+                        self._used_today = self.requests_per_day
+                        self._save_day_usage()
+                        retry_after = self._seconds_until_utc_midnight()
+                    else:
+                        self._tokens = min(self._tokens, 0.0)
+                        retry_after = 60.0
+                print(f"AlphaVantageScheduler: Provider throttled request for {job.key}: {e}")
+                error = AlphaVantageQuotaExceeded(f"Alpha Vantage throttled the request: {e}", retry_after=retry_after)
+            with self._condition:
+                self._in_flight.pop(job.key, None)
+            job.future.set_exception(error)
+            return
+        with self._condition:
+            self._in_flight.pop(job.key, None)
+        job.future.set_result(result)
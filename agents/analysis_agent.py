@@ -1,9 +1,39 @@
 import os
 import re
+import sys
 import json # ADDED for LLM interaction
+from bisect import bisect_left, bisect_right
+from typing import NamedTuple
 import requests # ADDED for LLM interaction
 from dotenv import load_dotenv
 
+# Allow `from agents...` imports when this file is run directly
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from agents.disk_cache import DiskCache, LRUCache, content_key
+from agents.earnings_sentiment import EarningsSentimentClassifier
+from agents.indicators import compute_indicators
+
+# On-disk cache of LLM earnings-sentiment summaries; bump the prompt version when the prompt changes
+LLM_SENTIMENT_CACHE_PATH = os.getenv("ANALYSIS_LLM_CACHE_PATH", os.path.join(PROJECT_ROOT, 'data', 'analysis_cache', 'llm_sentiment.sqlite'))
+LLM_SENTIMENT_CACHE_TTL = int(os.getenv("ANALYSIS_LLM_CACHE_TTL", 7 * 24 * 3600))
+LLM_SENTIMENT_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_LLM_CACHE_MAX_ENTRIES", 5000))
+LLM_SENTIMENT_PROMPT_VERSION = "earnings-sentiment-v1"
+# In-memory cache of per-document keyword scan results, keyed by content hash
+DOCUMENT_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_DOCUMENT_CACHE_MAX_ENTRIES", 4096))
+
+# Descriptions for the risk flags raised by agents.indicators
+INDICATOR_RISK_DESCRIPTIONS = {
+    "significant_drop": "Significant 1-day price drop",
+    "high_volatility": "High annualised volatility",
+    "large_drawdown": "Large drawdown from recent peak",
+    "price_gap": "Unusual opening price gap",
+    "volume_spike": "Unusual trading volume",
+    "high_beta": "High beta to the market benchmark",
+}
+
 # Define keyword lists for analysis
 RISK_KEYWORDS = [
     "volatility", "volatile", "uncertainty", "uncertain", "risk", "risks", "risky",
@@ -53,6 +83,294 @@ VERBS_DECREASE = [
     "dropped", "missed", "lower", "weaker", "down", "slowed", "softened"
 ]
 
+class KeywordMatch(NamedTuple):
+    start: int # Offsets into the original (not lowercased) text
+    end: int
+    keyword: str
+    category: str
+
+
+class EvidenceSpan(NamedTuple):
+    start: int # Window around one or more nearby matches, merged where windows overlap
+    end: int
+    matches: list[KeywordMatch]
+
+    @property
+    def keywords(self) -> list[str]:
+        return list(dict.fromkeys(m.keyword for m in self.matches))
+
+    def to_dict(self, text: str, source: dict | None = None) -> dict:
+        """Materialises the evidence string; done only when building the analysis output."""
+        prefix = "..." if self.start > 0 else ""
+        suffix = "..." if self.end < len(text) else ""
+        evidence = {
+            "evidence": f"{prefix}{text[self.start:self.end]}{suffix}",
+            "span": [self.start, self.end],
+            "match_offsets": [[m.start, m.end] for m in self.matches],
+        }
+        if source:
+            evidence["source"] = source
+        return evidence
+
+
+class DocumentFacts(NamedTuple):
+    """What one scan of a document yields; independent of the query, so it is cached by content."""
+    risk_spans: list[EvidenceSpan]
+    earnings_spans: dict[str, list[EvidenceSpan]] # "positive" / "negative" / "neutral" -> spans
+    figures: list # EarningsFigure list: EPS/revenue/margin/guidance numbers
+
+
+class KeywordMatcher:
+    """
+    Finds every occurrence of many keyword phrases, whole-word and case-insensitively, in one regex pass.
+
+    All phrases are compiled into a single alternation (longest first) inside a lookahead, so the
+    scan reports a match at every position rather than consuming text; phrases that are word-bounded
+    prefixes of a longer phrase matched at the same position ("drop" in "drop in profit") are emitted
+    from a precomputed table. A phrase listed under several categories yields one match per category.
+    """
+
+    def __init__(self, keywords_by_category: dict[str, list[str]]):
+        self.categories = {}
+        for category, keywords in keywords_by_category.items():
+            for keyword in keywords:
+                self.categories.setdefault(keyword.lower(), [])
+                if category not in self.categories[keyword.lower()]:
+                    self.categories[keyword.lower()].append(category)
+        phrases = sorted(self.categories, key=len, reverse=True)
+        self._pattern = re.compile(
+            r'(?<!\w)(?=(' + '|'.join(re.escape(p) for p in phrases) + r')(?!\w))',
+            re.IGNORECASE
+        )
+        self._prefixes = {
+            phrase: [other for other in phrases if other != phrase and phrase.startswith(other) and not phrase[len(other)].isalnum()]
+            for phrase in phrases
+        }
+
+    def find_all(self, text: str) -> list[KeywordMatch]:
+        """All keyword matches in `text`, ordered by start offset."""
+        matches = []
+        for match in self._pattern.finditer(text):
+            start = match.start()
+            phrase = match.group(1).lower()
+            for keyword in [phrase] + self._prefixes[phrase]:
+                for category in self.categories[keyword]:
+                    matches.append(KeywordMatch(start, start + len(keyword), keyword, category))
+        return matches
+
+
+# Built once at import; analysis scans each document with it a single time
+KEYWORD_MATCHER = KeywordMatcher({
+    "risk": RISK_KEYWORDS,
+    "earnings_positive": EARNINGS_POSITIVE_KEYWORDS,
+    "earnings_negative": EARNINGS_NEGATIVE_KEYWORDS,
+    "earnings_neutral": EARNINGS_NEUTRAL_KEYWORDS,
+})
+
+
+class EarningsFigure(NamedTuple):
+    start: int # Offsets of the phrase the figure was read from
+    end: int
+    metric: str # "eps", "revenue", "net_income", "operating_income", "<kind>_margin", "guidance"
+    kind: str # "vs_estimate", "vs_prior_period", "change", "level" or "guidance"
+    value: float | None # Reported figure, in dollars (scaled) or percent
+    unit: str | None # "usd" or "percent"
+    reference: float | None # Expected or prior-period value the figure is compared with
+    change: float | None # Surprise or change versus the reference, or the reported delta
+    change_unit: str | None # "percent", "bps" or "pp"
+    direction: str | None # "positive", "negative" or "neutral" for the company
+
+    def to_dict(self, text: str, source: dict | None = None) -> dict:
+        figure = {
+            "metric": self.metric, "kind": self.kind, "value": self.value, "unit": self.unit,
+            "reference": self.reference, "change": self.change, "change_unit": self.change_unit,
+            "direction": self.direction, "evidence": text[self.start:self.end], "span": [self.start, self.end],
+        }
+        if source:
+            figure["source"] = source
+        return figure
+
+    def describe(self) -> str:
+        """Short human-readable form, e.g. "eps $1.52 vs $1.43 expected (+6.3%)"."""
+        def amount(value):
+            if self.unit == "percent":
+                return f"{value:g}%"
+            sign = "-" if value < 0 else ""
+            for scale, suffix in ((1e12, "T"), (1e9, "B"), (1e6, "M")):
+                if abs(value) >= scale:
+                    return f"{sign}${abs(value) / scale:,.2f}{suffix}"
+            return f"{sign}${abs(value):,.2f}"
+        change = f"{self.change:+g}{'%' if self.change_unit == 'percent' else ' ' + self.change_unit}" if self.change is not None else ""
+        if self.kind == "vs_estimate":
+            return f"{self.metric} {amount(self.value)} vs {amount(self.reference)} expected ({change})"
+        if self.kind == "vs_prior_period":
+            return f"{self.metric} {amount(self.value)} vs {amount(self.reference)} in the prior period ({change})"
+        if self.kind == "guidance":
+            action = {"positive": "raised", "negative": "lowered", "neutral": "reaffirmed"}.get(self.direction, "updated")
+            return f"guidance {action}" + (f" to {amount(self.value)}" if self.value is not None else "")
+        if self.kind == "change":
+            return f"{self.metric} {change}" + (f" to {amount(self.value)}" if self.value is not None else "")
+        return f"{self.metric} {amount(self.value)}"
+
+
+_AMOUNT_SCALES = {"thousand": 1e3, "k": 1e3, "million": 1e6, "mn": 1e6, "m": 1e6, "billion": 1e9, "bn": 1e9, "b": 1e9, "trillion": 1e12, "tn": 1e12}
+_METRIC_NAMES = {"eps": "eps", "earnings per share": "eps", "loss per share": "eps", "revenue": "revenue", "revenues": "revenue",
+                 "sales": "revenue", "net income": "net_income", "net profit": "net_income", "net loss": "net_income",
+                 "operating income": "operating_income", "operating loss": "operating_income"}
+_DECREASE_WORDS = {"down", "fell", "falls", "fallen", "declined", "declines", "decreased", "decreases", "dropped", "slipped", "slid",
+                   "shrank", "shrunk", "contracted", "narrowed", "compressed", "decline", "drop", "decrease", "fall",
+                   "lowered", "lowers", "lowering", "cut", "cuts", "reduced", "trimmed"}
+_NEUTRAL_GUIDANCE_WORDS = {"reaffirmed", "reaffirms", "maintained", "reiterated", "reiterates"}
+
+
+def _amount_pattern(name: str) -> str:
+    # "$1.52", "$(0.12)", "$94.8 billion", "$94.8B", "94.8 billion"
+    return (rf"(?P<{name}>\$\s?\(?-?\d[\d,]*(?:\.\d+)?\)?(?:\s?(?:trillion|billion|million|thousand|tn|bn|mn|[bmk])\b)?"
+            rf"|-?\d[\d,]*(?:\.\d+)?\s?(?:trillion|billion|million)\b)")
+
+
+def _parse_amount(text: str) -> float:
+    text = text.strip().lower()
+    value = float(re.search(r"\d[\d,]*(?:\.\d+)?", text).group().replace(",", ""))
+    scale = re.search(r"(trillion|billion|million|thousand|tn|bn|mn|[bmk])$", text)
+    if scale:
+        value *= _AMOUNT_SCALES[scale.group(1)]
+    return -value if "(" in text or "-" in text else value
+
+
+def _parse_percent(text: str) -> float:
+    return float(re.match(r"\d+(?:\.\d+)?", text).group())
+
+
+def _direction(delta: float) -> str:
+    return "positive" if delta > 0 else "negative" if delta < 0 else "neutral"
+
+
+class EarningsFactExtractor:
+    """
+    Reads EPS, revenue, income, margin and guidance figures from text in one regex pass.
+
+    One compiled alternation covers: actual vs expected or prior-period figures ("EPS of $1.52 vs
+    $1.43 expected"), percentage changes ("revenue up 15%", "a 15% rise in sales"), margin moves and
+    levels ("gross margin expanded 120 bps to 45.2%"), and guidance changes with their ranges.
+    Each match becomes an EarningsFigure with its magnitude and direction. Loss metrics ("net loss",
+    "loss per share") are read as negative income, so a narrower loss is a positive move.
+    A comparison is vs_estimate only when it mentions estimates, consensus, guidance or analysts,
+    and vs_prior_period when it names an earlier period; bare comparisons ("below $520 million") are dropped.
+    """
+
+    _PERCENT = r"\d+(?:\.\d+)?\s?(?:%|percent\b|per cent\b)"
+    _METRIC = (r"(?:(?:adjusted|diluted|non-gaap|gaap|quarterly|total)\s+)?"
+               r"(?:eps|earnings per share|(?:net\s+)?loss per share|revenues?|sales|net income|net profit|net loss|operating income|operating loss)")
+    _COMPARE = r"vs\.?|versus|compared (?:with|to)|against|beating|beat|topping|topped|ahead of|above|exceeding|exceeded|missing|missed|below|short of"
+    _REFERENCE_SUFFIX = (r"\s*(?:(?:analysts?'?\s+|street\s+|consensus\s+)?(?:expected|expectations?|estimated?s?|forecasts?|consensus)\b|"
+                         r"(?:a|one) year (?:earlier|ago|before)|last (?:year|quarter)|"
+                         r"(?:in\s+|for\s+)?(?:the\s+)?(?:year[- ]ago|prior[- ]year|previous[- ]year|same|prior|previous|comparable)\s+(?:quarter|period|year)|"
+                         r"(?:in|for|during)\s+(?:the\s+)?(?:(?:first|second|third|fourth|1st|2nd|3rd|4th)\s+(?:fiscal\s+)?(?:quarter|half)"
+                         r"(?:\s+of)?(?:\s+(?:fiscal\s+)?(?:19|20)\d{2})?|(?:fiscal\s+|fy\s?)?(?:19|20)\d{2}|q[1-4](?:\s+(?:fiscal\s+|fy\s?)?(?:19|20)?\d{2})?))?")
+    _UP_DOWN = (r"was up|were up|was down|were down|up|down|rose|rises|risen|grew|grows|grown|increased|increases|jumped|surged|"
+                r"climbed|gained|fell|falls|fallen|declined|declines|decreased|decreases|dropped|slipped|slid|shrank|shrunk")
+    _GUIDANCE_VERBS = r"raised|raises|raising|lifted|boosted|hiked|lowered|lowers|lowering|cut|cuts|reduced|trimmed|reaffirmed|reaffirms|maintained|reiterated|reiterates"
+    _ESTIMATE = re.compile(r"estimate|consensus|expect|forecast|guidance|analyst|street|projected", re.IGNORECASE)
+    _PRIOR_PERIOD = re.compile(r"year[- ]ago|(?:a|one) year (?:earlier|ago|before)|last (?:year|quarter)|prior|previous|same (?:quarter|period)|"
+                               r"comparable|quarter|half|fiscal|\bfy|\bq[1-4]\b|\b(?:19|20)\d{2}\b", re.IGNORECASE)
+
+    def __init__(self):
+        P, M = self._PERCENT, self._METRIC
+        # Every alternative starts at a word start; checking that first skips most positions cheaply
+        self._pattern = re.compile(r"(?<![\w$.])(?:" + "|".join([
+            rf"(?P<compare>(?P<compare_metric>{M})\b[^.;$\d]{{0,40}}?{_amount_pattern('compare_value')}(?P<compare_gap>[^.;$\d]{{0,30}}?)"
+            rf"\b(?:{self._COMPARE})(?P<compare_between>[^.;$\d]{{0,40}}?){_amount_pattern('compare_reference')}(?P<compare_suffix>{self._REFERENCE_SUFFIX}))",
+            rf"(?P<change>(?P<change_metric>{M})\b[^.;$\d%]{{0,30}}?\b(?P<change_word>{self._UP_DOWN})\b\s*(?:by\s+)?(?P<change_pct>{P})"
+            rf"(?:\s+(?:year[- ]over[- ]year\s+)?to\s+{_amount_pattern('change_value')})?)",
+            rf"(?P<change_noun>(?P<change_noun_pct>{P})\s+(?:year[- ]over[- ]year\s+|annual\s+)?(?P<change_noun_word>increase|rise|growth|jump|gain|decline|drop|decrease|fall)\s+in\s+(?P<change_noun_metric>{M}))",
+            rf"(?P<margin_change>(?:(?P<margin_change_kind>gross|operating|net|profit|ebitda)\s+)?margins?\b[^.;\d]{{0,30}}?"
+            rf"\b(?P<margin_change_word>expanded|widened|improved|increased|rose|contracted|narrowed|shrank|declined|fell|compressed)\s+(?:by\s+)?"
+            rf"(?P<margin_change_delta>\d+(?:\.\d+)?)\s?(?P<margin_change_unit>basis points|bps|bp|percentage points?|pts?|%)"
+            rf"(?:\s+(?:to|at)\s+(?P<margin_change_level>{P}))?)",
+            rf"(?P<amount_level>{_amount_pattern('amount_level_value')}\s+(?:(?:of|in)\s+)?(?P<amount_level_metric>{M})\b)",
+            rf"(?P<margin_level>(?P<margin_level_kind>gross|operating|net|profit|ebitda)\s+margins?\s+(?:of|at|was|were|came in at|reached|stood at)\s+(?P<margin_level_value>{P}))",
+            rf"(?P<guidance>(?P<guidance_word>{self._GUIDANCE_VERBS})\s+(?:its\s+|their\s+)?(?:[\w-]+\s+){{0,3}}?(?:guidance|outlook|forecast)\b"
+            rf"(?:[^.;$\d]{{0,40}}?{_amount_pattern('guidance_low')}(?:\s*(?:-|–|to)\s*{_amount_pattern('guidance_high')})?)?)",
+        ]) + ")", re.IGNORECASE)
+
+    @staticmethod
+    def _signed(amount: float, metric_text: str) -> float:
+        """Losses are negative income: "net loss of $2 million" -> -2e6 (already-negative amounts stay negative)."""
+        return -abs(amount) if "loss" in metric_text.lower() else amount
+
+    @staticmethod
+    def _metric(text: str) -> str:
+        words = text.lower().split()
+        for length in (3, 2, 1):
+            name = " ".join(words[-length:])
+            if name in _METRIC_NAMES:
+                return _METRIC_NAMES[name]
+        return words[-1]
+
+    def extract(self, text: str) -> list[EarningsFigure]:
+        """All figures in `text`, ordered by start offset."""
+        figures = []
+        for m in self._pattern.finditer(text):
+            kind = m.lastgroup
+            if kind == "compare":
+                context = m.group("compare_between") + m.group("compare_suffix")
+                if self._ESTIMATE.search(context):
+                    compare_kind = "vs_estimate"
+                elif self._PRIOR_PERIOD.search(context):
+                    compare_kind = "vs_prior_period"
+                else:
+                    continue # Compared with an unknown reference
+                metric_text = m.group("compare_metric")
+                value = self._signed(_parse_amount(m.group("compare_value")), metric_text)
+                reference = self._signed(_parse_amount(m.group("compare_reference")), metric_text)
+                change = round((value - reference) / abs(reference) * 100, 2) if reference else None
+                # "net loss of $0.12 per share" is a per-share figure
+                metric = "eps" if "per share" in m.group("compare_gap").lower() else self._metric(metric_text)
+                figures.append(EarningsFigure(m.start(), m.end(), metric, compare_kind, value,
+                                              "usd", reference, change, "percent", _direction(value - reference)))
+            elif kind in ("change", "change_noun"):
+                pct = _parse_percent(m.group(f"{kind}_pct"))
+                word = m.group(f"{kind}_word").lower().split()[-1]
+                change = -pct if word in _DECREASE_WORDS else pct
+                metric_text = m.group(f"{kind}_metric")
+                if "loss" in metric_text.lower():
+                    change = -change # A growing loss is falling income
+                value = m.group("change_value") if kind == "change" else None
+                figures.append(EarningsFigure(m.start(), m.end(), self._metric(metric_text), "change",
+                                              self._signed(_parse_amount(value), metric_text) if value else None, "usd" if value else None,
+                                              None, change, "percent", _direction(change)))
+            elif kind == "margin_change":
+                unit = m.group("margin_change_unit").lower()
+                delta = float(m.group("margin_change_delta"))
+                change = -delta if m.group("margin_change_word").lower() in _DECREASE_WORDS else delta
+                level = m.group("margin_change_level")
+                figures.append(EarningsFigure(m.start(), m.end(), f"{(m.group('margin_change_kind') or '').lower() or 'profit'}_margin", "change",
+                                              _parse_percent(level) if level else None, "percent" if level else None, None, change,
+                                              "bps" if unit.startswith(("basis", "bp")) else "percent" if unit == "%" else "pp",
+                                              _direction(change)))
+            elif kind == "amount_level":
+                metric_text = m.group("amount_level_metric")
+                figures.append(EarningsFigure(m.start(), m.end(), self._metric(metric_text), "level",
+                                              self._signed(_parse_amount(m.group("amount_level_value")), metric_text), "usd",
+                                              None, None, None, None))
+            elif kind == "margin_level":
+                figures.append(EarningsFigure(m.start(), m.end(), f"{m.group('margin_level_kind').lower()}_margin", "level",
+                                              _parse_percent(m.group("margin_level_value")), "percent", None, None, None, None))
+            elif kind == "guidance":
+                word = m.group("guidance_word").lower()
+                low, high = m.group("guidance_low"), m.group("guidance_high")
+                value = (_parse_amount(low) + _parse_amount(high)) / 2 if low and high else _parse_amount(low) if low else None
+                direction = "neutral" if word in _NEUTRAL_GUIDANCE_WORDS else "negative" if word in _DECREASE_WORDS else "positive"
+                figures.append(EarningsFigure(m.start(), m.end(), "guidance", "guidance", value, "usd" if value is not None else None,
+                                              None, None, None, direction))
+        return figures
+
+
+# Built once at import, like KEYWORD_MATCHER
+EARNINGS_FACT_EXTRACTOR = EarningsFactExtractor()
+
+
 class AnalysisAgent:
     def __init__(self):
         print("Initializing AnalysisAgent...")
@@ -60,12 +378,21 @@ class AnalysisAgent:
         if not self.language_service_url.startswith("http"):
             self.language_service_url = "http://" + self.language_service_url
         print(f"AnalysisAgent configured with Language Service URL: {self.language_service_url}")
+        try:
+            self.llm_cache = DiskCache(LLM_SENTIMENT_CACHE_PATH, LLM_SENTIMENT_CACHE_TTL, LLM_SENTIMENT_CACHE_MAX_ENTRIES, name="AnalysisAgent LLM cache")
+        except Exception as e:
+            print(f"AnalysisAgent: LLM result cache unavailable, continuing without it: {e}")
+            self.llm_cache = None
+        self.document_cache = LRUCache(DOCUMENT_CACHE_MAX_ENTRIES)
+        # Local embedding classifier answers most earnings-sentiment questions without the LLM
+        self.sentiment_classifier = EarningsSentimentClassifier() if EarningsSentimentClassifier.available() else None
 
     def _call_language_service(self, prompt: str) -> dict | None: # ADDED Helper
         try:
             response = requests.post(
                 f"{self.language_service_url}/language/generate",
                 json={"prompt": prompt},
+                headers={"X-Request-Priority": "background"}, # Yields to user-facing brief generation
                 timeout=45 # Increased timeout for LLM calls
             )
             response.raise_for_status()
@@ -77,44 +404,90 @@ class AnalysisAgent:
             print(f"AnalysisAgent: Error decoding JSON from LanguageService: {e}")
             return None
 
-    def _extract_relevant_snippets(self, text: str, keywords: list[str], window=100) -> list[str]:
-        """Helper to extract snippets around keywords."""
-        snippets = []
-        text_lower = text.lower()
-        for keyword in keywords:
-            try:
-                # Use regex to find whole word matches for keywords to avoid partial matches
-                # This regex looks for the keyword bounded by non-alphanumeric characters or start/end of string
-                for match in re.finditer(r'(?:^|\W)' + re.escape(keyword.lower()) + r'(?:$|\W)', text_lower):
-                    start, end = match.start(), match.end()
-                    # Adjust start/end to be around the keyword itself, not the non-alphanumeric boundary
-                    kw_start = text_lower.find(keyword.lower(), start)
-                    kw_end = kw_start + len(keyword)
-                    
-                    snippet_start = max(0, kw_start - window)
-                    snippet_end = min(len(text), kw_end + window)
-                    snippets.append(f"...{text[snippet_start:snippet_end]}...")
-            except re.error as e:
-                print(f"Regex error for keyword '{keyword}': {e}")
-                # Fallback to simple string finding if regex fails for a specific keyword
-                idx = text_lower.find(keyword.lower())
-                if idx != -1:
-                    snippet_start = max(0, idx - window)
-                    snippet_end = min(len(text), idx + len(keyword) + window)
-                    snippets.append(f"...{text[snippet_start:snippet_end]}...")
-        return list(set(snippets)) # Return unique snippets
-
-    def analyze_market_data(self, market_info: dict | None, news_articles: list[str], company_filings: list[str], company_ticker: str | None = None) -> dict:
+    def _evidence_spans(self, text: str, matches: list[KeywordMatch], window=100) -> list[EvidenceSpan]:
+        """
+        Windows of `window` characters around each match, with overlapping windows merged into one
+        span that keeps all of its matches. `matches` must be ordered by start (as find_all returns them).
+        """
+        spans = []
+        for match in matches:
+            span_start = max(0, match.start - window)
+            span_end = min(len(text), match.end + window)
+            if spans and span_start <= spans[-1].end:
+                last = spans[-1]
+                spans[-1] = EvidenceSpan(last.start, max(last.end, span_end), last.matches + [match])
+            else:
+                spans.append(EvidenceSpan(span_start, span_end, [match]))
+        return spans
+
+    def _document_facts(self, text: str) -> DocumentFacts:
+        """
+        Risk and earnings evidence spans and earnings figures for one document. Retrieved chunks recur across briefs
+        and never change, so results are cached by content hash and each text is scanned once.
+        """
+        key = content_key(text)
+        facts = self.document_cache.get(key)
+        if facts is not None:
+            return facts
+        matches = KEYWORD_MATCHER.find_all(text)
+        by_type = {"positive": [], "negative": [], "neutral": []}
+        for m in matches:
+            if m.category.startswith("earnings_"):
+                by_type[m.category[len("earnings_"):]].append(m)
+        # Only check neutral if no pos/neg explicit keywords found in this snippet
+        if by_type["positive"] or by_type["negative"]:
+            by_type["neutral"] = []
+        facts = DocumentFacts(
+            risk_spans=self._evidence_spans(text, [m for m in matches if m.category == "risk"]),
+            earnings_spans={surprise_type: self._evidence_spans(text, type_matches) for surprise_type, type_matches in by_type.items()},
+            figures=EARNINGS_FACT_EXTRACTOR.extract(text),
+        )
+        self.document_cache.set(key, facts)
+        return facts
+
+    @staticmethod
+    def _source_ref(doc_index: int, news_count: int) -> dict:
+        """Identifies a document within news_articles + company_filings."""
+        if doc_index < news_count:
+            return {"type": "news", "index": doc_index}
+        return {"type": "filing", "index": doc_index - news_count}
+
+    def _indicator_stats(self, market_info: dict, ticker: str) -> dict | None:
+        """
+        Indicator statistics for the market_info payload: precomputed by the API Service's /indicators
+        endpoint ({"indicators": {...}}) or the orchestrator's market summary (flat record with risk_flags),
+        or computed here from columnar or Alpha Vantage-shaped daily bars.
+        """
+        if isinstance(market_info.get('indicators'), dict):
+            return market_info['indicators']
+        if isinstance(market_info.get('risk_flags'), list):
+            return market_info # Market summary record from the orchestrator
+        if isinstance(market_info.get('dates'), list):
+            daily_bars = market_info # Columnar format from the API Service
+        else:
+            daily_bars = {date: bar for date, bar in market_info.items() if isinstance(bar, dict) and '4. close' in bar}
+        if not daily_bars:
+            return None
+        try:
+            return compute_indicators({ticker: daily_bars}, benchmark=None).get(ticker)
+        except (ValueError, TypeError) as e:
+            print(f"AnalysisAgent: Could not compute indicators for {ticker}: {e}")
+            return None
+
+    def analyze_market_data(self, market_info: dict | None, news_articles: list[str], company_filings: list[str], company_ticker: str | None = None,
+                            portfolio_risk: dict | None = None) -> dict:
         """
         Analyzes a combination of market information, news, and filings
         to identify insights, risks, or surprises.
 
         Args:
             market_info (dict | None): e.g., stock data from APIAgent. 
-                                     Example: {"symbol": "AAPL", "price": 150.00, "change_percent": "-1.5%"}
+                                     Example: {"symbol": "AAPL", "last_close": 150.00, "change_percent": "-1.5%", "risk_flags": [...]}
             news_articles (list[str]): Relevant news snippets/full articles.
             company_filings (list[str]): Relevant excerpts/full documents from company filings.
             company_ticker (str | None): The primary company ticker for focused analysis.
+            portfolio_risk (dict | None): Output of the API Service's /risk/portfolio (VaR/CVaR and
+                                          per-position risk contributions), if the query concerns a portfolio.
 
         Returns:
             dict: Analysis results.
@@ -126,19 +499,33 @@ class AnalysisAgent:
         identified_risks = []
         all_texts = news_articles + company_filings
 
-        # 1. Identify risks from text
-        for text_content in all_texts:
-            risk_snippets = self._extract_relevant_snippets(text_content, RISK_KEYWORDS)
-            for snippet in risk_snippets:
+        # 1. Identify risks from text: one (cached) scan per document finds risk and earnings phrases alike.
+        # Nearby hits are merged into one evidence span; offsets refer to the source document.
+        facts_by_text = [self._document_facts(text_content) for text_content in all_texts]
+        for doc_index, (text_content, facts) in enumerate(zip(all_texts, facts_by_text)):
+            source = self._source_ref(doc_index, len(news_articles))
+            for span in facts.risk_spans:
                 identified_risks.append({
                     "source_type": "text_analysis",
                     "description": "Potential risk factor mentioned.",
-                    "evidence": snippet,
-                    "keywords_found": [kw for kw in RISK_KEYWORDS if kw in snippet.lower()]
+                    **span.to_dict(text_content, source),
+                    "keywords_found": span.keywords
                 })
         
-        # 2. Identify risks from market_info (e.g., significant price drop)
-        if market_info and 'change_percent' in market_info:
+        # 2. Identify risks from market_info: statistics over the daily bars, or a precomputed change_percent
+        indicator_stats = self._indicator_stats(market_info, ticker_to_analyze) if market_info else None
+        if indicator_stats:
+            for flag in indicator_stats.get('risk_flags', []):
+                identified_risks.append({
+                    "source_type": "market_data",
+                    "description": f"{INDICATOR_RISK_DESCRIPTIONS.get(flag, flag)} for {ticker_to_analyze}.",
+                    "evidence": f"Symbol: {ticker_to_analyze}, {flag} as of {indicator_stats.get('as_of')}: " + ", ".join(
+                        f"{key}={indicator_stats[key]}" for key in
+                        ("return_1d", "volatility_annualized", "drawdown_current", "gap_zscore", "volume_zscore", "beta")
+                        if indicator_stats.get(key) is not None),
+                    "keywords_found": [flag]
+                })
+        elif market_info and 'change_percent' in market_info:
             try:
                 change_str = market_info['change_percent'].replace('%', '')
                 percent_change = float(change_str)
@@ -153,8 +540,23 @@ class AnalysisAgent:
                 print(f"Could not parse percent_change: {market_info['change_percent']}")
 
 
-        # 3. Find earnings surprises
-        earnings_analysis_results = self.find_earnings_surprises(all_texts, ticker_to_analyze)
+        # 2b. Portfolio-level risk: VaR and the names driving it
+        if portfolio_risk and portfolio_risk.get('parametric_var') is not None:
+            top_contributors = [p for p in portfolio_risk.get('positions', [])[:3] if p.get('risk_contribution_pct') is not None]
+            identified_risks.append({
+                "source_type": "portfolio_risk",
+                "description": (f"{portfolio_risk.get('horizon_days', 1)}-day {portfolio_risk.get('confidence', 0.95):.0%} VaR of "
+                                f"{portfolio_risk['parametric_var']:.2%} (parametric) / "
+                                + (f"{portfolio_risk['historical_var']:.2%}" if portfolio_risk.get('historical_var') is not None else "n/a")
+                                + " (historical) of portfolio value."),
+                "evidence": "Largest risk contributors: " + (", ".join(
+                    f"{p['symbol']} ({p['risk_contribution_pct']:.1f}%)" for p in top_contributors) or "n/a"),
+                "keywords_found": ["risk"]
+            })
+
+        # 3. Find earnings surprises, reusing the scan above
+        earnings_analysis_results = self.find_earnings_surprises(all_texts, ticker_to_analyze, facts_by_text=facts_by_text,
+                                                                news_count=len(news_articles))
 
         # Deduplicate risks based on evidence snippet to avoid too much redundancy
         unique_risks = []
@@ -170,6 +572,8 @@ class AnalysisAgent:
             "ticker_analyzed": ticker_to_analyze,
             "identified_risks": unique_risks,
             "earnings_analysis": earnings_analysis_results,
+            "market_indicators": indicator_stats,
+            "portfolio_risk": portfolio_risk,
             "summary": analysis_summary,
             "raw_data_refs": {
                 "news_count": len(news_articles),
@@ -178,36 +582,104 @@ class AnalysisAgent:
             }
         }
 
-    def find_earnings_surprises(self, text_snippets: list[str], company_ticker: str) -> dict:
+    def _local_earnings_sentiment(self, text_snippets: list[str]) -> dict | None:
+        """EarningsSentimentClassifier verdict, or None if the classifier is unavailable or fails."""
+        if not self.sentiment_classifier:
+            return None
+        try:
+            return self.sentiment_classifier.classify(text_snippets)
+        except Exception as e:
+            # e.g. the model can't be downloaded; stop trying and use the LLM from now on
+            print(f"AnalysisAgent: Local earnings classifier failed, disabling it: {e}")
+            self.sentiment_classifier = None
+            return None
+
+    def _llm_earnings_summary(self, text_snippets: list[str], company_ticker: str) -> str | None:
+        """
+        One-line LLM earnings sentiment for `text_snippets`, or None if the Language Service fails.
+        Results are cached on disk by ticker and normalised snippet set, so recurring chunks skip the LLM.
+        """
+        # Whitespace-normalised, de-duplicated snippets; the key ignores their order
+        snippets = list(dict.fromkeys(" ".join(snippet.split()) for snippet in text_snippets if snippet and snippet.strip()))
+        cache_key = content_key(LLM_SENTIMENT_PROMPT_VERSION, (company_ticker or "").upper(), sorted(snippets))
+        if self.llm_cache:
+            cached = self.llm_cache.get(cache_key)
+            if cached:
+                print(f"AnalysisAgent: Using cached LLM earnings analysis for {company_ticker}.")
+                return cached["summary"]
+
+        # Combine snippets for LLM, ensuring not too long. Max ~3000 words for safety.
+        # A more robust solution would handle token limits more gracefully.
+        combined_text = "\n\n---\n\n".join(snippets)
+        max_words = 3000 
+        word_list = combined_text.split()
+        if len(word_list) > max_words:
+            print(f"AnalysisAgent: Combined text too long ({len(word_list)} words), truncating for LLM.")
+            combined_text = " ".join(word_list[:max_words])
+
+        llm_prompt = (
+            f"Analyze the following text snippets concerning company {company_ticker} and its recent earnings. "
+            f"Determine the overall earnings sentiment or trend. Focus on whether the information suggests "
+            f"positive, negative, or neutral earnings performance, or specific surprises like beating/missing estimates. "
+            f"If specific surprise language isn't present, describe the general trend (e.g., 'revenue growth', 'profit decline').\n\n"
+            f"Respond with a short summary (1-2 sentences) of the earnings sentiment/trend. For example: \n"
+            f"- '{company_ticker} reported strong earnings, beating estimates due to X.'\n"
+            f"- 'Earnings for {company_ticker} were weak, missing expectations and showing a decline in Y.'\n"
+            f"- '{company_ticker} showed revenue growth but declining profits, a mixed signal.'\n"
+            f"- 'Neutral earnings for {company_ticker}, in line with expectations.'\n"
+            f"- 'The text indicates positive earnings trends for {company_ticker} with revenue up.'\n"
+            f"- 'The text suggests negative earnings trends for {company_ticker} with margins shrinking.'\n"
+            f"- 'No clear earnings trend or surprise identified for {company_ticker} from the text.'\n\n"
+            f"Text Snippets:\n---\n{combined_text}\n---\n"
+            f"Your concise summary of earnings sentiment/trend for {company_ticker}:"
+        )
+        
+        llm_response_data = self._call_language_service(llm_prompt)
+        if not (llm_response_data and llm_response_data.get("response")):
+            return None # Failures (an error status from the Language Service) are not cached
+        llm_summary = llm_response_data["response"].strip()
+        if self.llm_cache:
+            self.llm_cache.set(cache_key, {"summary": llm_summary})
+        return llm_summary
+
+    def find_earnings_surprises(self, text_snippets: list[str], company_ticker: str,
+                                facts_by_text: list[DocumentFacts] | None = None, news_count: int | None = None) -> dict:
+        """
+        Args:
+            facts_by_text: _document_facts() for each of `text_snippets`, if already computed.
+            news_count: When `text_snippets` is news_articles + company_filings, the number of news articles,
+                        so each surprise's "source" names its document like the risk entries do
+                        ({"type": "news"/"filing", "index"}). Otherwise sources are {"type": "text", "index"}.
+        """
         print(f"AnalysisAgent attempting to find earnings surprises for {company_ticker} in {len(text_snippets)} snippets.")
         
         surprises = []
-        positive_mentions = 0
-        negative_mentions = 0
-        neutral_mentions = 0
-
-        for snippet_text in text_snippets:
-            positive_found_keywords = [kw for kw in EARNINGS_POSITIVE_KEYWORDS if re.search(r'(?:^|\W)' + re.escape(kw.lower()) + r'(?:$|\W)', snippet_text.lower())]
-            if positive_found_keywords:
-                extracted_snips = self._extract_relevant_snippets(snippet_text, positive_found_keywords)
-                for es in extracted_snips:
-                    surprises.append({"type": "positive", "evidence": es, "keywords": positive_found_keywords})
-                positive_mentions += len(extracted_snips)
-
-            negative_found_keywords = [kw for kw in EARNINGS_NEGATIVE_KEYWORDS if re.search(r'(?:^|\W)' + re.escape(kw.lower()) + r'(?:$|\W)', snippet_text.lower())]
-            if negative_found_keywords:
-                extracted_snips = self._extract_relevant_snippets(snippet_text, negative_found_keywords)
-                for es in extracted_snips:
-                    surprises.append({"type": "negative", "evidence": es, "keywords": negative_found_keywords})
-                negative_mentions += len(extracted_snips)
-            
-            if not positive_found_keywords and not negative_found_keywords: # Only check neutral if no pos/neg explicit keywords found in this snippet
-                neutral_found_keywords = [kw for kw in EARNINGS_NEUTRAL_KEYWORDS if re.search(r'(?:^|\W)' + re.escape(kw.lower()) + r'(?:$|\W)', snippet_text.lower())]
-                if neutral_found_keywords:
-                    extracted_snips = self._extract_relevant_snippets(snippet_text, neutral_found_keywords)
-                    for es in extracted_snips:
-                        surprises.append({"type": "neutral", "evidence": es, "keywords": neutral_found_keywords})
-                    neutral_mentions += len(extracted_snips)
+        mentions = {"positive": 0, "negative": 0, "neutral": 0}
+
+        if facts_by_text is None:
+            facts_by_text = [self._document_facts(snippet_text) for snippet_text in text_snippets]
+
+        figures = [] # (figure, its dict) for every number read from the texts
+        for text_index, (snippet_text, facts) in enumerate(zip(text_snippets, facts_by_text)):
+            source = self._source_ref(text_index, news_count) if news_count is not None else {"type": "text", "index": text_index}
+            for surprise_type, spans in facts.earnings_spans.items():
+                for span in spans:
+                    surprises.append({"type": surprise_type, **span.to_dict(snippet_text, source), "keywords": span.keywords})
+                mentions[surprise_type] += len(spans)
+            for figure in facts.figures:
+                figure_dict = figure.to_dict(snippet_text, source)
+                figures.append((figure, figure_dict))
+                # Reported vs expected numbers and guidance changes are surprises in their own right,
+                # unless a keyword match of the same type already covers the phrase. As with keywords,
+                # neutral figures don't count in a document with positive or negative statements.
+                already_matched = any(m.start < figure.end and figure.start < m.end
+                                      for span in facts.earnings_spans.get(figure.direction, []) for m in span.matches)
+                outweighed = figure.direction == "neutral" and (facts.earnings_spans["positive"] or facts.earnings_spans["negative"])
+                if figure.kind in ("vs_estimate", "guidance") and figure.direction and not already_matched and not outweighed:
+                    surprises.append({"type": figure.direction, "evidence": figure_dict["evidence"], "span": figure_dict["span"],
+                                      "source": figure_dict["source"], "keywords": [figure.metric], "figure": figure_dict})
+                    mentions[figure.direction] += 1
+        positive_mentions, negative_mentions, neutral_mentions = mentions["positive"], mentions["negative"], mentions["neutral"]
         
         unique_surprises = []
         seen_surprise_evidence = set()
@@ -216,82 +688,157 @@ class AnalysisAgent:
                 unique_surprises.append(surprise)
                 seen_surprise_evidence.add(surprise["evidence"])
 
+        trend_figures = [figure for figure, _ in figures if figure.kind in ("change", "vs_prior_period") and figure.direction]
+        surprise_figures = [figure for figure, _ in figures if figure.kind in ("vs_estimate", "guidance") and figure.direction]
+        keyword_mentions = sum(len(spans) for facts in facts_by_text for spans in facts.earnings_spans.values())
+        basis = " and ".join(name for name, present in (("explicit keywords", keyword_mentions), ("reported figures", surprise_figures)) if present)
+        figure_note = (" Figures: " + "; ".join(figure.describe() for figure in surprise_figures[:5]) + ".") if surprise_figures else ""
+
         confidence = "low"
+        signal = "none" # positive / negative / neutral / llm / none, for roll-ups across tickers
         summary_status = "No clear earnings surprise signal found by keyword matching." 
 
         if positive_mentions > 0 and positive_mentions > negative_mentions:
             confidence = "medium" if positive_mentions < 3 else "high"
-            summary_status = "Potential positive earnings surprise detected based on explicit keywords."
+            signal = "positive"
+            summary_status = f"Potential positive earnings surprise detected based on {basis}.{figure_note}"
         elif negative_mentions > 0 and negative_mentions > positive_mentions:
             confidence = "medium" if negative_mentions < 3 else "high"
-            summary_status = "Potential negative earnings surprise detected based on explicit keywords."
+            signal = "negative"
+            summary_status = f"Potential negative earnings surprise detected based on {basis}.{figure_note}"
         elif neutral_mentions > 0 and positive_mentions == 0 and negative_mentions == 0:
             confidence = "low"
-            summary_status = "Neutral earnings-related statements detected (e.g., guidance reaffirmed) by explicit keywords."
+            signal = "neutral"
+            summary_status = f"Neutral earnings-related statements detected (e.g., guidance reaffirmed) by {basis}.{figure_note}"
+        elif positive_mentions == 0 and negative_mentions == 0 and trend_figures:
+            # No surprise language, but the reported numbers show the trend
+            directions = [figure.direction for figure in trend_figures]
+            ups, downs = directions.count("positive"), directions.count("negative")
+            signal = "positive" if ups > downs else "negative" if downs > ups else "neutral"
+            confidence = "medium"
+            summary_status = (f"Reported figures indicate a {'mixed' if signal == 'neutral' else signal} earnings trend: "
+                              + "; ".join(figure.describe() for figure in trend_figures[:5]) + ".")
         elif positive_mentions == 0 and negative_mentions == 0: # If no explicit positive or negative surprises, try LLM
-            print(f"AnalysisAgent: No explicit surprise keywords for {company_ticker}. Attempting LLM analysis.")
-            # Combine snippets for LLM, ensuring not too long. Max ~3000 words for safety.
-            # A more robust solution would handle token limits more gracefully.
-            combined_text = "\n\n---\n\n".join(text_snippets)
-            max_words = 3000 
-            word_list = combined_text.split()
-            if len(word_list) > max_words:
-                print(f"AnalysisAgent: Combined text too long ({len(word_list)} words), truncating for LLM.")
-                combined_text = " ".join(word_list[:max_words])
-
-            llm_prompt = (
-                f"Analyze the following text snippets concerning company {company_ticker} and its recent earnings. "
-                f"Determine the overall earnings sentiment or trend. Focus on whether the information suggests "
-                f"positive, negative, or neutral earnings performance, or specific surprises like beating/missing estimates. "
-                f"If specific surprise language isn't present, describe the general trend (e.g., 'revenue growth', 'profit decline').\n\n"
-                f"Respond with a short summary (1-2 sentences) of the earnings sentiment/trend. For example: \n"
-                f"- '{company_ticker} reported strong earnings, beating estimates due to X.'\n"
-                f"- 'Earnings for {company_ticker} were weak, missing expectations and showing a decline in Y.'\n"
-                f"- '{company_ticker} showed revenue growth but declining profits, a mixed signal.'\n"
-                f"- 'Neutral earnings for {company_ticker}, in line with expectations.'\n"
-                f"- 'The text indicates positive earnings trends for {company_ticker} with revenue up.'\n"
-                f"- 'The text suggests negative earnings trends for {company_ticker} with margins shrinking.'\n"
-                f"- 'No clear earnings trend or surprise identified for {company_ticker} from the text.'\n\n"
-                f"Text Snippets:\n---\n{combined_text}\n---\n"
-                f"Your concise summary of earnings sentiment/trend for {company_ticker}:"
-            )
-            
-            llm_response_data = self._call_language_service(llm_prompt)
-            
-            if llm_response_data and llm_response_data.get("response"):
-                llm_summary = llm_response_data["response"].strip()
-                summary_status = f"LLM analysis: {llm_summary}"
-                # Attempt to infer confidence from LLM response (simple version)
-                if "strong" in llm_summary.lower() or "beat estimates" in llm_summary.lower() or "exceeded" in llm_summary.lower():
-                    confidence = "medium" # Could be high if LLM is very explicit
-                elif "weak" in llm_summary.lower() or "missed estimates" in llm_summary.lower() or "decline" in llm_summary.lower():
-                    confidence = "medium"
-                elif "neutral" in llm_summary.lower() or "in line" in llm_summary.lower():
-                    confidence = "low"
-                else: # General trend
-                    confidence = "low" 
-                print(f"AnalysisAgent: LLM analysis for {company_ticker} complete. Status: {summary_status}, Confidence: {confidence}")
+            local = self._local_earnings_sentiment(text_snippets)
+            if local and local["confident"]:
+                signal = local["label"]
+                confidence = "medium" if local["margin"] >= 2 * self.sentiment_classifier.min_margin else "low"
+                summary_status = (f"Local classifier: {local['label']} earnings sentiment for {company_ticker} "
+                                  f"across {local['sentences_scored']} earnings-related sentence(s). Strongest evidence: \"{local['evidence']}\"")
+                print(f"AnalysisAgent: Local earnings classification for {company_ticker}: {signal} (margin {local['margin']}).")
             else:
-                summary_status = "LLM analysis for earnings failed or returned no response. Falling back to basic check."
-                # Fallback to the previous general term check if LLM fails
-                general_earnings_terms_actually_present = False
-                for snippet_text_original in text_snippets: 
-                    text_lower = snippet_text_original.lower()
-                    if any(term in text_lower for term in EARNINGS_GENERAL_TERMS):
-                        general_earnings_terms_actually_present = True
-                        break
-                if general_earnings_terms_actually_present:
-                    summary_status = "Earnings-related information was present, but no explicit surprise statements or clear directional verb indicators were detected by keyword matching (LLM call failed)."
+                print(f"AnalysisAgent: No explicit surprise keywords for {company_ticker}. Attempting LLM analysis.")
+                llm_summary = self._llm_earnings_summary(text_snippets, company_ticker)
+                if llm_summary:
+                    summary_status = f"LLM analysis: {llm_summary}"
+                    signal = "llm"
+                    # Attempt to infer confidence from LLM response (simple version)
+                    if "strong" in llm_summary.lower() or "beat estimates" in llm_summary.lower() or "exceeded" in llm_summary.lower():
+                        confidence = "medium" # Could be high if LLM is very explicit
+                    elif "weak" in llm_summary.lower() or "missed estimates" in llm_summary.lower() or "decline" in llm_summary.lower():
+                        confidence = "medium"
+                    elif "neutral" in llm_summary.lower() or "in line" in llm_summary.lower():
+                        confidence = "low"
+                    else: # General trend
+                        confidence = "low" 
+                    print(f"AnalysisAgent: LLM analysis for {company_ticker} complete. Status: {summary_status}, Confidence: {confidence}")
                 else:
-                    summary_status = "No specific earnings-related statements (including surprises or general terms) were detected by keyword matching (LLM call failed)."
+                    summary_status = "LLM analysis for earnings failed or returned no response. Falling back to basic check."
+                    # Fallback to the previous general term check if LLM fails
+                    general_earnings_terms_actually_present = False
+                    for snippet_text_original in text_snippets: 
+                        text_lower = snippet_text_original.lower()
+                        if any(term in text_lower for term in EARNINGS_GENERAL_TERMS):
+                            general_earnings_terms_actually_present = True
+                            break
+                    if general_earnings_terms_actually_present:
+                        summary_status = "Earnings-related information was present, but no explicit surprise statements or clear directional verb indicators were detected by keyword matching (LLM call failed)."
+                    else:
+                        summary_status = "No specific earnings-related statements (including surprises or general terms) were detected by keyword matching (LLM call failed)."
         
         return {
             "ticker": company_ticker,
             "potential_surprises": unique_surprises, # Still based on explicit keywords
             "confidence": confidence,
-            "summary_status": summary_status
+            "signal": signal,
+            "summary_status": summary_status,
+            "figures": [figure_dict for _, figure_dict in figures]
         }
 
+
+# --- Batch analysis ------------------------------------------------------------------------
+# Helpers for running analyze_market_data over many tickers in a process pool. Each worker
+# process builds its own AnalysisAgent once, in init_batch_worker.
+
+_batch_worker_agent = None
+
+def init_batch_worker():
+    """ProcessPoolExecutor initializer: one AnalysisAgent per worker process."""
+    global _batch_worker_agent
+    _batch_worker_agent = AnalysisAgent()
+
+
+def analyze_bundle(bundle: dict, agent: AnalysisAgent | None = None) -> dict:
+    """
+    Runs analyze_market_data for one ticker bundle (the fields of an /analysis/market_data request)
+    on `agent`, or on this worker process's agent when called in a batch worker.
+    Errors are returned as {"ticker_analyzed", "error"} so one bad bundle doesn't fail the batch.
+    """
+    global _batch_worker_agent
+    if agent is None:
+        if _batch_worker_agent is None:
+            _batch_worker_agent = AnalysisAgent()
+        agent = _batch_worker_agent
+    ticker = bundle.get('company_ticker') or (bundle.get('market_info') or {}).get('symbol') or 'N/A'
+    try:
+        return agent.analyze_market_data(
+            market_info=bundle.get('market_info'),
+            news_articles=bundle.get('news_articles') or [],
+            company_filings=bundle.get('company_filings') or [],
+            company_ticker=bundle.get('company_ticker'),
+            portfolio_risk=bundle.get('portfolio_risk')
+        )
+    except Exception as e:
+        print(f"AnalysisAgent: Batch analysis failed for {ticker}: {e}")
+        return {"ticker_analyzed": ticker, "error": str(e)}
+
+
+def summarize_analysis_batch(results: list[dict], top_n: int = 10) -> dict:
+    """
+    Cross-portfolio roll-up of analyze_market_data results.
+
+    Returns:
+        dict: Counts of risk keywords and market-data risk flags (with the tickers raising each flag),
+              earnings signal tallies, the tickers with the most identified risks, and failed tickers.
+    """
+    analyzed = [r for r in results if not r.get('error')]
+    keyword_counts = {}
+    tickers_by_flag = {}
+    earnings_signals = {}
+    for result in analyzed:
+        ticker = result.get('ticker_analyzed')
+        for risk in result.get('identified_risks', []):
+            if risk.get('source_type') == 'market_data':
+                for flag in risk.get('keywords_found', []):
+                    tickers_by_flag.setdefault(flag, []).append(ticker)
+            elif risk.get('source_type') == 'text_analysis':
+                for keyword in risk.get('keywords_found', []):
+                    keyword_counts[keyword] = keyword_counts.get(keyword, 0) + 1
+        signal = (result.get('earnings_analysis') or {}).get('signal', 'none')
+        earnings_signals.setdefault(signal, []).append(ticker)
+
+    most_risks = sorted(analyzed, key=lambda r: len(r.get('identified_risks', [])), reverse=True)[:top_n]
+    return {
+        "tickers_analyzed": len(analyzed),
+        "tickers_failed": [{"ticker": r.get('ticker_analyzed'), "error": r['error']} for r in results if r.get('error')],
+        "total_risks": sum(len(r.get('identified_risks', [])) for r in analyzed),
+        "risk_keyword_counts": dict(sorted(keyword_counts.items(), key=lambda item: item[1], reverse=True)),
+        "market_risk_flags": {flag: {"count": len(tickers), "tickers": tickers} for flag, tickers in tickers_by_flag.items()},
+        "earnings_signals": {signal: {"count": len(tickers), "tickers": tickers} for signal, tickers in earnings_signals.items()},
+        "most_risks": [{"ticker": r.get('ticker_analyzed'), "risk_count": len(r.get('identified_risks', []))}
+                       for r in most_risks if r.get('identified_risks')],
+    }
+
 if __name__ == '__main__':
     # Ensure .env is loaded for direct testing if LANGUAGE_SERVICE_URL is needed
     dotenv_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env')
@@ -1,25 +1,236 @@
 import os
+import sys
+import time
+from datetime import date
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from alpha_vantage.timeseries import TimeSeries
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Allow `from agents...` imports when this file is run directly
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from agents.market_data_store import (
+    MarketDataStore, bars_from_alpha_vantage, bars_to_alpha_vantage, bars_to_columnar, slice_bars
+)
+from agents.alpha_vantage_scheduler import (
+    AlphaVantageScheduler, AlphaVantageQuotaExceeded, PRIORITY_INTERACTIVE, PRIORITY_PREFETCH
+)
+
 ALPHA_VANTAGE_API_KEY = os.getenv("ALPHA_VANTAGE_API_KEY")
 
 if not ALPHA_VANTAGE_API_KEY:
     raise ValueError("ALPHA_VANTAGE_API_KEY not found in environment variables. Please set it in your .env file.")
 
-def get_daily_stock_data(symbol: str):
+# 'compact' returns the latest 100 trading days. 'full' (20+ years) needs a premium plan for
+# TIME_SERIES_DAILY, so it is only used when explicitly configured.
+ALPHA_VANTAGE_COMPACT_DAYS = 100
+ALPHA_VANTAGE_BACKFILL_OUTPUTSIZE = os.getenv("ALPHA_VANTAGE_BACKFILL_OUTPUTSIZE", "compact")
+# How long an interactive request waits for a queued Alpha Vantage call before falling back to stored data
+ALPHA_VANTAGE_MAX_WAIT_SECONDS = float(os.getenv("ALPHA_VANTAGE_MAX_WAIT_SECONDS", 20))
+# Serve the last stored bars (flagged as stale) when the quota is exhausted instead of failing
+ALPHA_VANTAGE_SERVE_STALE = os.getenv("ALPHA_VANTAGE_SERVE_STALE", "true").lower() in ("1", "true", "yes")
+
+_time_series = TimeSeries(key=ALPHA_VANTAGE_API_KEY, output_format='json')
+market_data_store = MarketDataStore()
+alpha_vantage_scheduler = AlphaVantageScheduler()
+
+def _store_meta_data(symbol: str, bars: dict) -> dict:
+    """Alpha Vantage-style meta data for a response served from the local store."""
+    return {
+        "1. Information": "Daily Prices (open, high, low, close) and Volumes",
+        "2. Symbol": symbol,
+        "3. Last Refreshed": str(bars["dates"][-1]),
+        "4. Output Size": "Compact",
+        "5. Time Zone": "US/Eastern"
+    }
+
+def refresh_daily_bars(symbol: str) -> tuple[dict, dict]:
     """
-    Fetches daily time series data for a given stock symbol from Alpha Vantage.
+    Fetches the trailing days missing from the local store and merges them in.
+    Alpha Vantage can't serve an arbitrary date range, so the smallest response ('compact',
+    100 days) is requested and only bars newer than the stored ones are appended.
+    Returns (bars, meta_data). Raises on provider errors.
     """
-    ts = TimeSeries(key=ALPHA_VANTAGE_API_KEY, output_format='json')
+    missing_days = market_data_store.missing_trading_days(symbol)
+    outputsize = "compact"
+    if missing_days is None or missing_days >= ALPHA_VANTAGE_COMPACT_DAYS:
+        outputsize = ALPHA_VANTAGE_BACKFILL_OUTPUTSIZE
+    print(f"Refreshing daily bars for {symbol} from Alpha Vantage (outputsize={outputsize}, missing days: {missing_days})...")
+    data, meta_data = _time_series.get_daily(symbol=symbol, outputsize=outputsize)
+    bars, added = market_data_store.merge(symbol, bars_from_alpha_vantage(data))
+    print(f"Stored {added} new daily bar(s) for {symbol}; {len(bars['dates'])} in total.")
+    return bars, meta_data
+
+def _submit_refresh(symbol: str, priority: int = PRIORITY_INTERACTIVE):
+    return alpha_vantage_scheduler.submit(symbol, lambda: refresh_daily_bars(symbol), priority=priority)
+
+def _await_refresh(symbol: str, future, allow_stale: bool, max_wait: float | None) -> tuple[dict | None, dict | None, bool]:
     try:
-        data, meta_data = ts.get_daily(symbol=symbol, outputsize='compact')
-        return data, meta_data
+        bars, meta_data = future.result(timeout=max_wait)
+        return bars, meta_data, False
+    except (AlphaVantageQuotaExceeded, FutureTimeoutError) as e:
+        # A timed-out refresh stays queued and still updates the store when it runs
+        if isinstance(e, AlphaVantageQuotaExceeded):
+            error = e
+        else:
+            error = AlphaVantageQuotaExceeded(f"Timed out waiting for an Alpha Vantage call slot for {symbol}.",
+                                              retry_after=alpha_vantage_scheduler.retry_after())
+        stored = market_data_store.load(symbol)
+        if allow_stale and stored is not None and len(stored["dates"]) > 0:
+            print(f"Alpha Vantage quota unavailable for {symbol} ({error}); serving stored bars up to {stored['dates'][-1]}.")
+            return stored, _store_meta_data(symbol, stored), True
+        raise error from e
     except Exception as e:
         print(f"Error fetching data for {symbol} from Alpha Vantage: {e}")
+        return None, None, False
+
+def _resolve_daily_bars(symbol: str, priority: int = PRIORITY_INTERACTIVE, allow_stale: bool = ALPHA_VANTAGE_SERVE_STALE,
+                        max_wait: float | None = ALPHA_VANTAGE_MAX_WAIT_SECONDS) -> tuple[dict | None, dict | None, bool]:
+    """
+    Returns (bars, meta_data, stale) for a symbol. Fresh stored bars are served directly; otherwise
+    a refresh is queued on the Alpha Vantage scheduler (coalesced with any in-flight refresh of the
+    same symbol) and awaited for up to `max_wait` seconds.
+    If the quota is exhausted or the wait times out, the stored bars are returned with stale=True when
+    `allow_stale` is set; otherwise AlphaVantageQuotaExceeded is raised. Other provider errors
+    (e.g. an unknown symbol) return (None, None, False).
+    """
+    symbol = symbol.upper()
+    if market_data_store.is_fresh(symbol):
+        bars = market_data_store.load(symbol)
+        return bars, _store_meta_data(symbol, bars), False
+    return _await_refresh(symbol, _submit_refresh(symbol, priority), allow_stale, max_wait)
+
+def get_daily_bars(symbol: str, priority: int = PRIORITY_INTERACTIVE, allow_stale: bool = ALPHA_VANTAGE_SERVE_STALE) -> dict | None:
+    """
+    Returns the columnar daily bars for a symbol from the local store,
+    refreshing it first (through the scheduler) if the latest trading day is missing.
+    Raises AlphaVantageQuotaExceeded if the quota is exhausted and no stored bars can be served.
+    """
+    bars, _, _ = _resolve_daily_bars(symbol, priority=priority, allow_stale=allow_stale)
+    return bars
+
+def _log_prefetch_result(symbol: str, future):
+    error = future.exception()
+    if error:
+        print(f"Prefetch of daily bars for {symbol} failed: {error}")
+
+def prefetch_daily_bars(symbols: list[str]) -> int:
+    """
+    Queues background refreshes for symbols whose stored bars are out of date, at prefetch priority,
+    so they only use quota left over by interactive requests. Returns the number of symbols queued.
+    """
+    queued = 0
+    for symbol in {s.upper() for s in symbols}:
+        if not market_data_store.is_fresh(symbol):
+            future = _submit_refresh(symbol, priority=PRIORITY_PREFETCH)
+            future.add_done_callback(lambda f, symbol=symbol: _log_prefetch_result(symbol, f))
+            queued += 1
+    return queued
+
+def get_daily_bars_range(symbol: str, start: date | None = None, end: date | None = None,
+                         allow_stale: bool = ALPHA_VANTAGE_SERVE_STALE) -> tuple[dict | None, bool]:
+    """
+    Columnar daily bars for start <= date <= end (inclusive). Without a range, the last 100 days,
+    matching get_daily_stock_data. Only stored history is returned; the store holds Alpha Vantage's
+    'compact' window unless ALPHA_VANTAGE_BACKFILL_OUTPUTSIZE is 'full'.
+    Returns (bars or None if the symbol has no data, stale). Raises AlphaVantageQuotaExceeded like get_daily_bars.
+    """
+    bars, _, stale = _resolve_daily_bars(symbol, allow_stale=allow_stale)
+    if bars is None:
+        return None, False
+    limit = None if (start or end) else ALPHA_VANTAGE_COMPACT_DAYS
+    return slice_bars(bars, start, end, limit), stale
+
+def get_daily_stock_data(symbol: str, allow_stale: bool = ALPHA_VANTAGE_SERVE_STALE):
+    """
+    Fetches daily time series data for a given stock symbol.
+    Served from the local market data store when the latest trading day is already present;
+    otherwise only the missing days are fetched from Alpha Vantage, through the quota-aware scheduler.
+    Returns the last 100 days in Alpha Vantage's JSON shape, plus meta data ("6. Stale" is set when
+    stored bars were served because the quota was exhausted), or (None, None) if the symbol has no data.
+    Raises AlphaVantageQuotaExceeded if the quota is exhausted and there is nothing stored to serve.
+    """
+    bars, meta_data, stale = _resolve_daily_bars(symbol, allow_stale=allow_stale)
+    if bars is None:
         return None, None
+    if stale:
+        meta_data = {**meta_data, "6. Stale": "true"}
+    return bars_to_alpha_vantage(bars, limit=ALPHA_VANTAGE_COMPACT_DAYS), meta_data
+
+def _resolve_daily_bars_batch(symbols: list[str], allow_stale: bool) -> dict:
+    """
+    Resolves many symbols at once. Symbols already fresh in the local store are served from it;
+    refreshes for the rest are queued on the scheduler together, so they run concurrently within
+    the Alpha Vantage rate limits, and share one ALPHA_VANTAGE_MAX_WAIT_SECONDS deadline.
+    Returns {symbol: (bars, meta_data, stale) or AlphaVantageQuotaExceeded} in request order.
+    """
+    unique_symbols = list(dict.fromkeys(s.strip().upper() for s in symbols if s and s.strip()))
+    resolved = {}
+    pending = {}
+    for symbol in unique_symbols:
+        if market_data_store.is_fresh(symbol):
+            bars = market_data_store.load(symbol)
+            resolved[symbol] = (bars, _store_meta_data(symbol, bars), False)
+        else:
+            pending[symbol] = _submit_refresh(symbol)
+    print(f"Batch daily data: {len(resolved)} of {len(unique_symbols)} symbols served from the local store, {len(pending)} queued for refresh.")
+
+    deadline = time.monotonic() + ALPHA_VANTAGE_MAX_WAIT_SECONDS
+    for symbol, future in pending.items():
+        try:
+            resolved[symbol] = _await_refresh(symbol, future, allow_stale, max(0.0, deadline - time.monotonic()))
+        except AlphaVantageQuotaExceeded as e:
+            resolved[symbol] = e
+    return {symbol: resolved[symbol] for symbol in unique_symbols}
+
+def _batch_error(symbol: str, outcome) -> dict | None:
+    """{"symbol", "error", "status_code"} for a failed batch outcome (404 no data, 429 quota), else None."""
+    if isinstance(outcome, AlphaVantageQuotaExceeded):
+        return {"symbol": symbol, "error": str(outcome), "status_code": 429}
+    if outcome[0] is None:
+        return {"symbol": symbol, "error": f"Data not found for symbol {symbol}", "status_code": 404}
+    return None
+
+def get_daily_stock_data_batch(symbols: list[str], allow_stale: bool = ALPHA_VANTAGE_SERVE_STALE,
+                               start: date | None = None, end: date | None = None, columnar: bool = False) -> list[dict]:
+    """
+    Daily data for many symbols in one call (see _resolve_daily_bars_batch).
+    Returns one entry per unique symbol, in request order: {"symbol", "data", "stale"} on success,
+    or {"symbol", "error", "status_code"} (404 for no data, 429 for an exhausted quota).
+    `data` is Alpha Vantage-shaped, or parallel arrays (bars_to_columnar) if `columnar` is set;
+    it covers start..end, or the last 100 days without a range.
+    """
+    limit = None if (start or end) else ALPHA_VANTAGE_COMPACT_DAYS
+    results = []
+    for symbol, outcome in _resolve_daily_bars_batch(symbols, allow_stale).items():
+        error = _batch_error(symbol, outcome)
+        if error:
+            results.append(error)
+            continue
+        bars, _, stale = outcome
+        bars = slice_bars(bars, start, end, limit)
+        data = bars_to_columnar(bars) if columnar else bars_to_alpha_vantage(bars)
+        results.append({"symbol": symbol, "data": data, "stale": stale})
+    return results
+
+def get_daily_bars_batch(symbols: list[str], allow_stale: bool = ALPHA_VANTAGE_SERVE_STALE) -> tuple[dict, list[dict]]:
+    """
+    Columnar daily bars for many symbols in one call, for vectorised computations.
+    Returns ({symbol: bars}, errors) where errors are {"symbol", "error", "status_code"} entries.
+    """
+    bars_by_symbol = {}
+    errors = []
+    for symbol, outcome in _resolve_daily_bars_batch(symbols, allow_stale).items():
+        error = _batch_error(symbol, outcome)
+        if error:
+            errors.append(error)
+        else:
+            bars_by_symbol[symbol] = outcome[0]
+    return bars_by_symbol, errors
 
 if __name__ == '__main__':
     # Example usage:
@@ -39,4 +250,3 @@ if __name__ == '__main__':
                 break
     else:
         print(f"Failed to fetch data for {sample_symbol}")
-
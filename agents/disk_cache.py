@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_accessed_at ON entries (accessed_at);
+"""
+
+
+def content_key(*parts) -> str:
+    """SHA-256 hex digest of `parts` (strings or JSON-serialisable values), for content-addressed keys."""
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, str) else json.dumps(part, sort_keys=True, separators=(',', ':'))
+        digest.update(data.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory LRU map with hit/miss counters, for per-process caches of derived data.
+    With `ttl_seconds`, entries also expire that long after they were set.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float | None = None):
+        self.max_entries = max(0, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # key -> (set_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+class DiskCache:
+    """
+    Small persistent key/value cache of JSON values in SQLite.
+
+    Entries expire `ttl_seconds` after they were written. When more than `max_entries` are stored,
+    the least recently read ones are evicted. Several processes may share one database file
+    (WAL mode); within a process, one connection is shared across threads behind a lock.
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: float, max_entries: int, name: str = "DiskCache"):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=10)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    def get(self, key: str):
+        """Returns the cached value for `key`, or None if it is missing or expired."""
+        now = time.time()
+        try:
+            with self._lock, self._conn:
+                row = self._conn.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+                if row and now - row[1] <= self.ttl_seconds:
+                    self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+                    self.hits += 1
+                    return json.loads(row[0])
+                if row:
+                    self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.misses += 1
+        except (sqlite3.Error, ValueError) as e:
+            print(f"{self.name}: Cache read failed for {key[:12]}: {e}")
+        return None
+
+    def set(self, key: str, value):
+        now = time.time()
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), now, now))
+                self._evict(now)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            print(f"{self.name}: Cache write failed for {key[:12]}: {e}")
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl_seconds,))
+        self._conn.execute(
+            "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entries")
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
@@ -0,0 +1,179 @@
+import os
+import re
+import sys
+import threading
+
+import numpy as np
+
+# Allow `from agents...` imports when this file is run directly
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from agents.disk_cache import LRUCache, content_key
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+# Same embedding model as the retriever, so it is usually already in the local model cache
+EARNINGS_CLASSIFIER_MODEL = os.getenv("EARNINGS_CLASSIFIER_MODEL", 'all-MiniLM-L6-v2')
+EARNINGS_CLASSIFIER_ENABLED = os.getenv("EARNINGS_CLASSIFIER_ENABLED", "true").lower() in ("1", "true", "yes")
+# Minimum gap between the best and second-best label's mean similarity for a local verdict
+EARNINGS_CLASSIFIER_MIN_MARGIN = float(os.getenv("EARNINGS_CLASSIFIER_MIN_MARGIN", 0.04))
+# Sentences less similar than this to every prototype centroid are ignored as off-topic
+EARNINGS_CLASSIFIER_MIN_RELEVANCE = float(os.getenv("EARNINGS_CLASSIFIER_MIN_RELEVANCE", 0.25))
+EARNINGS_CLASSIFIER_MAX_SENTENCES = 256
+# Per-document sentence similarities, keyed by content hash, so recurring chunks are embedded once
+EARNINGS_CLASSIFIER_CACHE_MAX_ENTRIES = int(os.getenv("EARNINGS_CLASSIFIER_CACHE_MAX_ENTRIES", 4096))
+
+# Labelled prototype sentences; each label's centroid is the normalised mean of their embeddings
+EARNINGS_PROTOTYPES = {
+    "positive": [
+        "The company reported strong quarterly earnings that beat analyst estimates.",
+        "Revenue grew sharply and profit margins expanded compared with last year.",
+        "Net income rose to a record high on robust sales growth.",
+        "Management raised full-year guidance after better-than-expected results.",
+        "Earnings per share exceeded expectations and operating income increased.",
+        "Sales surged and gross margin improved significantly this quarter.",
+    ],
+    "negative": [
+        "The company's quarterly earnings missed analyst estimates.",
+        "Revenue declined and profit margins shrank compared with last year.",
+        "Net income fell sharply and the company reported a loss.",
+        "Management cut full-year guidance after disappointing results.",
+        "Earnings per share fell short of expectations and operating income decreased.",
+        "Sales dropped and gross margin deteriorated this quarter.",
+    ],
+    "neutral": [
+        "Quarterly earnings were in line with analyst expectations.",
+        "Revenue and profit were roughly flat compared with last year.",
+        "The company reaffirmed its full-year guidance.",
+        "Results were mixed, with higher sales offset by lower margins.",
+        "Earnings per share met consensus estimates.",
+        "Management kept its outlook unchanged for the year.",
+    ],
+}
+
+# A sentence is embedded only if it mentions one of these, which keeps the batch small
+_EARNINGS_TERMS_PATTERN = re.compile(
+    r"\b(?:earnings|profits?|revenues?|net income|eps|margins?|operating income|gross profit|sales|turnover|"
+    r"guidance|outlook|estimates?|expectations|results|quarter(?:ly)?)\b", re.IGNORECASE)
+_SENTENCE_SPLIT_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+
+def earnings_sentences(text_snippets: list[str], limit: int = EARNINGS_CLASSIFIER_MAX_SENTENCES) -> list[str]:
+    """Sentences from `text_snippets` that mention an earnings term, in order and without duplicates."""
+    sentences = {}
+    for snippet in text_snippets:
+        for sentence in _SENTENCE_SPLIT_PATTERN.split(snippet or ""):
+            sentence = " ".join(sentence.split())
+            if len(sentence) >= 20 and _EARNINGS_TERMS_PATTERN.search(sentence):
+                sentences[sentence] = None
+                if len(sentences) >= limit:
+                    return list(sentences)
+    return list(sentences)
+
+
+class EarningsSentimentClassifier:
+    """
+    Local positive/negative/neutral earnings sentiment from sentence embeddings.
+
+    Earnings-related sentences are embedded in one batch and scored by cosine similarity against
+    per-label prototype centroids. The verdict is the label with the highest mean similarity over
+    on-topic sentences, and is marked confident only when it leads the runner-up by
+    EARNINGS_CLASSIFIER_MIN_MARGIN. Callers fall back to the LLM otherwise.
+    The model is loaded on first use, and sentence similarities are cached per document.
+    """
+
+    def __init__(self, model_name: str = EARNINGS_CLASSIFIER_MODEL, model=None,
+                 min_margin: float = EARNINGS_CLASSIFIER_MIN_MARGIN, min_relevance: float = EARNINGS_CLASSIFIER_MIN_RELEVANCE):
+        self.model_name = model_name
+        self.min_margin = min_margin
+        self.min_relevance = min_relevance
+        self.labels = list(EARNINGS_PROTOTYPES)
+        self._model = model
+        self._centroids = None # (labels, dim), unit length
+        self._lock = threading.Lock()
+        self.document_cache = LRUCache(EARNINGS_CLASSIFIER_CACHE_MAX_ENTRIES)
+
+    @staticmethod
+    def available() -> bool:
+        return EARNINGS_CLASSIFIER_ENABLED and SentenceTransformer is not None
+
+    def _encode(self, sentences: list[str]) -> np.ndarray:
+        embeddings = np.asarray(self._model.encode(sentences, convert_to_numpy=True, show_progress_bar=False), dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.where(norms > 0, norms, 1.0)
+
+    def _ensure_loaded(self):
+        with self._lock:
+            if self._centroids is not None:
+                return
+            if self._model is None:
+                print(f"EarningsSentimentClassifier: Loading sentence transformer model: {self.model_name}...")
+                self._model = SentenceTransformer(self.model_name)
+            centroids = np.stack([self._encode(EARNINGS_PROTOTYPES[label]).mean(axis=0) for label in self.labels])
+            self._centroids = centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+
+    def classify(self, text_snippets: list[str]) -> dict:
+        """
+        Returns:
+            dict: {"label": positive/negative/neutral, or None (never confident) if no earnings sentences were found,
+                   "confident", "margin", "scores": {label: mean similarity}, "sentences_scored",
+                   "evidence": the sentence most similar to the winning label}.
+        """
+        # Per document: (earnings sentences, their similarities to each centroid)
+        documents = []
+        to_embed = {}
+        for snippet in text_snippets:
+            key = content_key(snippet or "")
+            cached = self.document_cache.get(key)
+            if cached is None and key not in to_embed:
+                to_embed[key] = earnings_sentences([snippet])
+            documents.append((key, cached))
+
+        if any(to_embed.values()):
+            self._ensure_loaded()
+            all_sentences = [sentence for sentences in to_embed.values() for sentence in sentences]
+            all_similarities = self._encode(all_sentences) @ self._centroids.T
+        offset = 0
+        embedded = {}
+        for key, sentences in to_embed.items():
+            similarities = all_similarities[offset:offset + len(sentences)] if sentences else np.empty((0, len(self.labels)), dtype=np.float32)
+            offset += len(sentences)
+            embedded[key] = (sentences, similarities)
+            self.document_cache.set(key, embedded[key])
+
+        # Combine documents, dropping sentences repeated across them
+        seen = set()
+        sentences, rows = [], []
+        for key, cached in documents:
+            doc_sentences, doc_similarities = cached if cached is not None else embedded[key]
+            for sentence, row in zip(doc_sentences, doc_similarities):
+                if sentence not in seen and len(sentences) < EARNINGS_CLASSIFIER_MAX_SENTENCES:
+                    seen.add(sentence)
+                    sentences.append(sentence)
+                    rows.append(row)
+        if not sentences:
+            return {"label": None, "confident": False, "margin": None, "scores": {}, "sentences_scored": 0, "evidence": None}
+
+        similarities = np.stack(rows) # (sentences, labels)
+        relevant = similarities.max(axis=1) >= self.min_relevance
+        if not relevant.any():
+            return {"label": None, "confident": False, "margin": None, "scores": {}, "sentences_scored": 0, "evidence": None}
+
+        scores = similarities[relevant].mean(axis=0)
+        order = np.argsort(scores)[::-1]
+        best = int(order[0])
+        margin = float(scores[best] - scores[order[1]])
+        relevant_sentences = [sentence for sentence, keep in zip(sentences, relevant) if keep]
+        return {
+            "label": self.labels[best],
+            "confident": margin >= self.min_margin,
+            "margin": round(margin, 4),
+            "scores": {label: round(float(score), 4) for label, score in zip(self.labels, scores)},
+            "sentences_scored": len(relevant_sentences),
+            "evidence": relevant_sentences[int(np.argmax(similarities[relevant][:, best]))],
+        }
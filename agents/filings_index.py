@@ -0,0 +1,242 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_FILINGS_INDEX_PATH = os.path.join(PROJECT_ROOT, 'data', 'filings_index', 'filings.sqlite')
+
+# Columns of a submissions 'recent' block / paginated submissions file, in table order
+_FILING_COLUMNS = ('accessionNumber', 'form', 'filingDate', 'reportDate', 'primaryDocument', 'primaryDocDescription')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS companies (
+    cik TEXT PRIMARY KEY,
+    name TEXT,
+    refreshed_at REAL
+);
+CREATE TABLE IF NOT EXISTS company_tickers (
+    ticker TEXT PRIMARY KEY,
+    cik TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS filings (
+    accession_number TEXT PRIMARY KEY,
+    cik TEXT NOT NULL,
+    form TEXT,
+    filing_date TEXT,
+    report_date TEXT,
+    primary_document TEXT,
+    description TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_filings_cik_form_date ON filings (cik, form, filing_date);
+CREATE INDEX IF NOT EXISTS idx_filings_cik_date ON filings (cik, filing_date);
+CREATE TABLE IF NOT EXISTS submission_files (
+    cik TEXT NOT NULL,
+    name TEXT NOT NULL,
+    filing_from TEXT,
+    filing_to TEXT,
+    loaded_at REAL,
+    PRIMARY KEY (cik, name)
+);
+"""
+
+
+# Rows from master.idx only know the submission .txt and no report date. A richer row for the same
+# accession (submissions JSON) fills those in whichever order the sources are loaded; a poorer row
+# never overwrites a richer one. Unchanged rows are not rewritten, so total_changes counts real work.
+_ADD_FILING_SQL = (
+    "INSERT OR IGNORE INTO filings (accession_number, cik, form, filing_date, report_date, primary_document, description) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+_ENRICH_FILING_SQL = (
+    "INSERT INTO filings (accession_number, cik, form, filing_date, report_date, primary_document, description) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT(accession_number) DO UPDATE SET "
+    "form = COALESCE(form, excluded.form), "
+    "filing_date = COALESCE(filing_date, excluded.filing_date), "
+    "report_date = COALESCE(excluded.report_date, report_date), "
+    "primary_document = CASE WHEN primary_document IS NULL OR (primary_document LIKE '%.txt' AND excluded.primary_document NOT LIKE '%.txt') "
+    "THEN COALESCE(excluded.primary_document, primary_document) ELSE primary_document END, "
+    "description = COALESCE(excluded.description, description) "
+    "WHERE (excluded.report_date IS NOT NULL AND report_date IS NULL) "
+    "OR (excluded.description IS NOT NULL AND description IS NULL) "
+    "OR (excluded.primary_document IS NOT NULL AND (primary_document IS NULL "
+    "OR (primary_document LIKE '%.txt' AND excluded.primary_document NOT LIKE '%.txt')))"
+)
+
+
+def _insert_rows(conn: sqlite3.Connection, rows) -> tuple[int, int]:
+    """
+    Upserts (accession, cik, form, filing_date, report_date, primary_document, description) tuples.
+    Returns (filings added, existing filings enriched). New rows are inserted first so the two
+    counts can be told apart; the upsert pass then leaves them untouched.
+    """
+    rows = list(rows)
+    before = conn.total_changes
+    conn.executemany(_ADD_FILING_SQL, rows)
+    added = conn.total_changes - before
+    conn.executemany(_ENRICH_FILING_SQL, rows)
+    return added, conn.total_changes - before - added
+
+
+def _insert_filings(conn: sqlite3.Connection, cik: str, columns: dict) -> tuple[int, int]:
+    num_rows = len(columns.get('accessionNumber', []))
+    if num_rows == 0:
+        return 0, 0
+    column_values = [columns.get(name) or [None] * num_rows for name in _FILING_COLUMNS]
+    rows = ((accession, cik, form, filing_date, report_date, primary_doc, description)
+            for accession, form, filing_date, report_date, primary_doc, description in zip(*column_values))
+    return _insert_rows(conn, rows)
+
+
+def _record_company(conn: sqlite3.Connection, cik: str, name: str | None, tickers: list[str] | None, refreshed_at: float | None):
+    conn.execute(
+        "INSERT INTO companies (cik, name, refreshed_at) VALUES (?, ?, ?) "
+        "ON CONFLICT(cik) DO UPDATE SET name = COALESCE(excluded.name, name), "
+        "refreshed_at = COALESCE(excluded.refreshed_at, refreshed_at)",
+        (cik, name, refreshed_at)
+    )
+    if tickers:
+        conn.executemany(
+            "INSERT OR REPLACE INTO company_tickers (ticker, cik) VALUES (?, ?)",
+            [(ticker.upper(), cik) for ticker in tickers if ticker]
+        )
+
+
+def _mark_file_loaded(conn: sqlite3.Connection, cik: str, name: str, filing_from: str | None, filing_to: str | None):
+    conn.execute(
+        "INSERT OR REPLACE INTO submission_files (cik, name, filing_from, filing_to, loaded_at) VALUES (?, ?, ?, ?, ?)",
+        (cik, name, filing_from, filing_to, time.time())
+    )
+
+
+class _BulkWriter:
+    """Write handle returned by FilingsIndex.bulk_writer(); commits every `commit_every` calls."""
+
+    def __init__(self, conn: sqlite3.Connection, commit_every: int):
+        self._conn = conn
+        self._commit_every = max(1, commit_every)
+        self._pending = 0
+        self.filings_added = 0
+        self.filings_enriched = 0
+
+    def _tick(self):
+        self._pending += 1
+        if self._pending >= self._commit_every:
+            self._conn.commit()
+            self._pending = 0
+
+    def add_filings(self, cik: str, columns: dict) -> tuple[int, int]:
+        return self._count(_insert_filings(self._conn, cik, columns))
+
+    def add_rows(self, rows) -> tuple[int, int]:
+        return self._count(_insert_rows(self._conn, rows))
+
+    def _count(self, counts: tuple[int, int]) -> tuple[int, int]:
+        self.filings_added += counts[0]
+        self.filings_enriched += counts[1]
+        self._tick()
+        return counts
+
+    def record_company(self, cik: str, name: str | None = None, tickers: list[str] | None = None, refreshed_at: float | None = None):
+        _record_company(self._conn, cik, name, tickers, refreshed_at)
+        self._tick()
+
+    def mark_file_loaded(self, cik: str, name: str, filing_from: str | None = None, filing_to: str | None = None):
+        _mark_file_loaded(self._conn, cik, name, filing_from, filing_to)
+        self._tick()
+
+
+class FilingsIndex:
+    """
+    Local SQLite index of every known filing (form, dates, accession number, primary document)
+    per company, including the older filings SEC only exposes through paginated submission files.
+
+    Filings are immutable once published, so existing rows are only enriched (a master.idx row gains
+    its primary document and report date from submissions data), never replaced; paginated files
+    are recorded in `submission_files` once loaded and never fetched again.
+    One connection is shared across threads behind a lock.
+    """
+
+    def __init__(self, db_path: str | None = None):
+        self.db_path = db_path or os.getenv("FILINGS_INDEX_PATH", DEFAULT_FILINGS_INDEX_PATH)
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    def add_filings(self, cik: str, columns: dict) -> tuple[int, int]:
+        """Upserts filings from a columnar submissions block. Returns (new rows, enriched rows)."""
+        with self._lock, self._conn:
+            return _insert_filings(self._conn, cik, columns)
+
+    def record_company(self, cik: str, name: str | None = None, tickers: list[str] | None = None, refreshed_at: float | None = None):
+        with self._lock, self._conn:
+            _record_company(self._conn, cik, name, tickers, refreshed_at)
+
+    @contextmanager
+    def bulk_writer(self, commit_every: int = 1000):
+        """
+        Holds the index for a large load. Yields a writer with add_filings / add_rows /
+        record_company / mark_file_loaded that commits in batches rather than per call.
+        """
+        with self._lock:
+            writer = _BulkWriter(self._conn, commit_every)
+            try:
+                yield writer
+            except BaseException:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+
+    def loaded_files(self, cik: str) -> set[str]:
+        with self._lock:
+            rows = self._conn.execute("SELECT name FROM submission_files WHERE cik = ?", (cik,)).fetchall()
+        return {row['name'] for row in rows}
+
+    def mark_file_loaded(self, cik: str, name: str, filing_from: str | None = None, filing_to: str | None = None):
+        with self._lock, self._conn:
+            _mark_file_loaded(self._conn, cik, name, filing_from, filing_to)
+
+    def refreshed_at(self, cik: str) -> float | None:
+        with self._lock:
+            row = self._conn.execute("SELECT refreshed_at FROM companies WHERE cik = ?", (cik,)).fetchone()
+        return row['refreshed_at'] if row else None
+
+    def cik_for_ticker(self, ticker: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT cik FROM company_tickers WHERE ticker = ?", (ticker.upper(),)).fetchone()
+        return row['cik'] if row else None
+
+    def query(self, cik: str, form_types: list[str] | None = None, date_from: str | None = None,
+              date_to: str | None = None, limit: int = 100, offset: int = 0) -> list[dict]:
+        """
+        Returns filings for a company, newest first, using the (cik, form, filing_date) indexes.
+        Dates are inclusive ISO 'YYYY-MM-DD' strings.
+        """
+        sql = ("SELECT accession_number, form, filing_date, report_date, primary_document, description "
+               "FROM filings WHERE cik = ?")
+        params = [cik]
+        if form_types:
+            sql += f" AND form IN ({', '.join('?' * len(form_types))})"
+            params.extend(form_types)
+        if date_from:
+            sql += " AND filing_date >= ?"
+            params.append(date_from)
+        if date_to:
+            sql += " AND filing_date <= ?"
+            params.append(date_to)
+        sql += " ORDER BY filing_date DESC, accession_number DESC LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self, cik: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM filings WHERE cik = ?", (cik,)).fetchone()[0]
@@ -0,0 +1,344 @@
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Allow `from agents...` imports when this file is run directly
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from agents.market_data_store import latest_trading_day
+
+DEFAULT_HOLDINGS_DIR = os.path.join(PROJECT_ROOT, 'data', 'holdings')
+
+# Company reference data (SIC, addresses) rarely changes
+REFERENCE_DATA_TTL_SECONDS = int(os.getenv("REFERENCE_DATA_TTL_SECONDS", 30 * 24 * 3600))
+REFERENCE_DATA_MAX_WORKERS = 4
+
+UNKNOWN = "Unknown"
+
+# SIC code ranges -> sector, most specific first
+SIC_SECTOR_RANGES = [
+    (2830, 2836, "Health Care"), # Drugs
+    (3570, 3579, "Technology"), # Computer and office equipment
+    (3600, 3699, "Technology"), # Electronic equipment, semiconductors (3674)
+    (3825, 3829, "Technology"), # Measuring and test instruments
+    (3840, 3851, "Health Care"), # Medical instruments and supplies
+    (4800, 4899, "Communication Services"),
+    (4900, 4999, "Utilities"),
+    (7370, 7379, "Technology"), # Software and IT services
+    (8000, 8099, "Health Care"), # Health services
+    (6500, 6599, "Real Estate"),
+    (6798, 6798, "Real Estate"), # REITs
+    (6000, 6799, "Financials"),
+    (1300, 1389, "Energy"),
+    (2900, 2999, "Energy"),
+    (100, 999, "Consumer Staples"), # Agriculture, forestry, fishing
+    (1000, 1499, "Materials"), # Mining
+    (1500, 1799, "Industrials"), # Construction
+    (2000, 2199, "Consumer Staples"), # Food, tobacco
+    (2200, 2799, "Consumer Discretionary"), # Textiles, apparel, lumber, furniture, paper, printing
+    (2800, 3299, "Materials"), # Chemicals, rubber, plastics, glass
+    (3300, 3499, "Materials"), # Metals
+    (3500, 3999, "Industrials"), # Machinery, transportation equipment, instruments
+    (4000, 4799, "Industrials"), # Transportation
+    (5000, 5199, "Industrials"), # Wholesale trade
+    (5200, 5999, "Consumer Discretionary"), # Retail trade
+    (7000, 8999, "Consumer Discretionary"), # Services
+]
+
+# EDGAR state/country codes of non-US locations -> region. US states (two letters) are North America.
+EDGAR_CODE_REGIONS = {
+    # Canada
+    **{code: "North America" for code in ("A0", "A1", "A2", "A3", "A4", "A5", "A6", "A7", "A8", "A9", "B0", "Z4")},
+    "O5": "Latin America", # Mexico
+    "D5": "Latin America", # Brazil
+    "C1": "Latin America", # Argentina
+    "F3": "Latin America", # Chile
+    "E9": "Offshore", # Cayman Islands
+    "D0": "Offshore", # Bermuda
+    "D8": "Offshore", # British Virgin Islands
+    "F4": "Asia", # China
+    "K3": "Asia", # Hong Kong
+    "F5": "Asia", # Taiwan
+    "M0": "Asia", # Japan
+    "M5": "Asia", # Korea, Republic of
+    "U0": "Asia", # Singapore
+    "K7": "Asia", # India
+    "K8": "Asia", # Indonesia
+    "N8": "Asia", # Malaysia
+    "R6": "Asia", # Philippines
+    "W1": "Asia", # Thailand
+    "Q1": "Asia", # Vietnam
+    "C3": "Asia Pacific", # Australia
+    "Q2": "Asia Pacific", # New Zealand
+    "X0": "Europe", # United Kingdom
+    "2M": "Europe", # Germany
+    "I0": "Europe", # France
+    "L2": "Europe", # Ireland
+    "P7": "Europe", # Netherlands
+    "V8": "Europe", # Switzerland
+    "N4": "Europe", # Luxembourg
+    "V7": "Europe", # Sweden
+    "G7": "Europe", # Denmark
+    "H9": "Europe", # Finland
+    "U3": "Europe", # Spain
+    "L6": "Europe", # Italy
+    "C9": "Europe", # Belgium
+    "C4": "Europe", # Austria
+    "L3": "Middle East", # Israel
+    "T3": "Africa", # South Africa
+}
+
+US_STATE_CODES = {
+    "AL", "AK", "AZ", "AR", "CA", "CO", "CT", "DE", "DC", "FL", "GA", "HI", "ID", "IL", "IN", "IA", "KS", "KY",
+    "LA", "ME", "MD", "MA", "MI", "MN", "MS", "MO", "MT", "NE", "NV", "NH", "NJ", "NM", "NY", "NC", "ND", "OH",
+    "OK", "OR", "PA", "RI", "SC", "SD", "TN", "TX", "UT", "VT", "VA", "WA", "WV", "WI", "WY", "PR",
+}
+
+
+def sector_for_sic(sic) -> str:
+    try:
+        code = int(sic)
+    except (TypeError, ValueError):
+        return UNKNOWN
+    for low, high, sector in SIC_SECTOR_RANGES:
+        if low <= code <= high:
+            return sector
+    return UNKNOWN
+
+
+def region_for_edgar_code(code: str | None) -> str:
+    if not code:
+        return UNKNOWN
+    code = code.upper()
+    if code in US_STATE_CODES:
+        return "North America"
+    return EDGAR_CODE_REGIONS.get(code, "Other")
+
+
+def classify_profile(profile: dict) -> dict:
+    """Adds sector (from SIC) and region (business address, else state of incorporation) to an SEC company profile."""
+    return {
+        **profile,
+        "sector": sector_for_sic(profile.get("sic")),
+        "region": region_for_edgar_code(profile.get("business_state_or_country") or profile.get("state_of_incorporation")),
+    }
+
+
+class HoldingsStore:
+    """
+    Positions loaded from a CSV file, joined with ticker reference data (sector/region derived from
+    SEC submissions, cached in a local JSON file), and indexed for exposure queries.
+
+    Positions CSV columns: ticker, and one of market_value, quantity (valued at the last stored close)
+    or weight. Values and weights are not comparable, so a file either values its positions
+    (market_value or quantity) or gives every position only a weight; mixing the two is rejected.
+    The index is a (region x sector) matrix of position values built with one np.bincount,
+    plus per-position region/sector codes, so exposure queries are array slices and masks.
+    It is rebuilt when the positions file or reference data change, or the trading day rolls over.
+    """
+
+    def __init__(self, profile_loader, price_loader, positions_path: str | None = None, reference_path: str | None = None):
+        """
+        Args:
+            profile_loader: callable(ticker) -> SEC company profile dict (e.g. scraping_agent.get_company_profile).
+            price_loader: callable(ticker) -> last close or None.
+        """
+        holdings_dir = os.getenv("HOLDINGS_DIR", DEFAULT_HOLDINGS_DIR)
+        self.positions_path = positions_path or os.getenv("HOLDINGS_POSITIONS_PATH", os.path.join(holdings_dir, 'positions.csv'))
+        self.reference_path = reference_path or os.path.join(holdings_dir, 'reference_data.json')
+        self.profile_loader = profile_loader
+        self.price_loader = price_loader
+        self._lock = threading.Lock()
+        self._index_lock = threading.Lock() # Separate from _lock, which the build takes to store reference data
+        self._reference = self._load_reference()
+        self._reference_version = 0
+        self._index = None
+        self._index_key = None
+
+    # --- Reference data -------------------------------------------------------------------
+
+    def _load_reference(self) -> dict:
+        try:
+            with open(self.reference_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_reference(self):
+        os.makedirs(os.path.dirname(self.reference_path), exist_ok=True)
+        tmp_path = f"{self.reference_path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._reference, f)
+        os.replace(tmp_path, self.reference_path)
+
+    def _fetch_profile(self, ticker: str) -> dict | None:
+        profile = self.profile_loader(ticker)
+        if not profile or profile.get("error"):
+            print(f"HoldingsStore: No reference data for {ticker}: {profile.get('error') if profile else 'empty response'}")
+            return None
+        return {**classify_profile(profile), "fetched_at": time.time()}
+
+    def ensure_reference_data(self, tickers: list[str]) -> dict:
+        """Fetches reference data for tickers that have none or whose entry has expired. Returns {ticker: profile}."""
+        now = time.time()
+        missing = [t for t in tickers if now - self._reference.get(t, {}).get("fetched_at", 0) > REFERENCE_DATA_TTL_SECONDS]
+        if missing:
+            print(f"HoldingsStore: Fetching reference data for {len(missing)} ticker(s)...")
+            with ThreadPoolExecutor(max_workers=REFERENCE_DATA_MAX_WORKERS) as executor:
+                profiles = list(executor.map(self._fetch_profile, missing))
+            fetched = {ticker: profile for ticker, profile in zip(missing, profiles) if profile}
+            if fetched:
+                with self._lock:
+                    self._reference.update(fetched)
+                    self._reference_version += 1
+                    self._save_reference()
+        return {t: self._reference[t] for t in tickers if t in self._reference}
+
+    # --- Positions and index --------------------------------------------------------------
+
+    def load_positions(self) -> list[dict]:
+        """Reads the positions CSV into [{"ticker", "market_value", "quantity", "weight"}] (missing columns as None)."""
+        def number(value):
+            try:
+                return float(value) if value not in (None, "") else None
+            except ValueError:
+                return None
+
+        positions = {}
+        with open(self.positions_path, 'r', encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f):
+                row = {(key or "").strip().lower(): (value or "").strip() for key, value in row.items()}
+                ticker = row.get("ticker", "").upper()
+                if not ticker:
+                    continue
+                entry = positions.setdefault(ticker, {"ticker": ticker, "market_value": None, "quantity": None, "weight": None})
+                for column in ("market_value", "quantity", "weight"):
+                    value = number(row.get(column))
+                    if value is not None:
+                        entry[column] = (entry[column] or 0.0) + value # Lots of the same ticker are summed
+        return list(positions.values())
+
+    def _position_value(self, position: dict) -> float:
+        if position["market_value"] is not None:
+            return position["market_value"]
+        if position["quantity"] is not None:
+            price = self.price_loader(position["ticker"])
+            return position["quantity"] * price if price is not None else np.nan
+        if position["weight"] is not None:
+            return position["weight"]
+        return np.nan
+
+    def _build_index(self) -> dict:
+        positions = self.load_positions()
+        valued = [p["ticker"] for p in positions if p["market_value"] is not None or p["quantity"] is not None]
+        weight_only = [p["ticker"] for p in positions
+                       if p["market_value"] is None and p["quantity"] is None and p["weight"] is not None]
+        if valued and weight_only:
+            raise ValueError(f"Positions file {self.positions_path} mixes valued positions with weight-only ones "
+                             f"({', '.join(weight_only[:10])}); give every position a market_value/quantity, or only weights.")
+        tickers = [p["ticker"] for p in positions]
+        reference = self.ensure_reference_data(tickers)
+        values = np.array([self._position_value(p) for p in positions], dtype=np.float64)
+
+        regions = [reference.get(t, {}).get("region", UNKNOWN) for t in tickers]
+        sectors = [reference.get(t, {}).get("sector", UNKNOWN) for t in tickers]
+        region_names, region_idx = np.unique(np.array(regions, dtype=object).astype(str), return_inverse=True)
+        sector_names, sector_idx = np.unique(np.array(sectors, dtype=object).astype(str), return_inverse=True)
+        priced = ~np.isnan(values)
+        matrix = np.bincount(
+            region_idx[priced] * len(sector_names) + sector_idx[priced],
+            weights=values[priced],
+            minlength=len(region_names) * len(sector_names)
+        ).reshape(len(region_names), len(sector_names)) if len(tickers) else np.zeros((0, 0))
+
+        return {
+            "tickers": np.array(tickers, dtype=object),
+            "names": [reference.get(t, {}).get("name") for t in tickers],
+            "values": values,
+            "region_idx": region_idx,
+            "sector_idx": sector_idx,
+            "regions": [str(r) for r in region_names],
+            "sectors": [str(s) for s in sector_names],
+            "matrix": matrix,
+            "total": float(matrix.sum()),
+            "unpriced": [t for t, ok in zip(tickers, priced) if not ok],
+        }
+
+    def index(self) -> dict:
+        try:
+            positions_mtime = os.path.getmtime(self.positions_path)
+        except OSError:
+            raise FileNotFoundError(f"Positions file not found: {self.positions_path}")
+        with self._index_lock:
+            key = (positions_mtime, self._reference_version, latest_trading_day())
+            if self._index is None or self._index_key != key:
+                self._index = self._build_index()
+                # The build may have fetched reference data, so key on the version it produced
+                self._index_key = (positions_mtime, self._reference_version, key[2])
+            return self._index
+
+    # --- Queries --------------------------------------------------------------------------
+
+    @staticmethod
+    def _match(names: list[str], wanted: str | None) -> list[int] | None:
+        if not wanted:
+            return None
+        wanted = wanted.strip().lower()
+        return [i for i, name in enumerate(names) if name.lower() == wanted]
+
+    def exposure(self, region: str | None = None, sector: str | None = None) -> dict:
+        """
+        Exposure to a region and/or sector: total value, share of the portfolio, and the matching
+        positions sorted by value (with their weight within the portfolio).
+        """
+        idx = self.index()
+        region_rows = self._match(idx["regions"], region)
+        sector_cols = self._match(idx["sectors"], sector)
+        rows = region_rows if region_rows is not None else list(range(len(idx["regions"])))
+        cols = sector_cols if sector_cols is not None else list(range(len(idx["sectors"])))
+        exposure_value = float(idx["matrix"][np.ix_(rows, cols)].sum()) if rows and cols else 0.0
+
+        mask = np.isin(idx["region_idx"], rows) & np.isin(idx["sector_idx"], cols) & ~np.isnan(idx["values"])
+        order = np.argsort(-idx["values"][mask])
+        members = np.flatnonzero(mask)[order]
+        total = idx["total"]
+        return {
+            "region": region,
+            "sector": sector,
+            "exposure_value": round(exposure_value, 2),
+            "exposure_pct": round(exposure_value / total * 100, 4) if total else None,
+            "portfolio_value": round(total, 2),
+            "holdings": [
+                {
+                    "ticker": idx["tickers"][i],
+                    "name": idx["names"][i],
+                    "region": idx["regions"][idx["region_idx"][i]],
+                    "sector": idx["sectors"][idx["sector_idx"][i]],
+                    "value": round(float(idx["values"][i]), 2),
+                    "portfolio_weight": round(float(idx["values"][i]) / total, 6) if total else None,
+                }
+                for i in members
+            ],
+            "unpriced": idx["unpriced"],
+        }
+
+    def breakdown(self) -> dict:
+        """Portfolio value by region, by sector, and the full region x sector matrix."""
+        idx = self.index()
+        matrix = idx["matrix"]
+        return {
+            "portfolio_value": round(idx["total"], 2),
+            "by_region": {r: round(float(v), 2) for r, v in zip(idx["regions"], matrix.sum(axis=1))},
+            "by_sector": {s: round(float(v), 2) for s, v in zip(idx["sectors"], matrix.sum(axis=0))},
+            "matrix": {r: {s: round(float(matrix[i, j]), 2) for j, s in enumerate(idx["sectors"]) if matrix[i, j]}
+                       for i, r in enumerate(idx["regions"])},
+            "unpriced": idx["unpriced"],
+        }
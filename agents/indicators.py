@@ -0,0 +1,202 @@
+import math
+import os
+import sys
+import warnings
+
+import numpy as np
+
+# Allow `from agents...` imports when this file is run directly
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from agents.market_data_store import BAR_FIELDS, bars_from_alpha_vantage, bars_from_columnar
+
+TRADING_DAYS_PER_YEAR = 252
+INDICATOR_WINDOW = int(os.getenv("INDICATOR_WINDOW", 20)) # volatility, gap and volume z-score lookback
+BETA_WINDOW = int(os.getenv("INDICATOR_BETA_WINDOW", 60))
+SMA_WINDOWS = (20, 50)
+DEFAULT_BENCHMARK = os.getenv("INDICATOR_BENCHMARK", "SPY")
+
+# Thresholds that turn statistics into risk flags
+RISK_THRESHOLDS = {
+    "significant_drop": -0.05, # 1-day return
+    "high_volatility": 0.40, # annualised
+    "large_drawdown": -0.20, # from the running peak
+    "price_gap_z": 3.0,
+    "volume_spike_z": 3.0,
+    "high_beta": 1.5,
+}
+
+
+def _as_bars(data: dict) -> dict:
+    """
+    Accepts MarketDataStore bars, the API Service's columnar JSON (lists) or
+    Alpha Vantage's {date: {"1. open": ...}} shape.
+    """
+    if "dates" in data:
+        return data if isinstance(data["dates"], np.ndarray) else bars_from_columnar(data)
+    return bars_from_alpha_vantage(data)
+
+
+def align_bars(bars_by_symbol: dict) -> tuple[list[str], np.ndarray, dict]:
+    """
+    Aligns many symbols on the union of their dates.
+    Returns (symbols, dates, {field: float64 matrix of shape (days, symbols)}), NaN where a symbol has no bar.
+    """
+    symbols = [symbol for symbol, data in bars_by_symbol.items() if data]
+    columns = [_as_bars(bars_by_symbol[symbol]) for symbol in symbols]
+    if not columns:
+        return [], np.array([], dtype='datetime64[D]'), {field: np.empty((0, 0)) for field in BAR_FIELDS}
+    dates = np.unique(np.concatenate([bars["dates"] for bars in columns]))
+    matrices = {field: np.full((len(dates), len(symbols)), np.nan) for field in BAR_FIELDS}
+    for j, bars in enumerate(columns):
+        rows = np.searchsorted(dates, bars["dates"])
+        for field in BAR_FIELDS:
+            matrices[field][rows, j] = bars[field]
+    return symbols, dates, matrices
+
+
+def _nan_zscore_latest(values: np.ndarray, window: int) -> np.ndarray:
+    """Z-score of each column's last value against the `window` values before it."""
+    if values.shape[0] < 3:
+        return np.full(values.shape[1], np.nan)
+    history = values[-window - 1:-1]
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning) # All-NaN columns
+        mean = np.nanmean(history, axis=0)
+        std = np.nanstd(history, axis=0, ddof=1)
+        return np.where(std > 0, (values[-1] - mean) / std, np.nan)
+
+
+def _beta(returns: np.ndarray, benchmark_returns: np.ndarray, window: int) -> np.ndarray:
+    """Per-column beta over the last `window` days, using only days where both returns exist."""
+    r = returns[-window:]
+    b = np.broadcast_to(benchmark_returns[-window:, None], r.shape)
+    mask = ~np.isnan(r) & ~np.isnan(b)
+    counts = mask.sum(axis=0)
+    r = np.where(mask, r, 0.0)
+    b = np.where(mask, b, 0.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r_mean = r.sum(axis=0) / counts
+        b_mean = b.sum(axis=0) / counts
+        cov = ((r - r_mean) * (b - b_mean) * mask).sum(axis=0) / (counts - 1)
+        var = (((b - b_mean) * mask) ** 2).sum(axis=0) / (counts - 1)
+        return np.where((counts > 2) & (var > 0), cov / var, np.nan)
+
+
+def _last_valid_window(valid: np.ndarray, size: int) -> np.ndarray:
+    """Mask of each column's last `size` valid rows, so a symbol whose bars end early uses its own latest data."""
+    valid_from_here = np.cumsum(valid[::-1], axis=0)[::-1]
+    return valid & (valid_from_here <= size)
+
+
+def _to_json_number(value) -> float | None:
+    value = float(value)
+    return None if math.isnan(value) or math.isinf(value) else round(value, 6)
+
+
+def risk_flags(stats: dict) -> list[str]:
+    """Names of the RISK_THRESHOLDS a symbol's statistics breach."""
+    flags = []
+    def breached(key, threshold, below=False):
+        value = stats.get(key)
+        return value is not None and (value <= threshold if below else value >= threshold)
+    if breached("return_1d", RISK_THRESHOLDS["significant_drop"], below=True):
+        flags.append("significant_drop")
+    if breached("volatility_annualized", RISK_THRESHOLDS["high_volatility"]):
+        flags.append("high_volatility")
+    if breached("drawdown_current", RISK_THRESHOLDS["large_drawdown"], below=True):
+        flags.append("large_drawdown")
+    if stats.get("gap_zscore") is not None and abs(stats["gap_zscore"]) >= RISK_THRESHOLDS["price_gap_z"]:
+        flags.append("price_gap")
+    if breached("volume_zscore", RISK_THRESHOLDS["volume_spike_z"]):
+        flags.append("volume_spike")
+    if breached("beta", RISK_THRESHOLDS["high_beta"]):
+        flags.append("high_beta")
+    return flags
+
+
+def compute_indicators(bars_by_symbol: dict, benchmark: str | None = DEFAULT_BENCHMARK,
+                       window: int = INDICATOR_WINDOW, beta_window: int = BETA_WINDOW) -> dict:
+    """
+    Computes the latest technical/risk statistics for many symbols in one vectorised pass.
+
+    Args:
+        bars_by_symbol (dict): {symbol: bars}, where bars are MarketDataStore columns or
+                               get_daily_stock_data()'s Alpha Vantage-shaped dict.
+        benchmark (str | None): Symbol in `bars_by_symbol` to compute beta against.
+
+    Returns:
+        dict: {symbol: {"as_of", "close", "return_1d", "return_5d", "return_20d", "volatility_annualized",
+               "drawdown_max", "drawdown_current", "sma_20", "sma_50", "close_vs_sma_20", "close_vs_sma_50",
+               "gap_zscore", "volume_zscore", "beta", "risk_flags"}}. Unavailable values are None.
+    """
+    symbols, dates, m = align_bars(bars_by_symbol)
+    if not symbols:
+        return {}
+    close, open_, volume = m["close"], m["open"], m["volume"]
+    num_days = close.shape[0]
+
+    # Carry the last close forward so a missing day doesn't break the return chain
+    valid = ~np.isnan(close)
+    last_valid = np.maximum.accumulate(np.where(valid, np.arange(num_days)[:, None], 0), axis=0)
+    close_ffill = close[last_valid, np.arange(close.shape[1])]
+
+    # Returns and averages are measured back from each symbol's own last bar, so a symbol whose bars
+    # end before the others' (e.g. stale data) still reports its latest moves
+    columns = np.arange(len(symbols))
+    last_row = last_valid[-1]
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning) # All-NaN columns
+        returns = close_ffill[1:] / close_ffill[:-1] - 1.0
+        returns[~valid[1:]] = np.nan
+        gaps = open_[1:] / close_ffill[:-1] - 1.0
+
+        trailing_returns = {
+            days: np.where(last_row >= days, close_ffill[last_row, columns] / close_ffill[np.maximum(last_row - days, 0), columns] - 1.0, np.nan)
+            for days in (1, 5, 20)
+        }
+
+        in_window = _last_valid_window(~np.isnan(returns), window)
+        counts = in_window.sum(axis=0)
+        window_returns = np.where(in_window, returns, 0.0)
+        mean_returns = window_returns.sum(axis=0) / counts
+        variance = (((window_returns - mean_returns) * in_window) ** 2).sum(axis=0) / (counts - 1)
+        volatility = np.where(counts > 1, np.sqrt(variance) * np.sqrt(TRADING_DAYS_PER_YEAR), np.nan)
+        running_peak = np.fmax.accumulate(close_ffill, axis=0)
+        drawdowns = close_ffill / running_peak - 1.0
+        smas = {w: np.where(valid.sum(axis=0) >= w, np.where(_last_valid_window(valid, w), close, 0.0).sum(axis=0) / w, np.nan)
+                for w in SMA_WINDOWS}
+
+    gap_z = _nan_zscore_latest(gaps, window)
+    volume_z = _nan_zscore_latest(volume, window)
+
+    betas = np.full(len(symbols), np.nan)
+    benchmark = benchmark.upper() if benchmark else None
+    if benchmark in symbols and returns.shape[0] > 2:
+        betas = _beta(returns, returns[:, symbols.index(benchmark)], beta_window)
+
+    last_dates = [str(dates[row]) if valid[row, j] else None for j, row in enumerate(last_valid[-1])]
+    results = {}
+    for j, symbol in enumerate(symbols):
+        stats = {
+            "as_of": last_dates[j],
+            "close": _to_json_number(close_ffill[-1, j]),
+            "return_1d": _to_json_number(trailing_returns[1][j]),
+            "return_5d": _to_json_number(trailing_returns[5][j]),
+            "return_20d": _to_json_number(trailing_returns[20][j]),
+            "volatility_annualized": _to_json_number(volatility[j]),
+            "drawdown_max": _to_json_number(np.nanmin(drawdowns[:, j])) if valid[:, j].any() else None,
+            "drawdown_current": _to_json_number(drawdowns[-1, j]),
+            "gap_zscore": _to_json_number(gap_z[j]),
+            "volume_zscore": _to_json_number(volume_z[j]),
+            "beta": None if symbol == benchmark else _to_json_number(betas[j]),
+        }
+        for w in SMA_WINDOWS:
+            stats[f"sma_{w}"] = _to_json_number(smas[w][j])
+            with np.errstate(invalid='ignore', divide='ignore'):
+                stats[f"close_vs_sma_{w}"] = _to_json_number(close_ffill[-1, j] / smas[w][j] - 1.0)
+        stats["risk_flags"] = risk_flags(stats)
+        results[symbol] = stats
+    return results
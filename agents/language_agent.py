@@ -1,4 +1,6 @@
 import os
+import sys
+import time
 from dotenv import load_dotenv
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.schema import HumanMessage, SystemMessage
@@ -27,9 +29,21 @@ if not GEMINI_API_KEY:
 # Configuration for the Retriever Service
 RETRIEVER_SERVICE_BASE_URL = os.getenv("RETRIEVER_SERVICE_URL", "http://localhost:8002/retriever")
 
+# Allow `from agents...` imports when this file is run directly
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from agents.llm_executor import LLMExecutor, PRIORITY_INTERACTIVE
+from agents.llm_response_cache import LLMResponseCache, LLM_CACHE_ENABLED
+
 class LanguageAgent:
     def __init__(self, model_name: str = LLM_MODEL_NAME):
         print(f"Initializing LanguageAgent with model: {model_name}")
+        self.model_name = model_name
+        # Repeated briefs produce byte-identical prompts; answer those without calling the LLM
+        self.response_cache = LLMResponseCache() if LLM_CACHE_ENABLED else None
+        # Provider calls run on a bounded worker pool; callers wait in its queue
+        self.llm_executor = LLMExecutor()
         try:
             self.llm = ChatGoogleGenerativeAI(
                 model=model_name,
@@ -79,30 +93,73 @@ class LanguageAgent:
             traceback.print_exc()
             return []
 
-    def generate_response(self, prompt: str, system_prompt: str = None) -> str:
-        """
-        Generates a response from the LLM given a user prompt and an optional system prompt.
-        """
+    @staticmethod
+    def _build_messages(prompt: str, system_prompt: str | None) -> list:
         messages = []
         if system_prompt:
             messages.append(SystemMessage(content=system_prompt))
         messages.append(HumanMessage(content=prompt))
+        return messages
+
+    def generate_response(self, prompt: str, system_prompt: str = None, priority: str = PRIORITY_INTERACTIVE) -> str:
+        """
+        Generates a response from the LLM given a user prompt and an optional system prompt.
+        `priority` is the LLMExecutor class the call is scheduled in (interactive or background).
+        LLM errors, including LLMExecutorBusy, are raised so callers get an error status rather than
+        an apology as content (which their caches would keep).
+        """
+        messages = self._build_messages(prompt, system_prompt)
         
+        cache_state = None
+        if self.response_cache:
+            cached, tier, cache_state = self.response_cache.lookup(self.model_name, system_prompt, prompt)
+            if cached is not None:
+                print(f"LanguageAgent: Serving cached LLM response ({tier} match).")
+                return cached
+
         print(f"Sending prompt to LLM: '{prompt}' (System: '{system_prompt if system_prompt else 'None'}')")
+        started = time.monotonic()
         try:
-            response = self.llm.invoke(messages)
-            print(f"LLM Response received: {response.content[:100]}...") # Log first 100 chars
-            return response.content
+            response = self.llm_executor.run(self.llm.invoke, messages, priority=priority)
         except Exception as e:
             print(f"Error during LLM invocation: {e}")
-            return "Sorry, I encountered an error while generating a response."
+            raise
+        print(f"LLM Response received: {response.content[:100]}...") # Log first 100 chars
+        if self.response_cache and response.content:
+            self.response_cache.store(cache_state, prompt, response.content, time.monotonic() - started)
+        return response.content
 
-    def generate_rag_response(self, prompt: str, use_rag: bool = True, top_k_retrieval: int = 3, system_prompt: str = None) -> str:
+    def stream_response(self, prompt: str, system_prompt: str = None, priority: str = PRIORITY_INTERACTIVE):
         """
-        Generates a response using the LLM. If use_rag is True, it first fetches context
-        from the RetrieverService and incorporates it into the prompt.
-        It now uses a more structured approach for financial queries.
+        Like generate_response, but yields the response text in chunks as the LLM produces them.
+        A cached response is yielded as a single chunk. Errors, including LLMExecutorBusy, are raised to the caller.
         """
+        messages = self._build_messages(prompt, system_prompt)
+
+        cache_state = None
+        if self.response_cache:
+            cached, tier, cache_state = self.response_cache.lookup(self.model_name, system_prompt, prompt)
+            if cached is not None:
+                print(f"LanguageAgent: Serving cached LLM response ({tier} match) to stream.")
+                yield cached
+                return
+
+        print(f"Streaming prompt to LLM: '{prompt[:200]}' (System: '{system_prompt if system_prompt else 'None'}')")
+        started = time.monotonic()
+        parts = []
+        for chunk in self.llm_executor.stream(lambda: self.llm.stream(messages), priority=priority):
+            if chunk.content:
+                if not parts:
+                    print(f"LanguageAgent: First token after {time.monotonic() - started:.2f}s.")
+                parts.append(chunk.content)
+                yield chunk.content
+        response = "".join(parts)
+        print(f"LLM streamed response complete ({len(response)} chars in {time.monotonic() - started:.2f}s).")
+        if self.response_cache and response:
+            self.response_cache.store(cache_state, prompt, response, time.monotonic() - started)
+
+    def _build_rag_prompt(self, prompt: str, use_rag: bool, top_k_retrieval: int, system_prompt: str | None) -> tuple[str, str]:
+        """Returns (final user prompt, system prompt) for generate_rag_response / stream_rag_response."""
         context_str = ""
         if use_rag:
             print(f"RAG mode enabled. Fetching context for prompt: '{prompt}'")
@@ -144,7 +201,23 @@ Please answer the question: {prompt}"""
         print(f"Final prompt for LLM: '{final_user_prompt}'")
         print(f"System prompt for LLM: '{current_system_prompt}'")
 
-        return self.generate_response(prompt=final_user_prompt, system_prompt=current_system_prompt)
+        return final_user_prompt, current_system_prompt
+
+    def generate_rag_response(self, prompt: str, use_rag: bool = True, top_k_retrieval: int = 3, system_prompt: str = None,
+                              priority: str = PRIORITY_INTERACTIVE) -> str:
+        """
+        Generates a response using the LLM. If use_rag is True, it first fetches context
+        from the RetrieverService and incorporates it into the prompt.
+        It now uses a more structured approach for financial queries.
+        """
+        final_user_prompt, current_system_prompt = self._build_rag_prompt(prompt, use_rag, top_k_retrieval, system_prompt)
+        return self.generate_response(prompt=final_user_prompt, system_prompt=current_system_prompt, priority=priority)
+
+    def stream_rag_response(self, prompt: str, use_rag: bool = True, top_k_retrieval: int = 3, system_prompt: str = None,
+                            priority: str = PRIORITY_INTERACTIVE):
+        """Streaming variant of generate_rag_response; retrieval happens before the first chunk."""
+        final_user_prompt, current_system_prompt = self._build_rag_prompt(prompt, use_rag, top_k_retrieval, system_prompt)
+        yield from self.stream_response(prompt=final_user_prompt, system_prompt=current_system_prompt, priority=priority)
 
 if __name__ == '__main__':
     print("--- Initializing LanguageAgent for testing ---")
@@ -0,0 +1,323 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 4))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", 64))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", 30))
+_WAIT_SAMPLES = 500 # Recent queue waits kept per class for percentiles
+
+# Priority classes, in dispatch order. Interactive traffic is user-facing; background covers
+# AnalysisAgent sentiment fallbacks and prefetch-style jobs.
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BACKGROUND = "background"
+PRIORITY_CLASSES = (PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND)
+# Worker slots background work may never occupy
+LLM_INTERACTIVE_RESERVED_SLOTS = int(os.getenv("LLM_INTERACTIVE_RESERVED_SLOTS", 1))
+# Per-class dispatch rate limits (requests per minute, 0 = unlimited)
+LLM_CLASS_REQUESTS_PER_MINUTE = {
+    PRIORITY_INTERACTIVE: int(os.getenv("LLM_INTERACTIVE_REQUESTS_PER_MINUTE", 0)),
+    PRIORITY_BACKGROUND: int(os.getenv("LLM_BACKGROUND_REQUESTS_PER_MINUTE", 30)),
+}
+# After the provider throttles, background work is held back for this long (doubling, up to the max)
+LLM_THROTTLE_BACKOFF_SECONDS = float(os.getenv("LLM_THROTTLE_BACKOFF_SECONDS", 30))
+LLM_THROTTLE_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_THROTTLE_BACKOFF_MAX_SECONDS", 300))
+
+# Fragments of provider errors that mean "slow down" (HTTP 429 / gRPC RESOURCE_EXHAUSTED)
+_THROTTLE_MESSAGES = ("429", "rate limit", "quota", "resource exhausted", "resourceexhausted", "too many requests")
+
+
+class LLMExecutorBusy(Exception):
+    """Raised when an LLM call cannot be queued, or waited too long for a slot."""
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Job:
+    __slots__ = ("func", "future", "enqueued_at", "priority")
+
+    def __init__(self, func, future: Future, priority: str):
+        self.func = func
+        self.future = future
+        self.enqueued_at = time.monotonic()
+        self.priority = priority
+
+
+class _PriorityClass:
+    """Queue, token bucket and counters for one priority class."""
+
+    def __init__(self, name: str, requests_per_minute: int):
+        self.name = name
+        self.requests_per_minute = max(0, requests_per_minute)
+        self.queue = deque()
+        self.tokens = float(self.requests_per_minute)
+        self.refilled_at = time.monotonic()
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.shed = 0
+        self.timed_out = 0
+        self.cancelled = 0
+        self.waits = deque(maxlen=_WAIT_SAMPLES)
+
+    def seconds_until_token(self, now: float) -> float:
+        if not self.requests_per_minute:
+            return 0.0
+        self.tokens = min(float(self.requests_per_minute), self.tokens + (now - self.refilled_at) * self.requests_per_minute / 60.0)
+        self.refilled_at = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) * 60.0 / self.requests_per_minute
+
+    def stats(self) -> dict:
+        waits = sorted(self.waits)
+        def percentile(q):
+            return round(waits[min(len(waits) - 1, int(q * len(waits)))], 3) if waits else None
+        return {
+            "queued": len(self.queue),
+            "running": self.running,
+            "requests_per_minute": self.requests_per_minute or None,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+            "cancelled": self.cancelled,
+            "wait_seconds_p50": percentile(0.5),
+            "wait_seconds_p95": percentile(0.95),
+            "wait_seconds_max": round(waits[-1], 3) if waits else None,
+        }
+
+
+class LLMExecutor:
+    """
+    Runs blocking LLM calls on a fixed set of worker threads, by priority class.
+
+    - At most `max_concurrency` calls run at once; the rest wait in per-class FIFO queues (up to
+      `max_queue` in total). Free workers always take interactive work first.
+    - `interactive_reserved` slots are kept for interactive calls, so a batch of background calls
+      can never occupy every worker. Each class can also have a requests-per-minute limit.
+    - When the provider throttles a call, background work is deferred for a backoff period
+      (doubling while throttling continues) and new background submissions are shed.
+    - submit() raises LLMExecutorBusy when the queue is full or the call is shed; a queued call that
+      has not started within `queue_timeout` seconds fails with LLMExecutorBusy instead of running late.
+      run() and stream() enforce that deadline from the caller's side, so it holds even while every
+      worker is busy; a bare submit() future is expired when a worker next looks at the queue.
+    """
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, max_queue: int = LLM_MAX_QUEUE,
+                 queue_timeout: float = LLM_QUEUE_TIMEOUT_SECONDS, interactive_reserved: int = LLM_INTERACTIVE_RESERVED_SLOTS,
+                 requests_per_minute: dict | None = None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self.interactive_reserved = min(max(0, interactive_reserved), self.max_concurrency - 1)
+        rates = {**LLM_CLASS_REQUESTS_PER_MINUTE, **(requests_per_minute or {})}
+        self._classes = {name: _PriorityClass(name, rates.get(name, 0)) for name in PRIORITY_CLASSES}
+        self._run_seconds = 0.0
+        self._throttled_until = 0.0
+        self._throttle_strikes = 0
+        self._condition = threading.Condition()
+        self._workers = [threading.Thread(target=self._work_loop, name=f"llm-executor-{i}", daemon=True)
+                         for i in range(self.max_concurrency)]
+        for worker in self._workers:
+            worker.start()
+
+    # --- Public API -------------------------------------------------------------------------
+
+    def submit(self, func, *args, priority: str = PRIORITY_INTERACTIVE, **kwargs) -> Future:
+        """Queues `func(*args, **kwargs)` in `priority`'s class and returns a Future for its result."""
+        return self._enqueue(lambda: func(*args, **kwargs), priority).future
+
+    def run(self, func, *args, priority: str = PRIORITY_INTERACTIVE, **kwargs):
+        """submit() and wait for the result in the calling thread, giving up if the call is still queued after queue_timeout."""
+        job = self._enqueue(lambda: func(*args, **kwargs), priority)
+        try:
+            return job.future.result(timeout=max(0.0, job.enqueued_at + self.queue_timeout - time.monotonic()))
+        except FutureTimeoutError:
+            if job.future.done():
+                raise # The call itself timed out
+            self._withdraw(job)
+        return job.future.result() # Raises LLMExecutorBusy if withdrawn, else waits for the running call
+
+    def stream(self, make_chunks, priority: str = PRIORITY_INTERACTIVE):
+        """
+        Runs the generator returned by `make_chunks()` in a worker slot and yields its items in the
+        calling thread as they arrive. Closing this generator withdraws the call if it is still queued,
+        or stops the worker at the next item if it is running.
+        """
+        items = queue.Queue()
+        cancelled = threading.Event()
+
+        def produce():
+            if cancelled.is_set():
+                return # The consumer left before a worker got to the call
+            for item in make_chunks():
+                if cancelled.is_set():
+                    return
+                items.put((True, item))
+
+        job = self._enqueue(produce, priority)
+        future = job.future
+        future.add_done_callback(lambda f: items.put((False, f)))
+        try:
+            while True:
+                if future.running() or future.done():
+                    is_item, item = items.get()
+                else:
+                    try:
+                        is_item, item = items.get(timeout=max(0.0, job.enqueued_at + self.queue_timeout - time.monotonic()))
+                    except queue.Empty:
+                        self._withdraw(job) # Its failure, if withdrawn, arrives on the next get
+                        continue
+                if not is_item:
+                    item.result() # Re-raises a failure, including LLMExecutorBusy
+                    return
+                yield item
+        finally:
+            cancelled.set()
+            self._withdraw(job, cancel=True)
+
+    def stats(self) -> dict:
+        with self._condition:
+            completed = sum(cls.completed for cls in self._classes.values())
+            return {
+                "max_concurrency": self.max_concurrency,
+                "interactive_reserved_slots": self.interactive_reserved,
+                "running": self._running(),
+                "queued": self._queued(),
+                "max_queue": self.max_queue,
+                "queue_timeout_seconds": self.queue_timeout,
+                "throttled_for_seconds": round(max(0.0, self._throttled_until - time.monotonic()), 1),
+                "average_run_seconds": round(self._run_seconds / completed, 3) if completed else None,
+                "classes": {name: cls.stats() for name, cls in self._classes.items()},
+            }
+
+    # --- Dispatching ----------------------------------------------------------------------
+
+    def _enqueue(self, func, priority: str) -> _Job:
+        if priority not in self._classes:
+            raise ValueError(f"Unknown priority class '{priority}'. Use one of: {', '.join(PRIORITY_CLASSES)}.")
+        job = _Job(func, Future(), priority)
+        cls = self._classes[priority]
+        with self._condition:
+            now = time.monotonic()
+            if priority != PRIORITY_INTERACTIVE and self._throttled_until > now:
+                cls.shed += 1
+                raise LLMExecutorBusy("LLM provider is throttling; background work is deferred.",
+                                      retry_after=round(self._throttled_until - now, 1))
+            if self._queued() + self._running() >= self.max_queue + self.max_concurrency:
+                cls.rejected += 1
+                raise LLMExecutorBusy(f"LLM queue is full ({self._queued()} waiting).", retry_after=self._estimated_wait())
+            cls.queue.append(job)
+            self._condition.notify_all()
+        return job
+
+    def _withdraw(self, job: _Job, cancel: bool = False):
+        """
+        Removes `job` if it is still queued, failing it with LLMExecutorBusy (or cancelling it when its
+        caller has gone). A job that already started is left alone.
+        """
+        with self._condition:
+            cls = self._classes[job.priority]
+            try:
+                cls.queue.remove(job)
+            except ValueError:
+                return
+            if cancel:
+                cls.cancelled += 1
+                job.future.cancel()
+            else:
+                self._fail_expired(cls, job, time.monotonic())
+
+    def _queued(self) -> int:
+        return sum(len(cls.queue) for cls in self._classes.values())
+
+    def _running(self) -> int:
+        return sum(cls.running for cls in self._classes.values())
+
+    def _estimated_wait(self) -> float:
+        completed = sum(cls.completed for cls in self._classes.values())
+        average_run = self._run_seconds / completed if completed else 5.0
+        return round(average_run * (self._queued() / self.max_concurrency + 1), 1)
+
+    def _expire(self, now: float) -> float:
+        """Fails queued calls that waited past queue_timeout. Returns seconds until the next would expire."""
+        next_expiry = float('inf')
+        for cls in self._classes.values():
+            while cls.queue and now - cls.queue[0].enqueued_at > self.queue_timeout:
+                self._fail_expired(cls, cls.queue.popleft(), now)
+            if cls.queue:
+                next_expiry = min(next_expiry, cls.queue[0].enqueued_at + self.queue_timeout - now)
+        return next_expiry
+
+    def _fail_expired(self, cls: _PriorityClass, job: _Job, now: float):
+        cls.timed_out += 1
+        cls.waits.append(now - job.enqueued_at)
+        job.future.set_exception(LLMExecutorBusy(
+            f"LLM call waited {now - job.enqueued_at:.1f}s for a slot (limit {self.queue_timeout:g}s).",
+            retry_after=self._estimated_wait()))
+
+    def _next_job(self, now: float) -> tuple[_Job | None, float]:
+        """(job to run now, or None and how long to wait before looking again)."""
+        wake_in = self._expire(now)
+        background_running = sum(cls.running for name, cls in self._classes.items() if name != PRIORITY_INTERACTIVE)
+        for name in PRIORITY_CLASSES:
+            cls = self._classes[name]
+            if not cls.queue:
+                continue
+            if name != PRIORITY_INTERACTIVE:
+                if self._throttled_until > now:
+                    wake_in = min(wake_in, self._throttled_until - now)
+                    continue
+                if background_running >= self.max_concurrency - self.interactive_reserved:
+                    continue # Woken when a call finishes
+            token_wait = cls.seconds_until_token(now)
+            if token_wait > 0:
+                wake_in = min(wake_in, token_wait)
+                continue
+            if cls.requests_per_minute:
+                cls.tokens -= 1
+            job = cls.queue.popleft()
+            cls.waits.append(now - job.enqueued_at)
+            return job, 0.0
+        return None, wake_in
+
+    def _work_loop(self):
+        while True:
+            with self._condition:
+                while True:
+                    job, wake_in = self._next_job(time.monotonic())
+                    if job is not None:
+                        break
+                    self._condition.wait(timeout=None if wake_in == float('inf') else max(wake_in, 0.01))
+                cls = self._classes[job.priority]
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+                cls.running += 1
+            started = time.monotonic()
+            try:
+                result = job.func()
+            except BaseException as e:
+                with self._condition:
+                    cls.running -= 1
+                    cls.failed += 1
+                    if any(fragment in str(e).lower() for fragment in _THROTTLE_MESSAGES):
+                        backoff = min(LLM_THROTTLE_BACKOFF_MAX_SECONDS, LLM_THROTTLE_BACKOFF_SECONDS * 2 ** self._throttle_strikes)
+                        self._throttle_strikes += 1
+                        self._throttled_until = max(self._throttled_until, time.monotonic() + backoff)
+                        print(f"LLMExecutor: Provider throttled a {job.priority} call; deferring background work for {backoff:g}s: {e}")
+                    self._condition.notify_all()
+                job.future.set_exception(e)
+                continue
+            with self._condition:
+                cls.running -= 1
+                cls.completed += 1
+                self._run_seconds += time.monotonic() - started
+                self._throttle_strikes = 0
+                self._condition.notify_all()
+            job.future.set_result(result)
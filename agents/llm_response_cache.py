@@ -0,0 +1,182 @@
+import os
+import re
+import sys
+import threading
+import time
+
+import numpy as np
+
+# Allow `from agents...` imports when this file is run directly
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from agents.disk_cache import DiskCache, LRUCache, content_key
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 6 * 3600))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 1000))
+# Set to persist exact-match entries across restarts, e.g. data/llm_cache/responses.sqlite
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH")
+# The semantic tier reuses answers for near-identical prompts; off by default
+LLM_SEMANTIC_CACHE_ENABLED = os.getenv("LLM_SEMANTIC_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+LLM_SEMANTIC_CACHE_THRESHOLD = float(os.getenv("LLM_SEMANTIC_CACHE_THRESHOLD", 0.95))
+LLM_SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("LLM_SEMANTIC_CACHE_MAX_ENTRIES", 500))
+LLM_SEMANTIC_CACHE_MODEL = os.getenv("LLM_SEMANTIC_CACHE_MODEL", 'all-MiniLM-L6-v2')
+
+# Tickers and numbers; prompts that differ in these never share a semantic-cache entry
+_LITERAL_TOKEN_PATTERN = re.compile(r"\b(?:[A-Z]{1,5}(?:\.[A-Z])?|\d[\d,]*(?:\.\d+)?%?)\b")
+
+
+def _literal_tokens(text: str) -> tuple[str, ...]:
+    return tuple(sorted(set(_LITERAL_TOKEN_PATTERN.findall(text))))
+
+
+class _SemanticTier:
+    """
+    Prompt-embedding index per (model, system prompt) with LRU/TTL eviction.
+    A lookup hits when cosine similarity reaches `threshold` and the prompts mention the same
+    tickers and numbers, so "risk for AAPL" never answers "risk for MSFT".
+    """
+
+    def __init__(self, model_name: str, threshold: float, max_entries: int, ttl_seconds: float):
+        self.model_name = model_name
+        self.threshold = threshold
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._model = None
+        self._lock = threading.Lock()
+        # Parallel lists; embeddings are unit length
+        self._scopes, self._literals, self._embeddings, self._responses, self._set_at, self._used_at = [], [], [], [], [], []
+
+    def _embed(self, text: str) -> np.ndarray:
+        if self._model is None:
+            print(f"LLMResponseCache: Loading sentence transformer model: {self.model_name}...")
+            self._model = SentenceTransformer(self.model_name)
+        embedding = np.asarray(self._model.encode([text], convert_to_numpy=True, show_progress_bar=False)[0], dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm > 0 else embedding
+
+    def _drop(self, index: int):
+        for column in (self._scopes, self._literals, self._embeddings, self._responses, self._set_at, self._used_at):
+            del column[index]
+
+    def get(self, scope: str, prompt: str) -> tuple[str | None, np.ndarray]:
+        """(cached response or None, the prompt's embedding for a later set())."""
+        embedding = self._embed(prompt)
+        literals = _literal_tokens(prompt)
+        now = time.monotonic()
+        with self._lock:
+            for index in [i for i, set_at in enumerate(self._set_at) if now - set_at > self.ttl_seconds][::-1]:
+                self._drop(index)
+            candidates = [i for i, (s, l) in enumerate(zip(self._scopes, self._literals)) if s == scope and l == literals]
+            if candidates:
+                similarities = np.stack([self._embeddings[i] for i in candidates]) @ embedding
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    self._used_at[candidates[best]] = now
+                    self.hits += 1
+                    return self._responses[candidates[best]], embedding
+            self.misses += 1
+            return None, embedding
+
+    def set(self, scope: str, prompt: str, embedding: np.ndarray, response: str):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._responses) >= self.max_entries:
+                self._drop(int(np.argmin(self._used_at)))
+            self._scopes.append(scope)
+            self._literals.append(_literal_tokens(prompt))
+            self._embeddings.append(embedding)
+            self._responses.append(response)
+            self._set_at.append(now)
+            self._used_at.append(now)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._responses),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+class LLMResponseCache:
+    """
+    Two-tier cache of LLM responses.
+
+    - Exact tier: keyed by a hash of (model, system prompt, prompt). In memory with LRU/TTL eviction,
+      or in SQLite when LLM_CACHE_PATH is set so entries survive restarts.
+    - Semantic tier (optional, needs sentence_transformers): reuses the response to a near-identical
+      earlier prompt for the same model and system prompt.
+    """
+
+    def __init__(self, ttl_seconds: float = LLM_CACHE_TTL, max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 db_path: str | None = LLM_CACHE_PATH, semantic: bool = LLM_SEMANTIC_CACHE_ENABLED):
+        if db_path:
+            self.exact = DiskCache(db_path, ttl_seconds, max_entries, name="LLMResponseCache")
+        else:
+            self.exact = LRUCache(max_entries, ttl_seconds)
+        self.semantic = None
+        if semantic:
+            if SentenceTransformer is None:
+                print("LLMResponseCache: sentence_transformers is not installed; semantic cache disabled.")
+            else:
+                self.semantic = _SemanticTier(LLM_SEMANTIC_CACHE_MODEL, LLM_SEMANTIC_CACHE_THRESHOLD,
+                                              LLM_SEMANTIC_CACHE_MAX_ENTRIES, ttl_seconds)
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def lookup(self, model: str, system_prompt: str | None, prompt: str) -> tuple[str | None, str | None, dict]:
+        """
+        Returns (response, tier, state): tier is "exact", "semantic" or None on a miss.
+        Pass `state` back to store() after calling the LLM.
+        """
+        key = content_key(model, system_prompt or "", prompt)
+        state = {"key": key, "scope": content_key(model, system_prompt or "")}
+        cached = self.exact.get(key)
+        if cached is not None:
+            return cached["response"], "exact", state
+        if self.semantic:
+            try:
+                response, state["embedding"] = self.semantic.get(state["scope"], prompt)
+                if response is not None:
+                    return response, "semantic", state
+            except Exception as e:
+                print(f"LLMResponseCache: Semantic lookup failed, disabling the semantic tier: {e}")
+                self.semantic = None
+        return None, None, state
+
+    def store(self, state: dict, prompt: str, response: str, llm_seconds: float):
+        with self._lock:
+            self.llm_calls += 1
+            self.llm_seconds += llm_seconds
+        self.exact.set(state["key"], {"response": response})
+        if self.semantic and state.get("embedding") is not None:
+            self.semantic.set(state["scope"], prompt, state["embedding"], response)
+
+    def stats(self) -> dict:
+        exact = self.exact.stats()
+        semantic = self.semantic.stats() if self.semantic else None
+        hits = exact["hits"] + (semantic["hits"] if semantic else 0)
+        requests = exact["hits"] + exact["misses"]
+        average_llm_seconds = self.llm_seconds / self.llm_calls if self.llm_calls else None
+        return {
+            "exact": exact,
+            "semantic": semantic,
+            "hit_rate": round(hits / requests, 4) if requests else None,
+            "llm_calls": self.llm_calls,
+            "average_llm_seconds": round(average_llm_seconds, 3) if average_llm_seconds is not None else None,
+            "estimated_seconds_saved": round(hits * average_llm_seconds, 1) if average_llm_seconds is not None else None,
+        }
@@ -0,0 +1,207 @@
+import io
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+try:
+    import pyarrow as pa # Optional; enables the Arrow IPC wire format
+except ImportError:
+    pa = None
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MARKET_DATA_DIR = os.path.join(PROJECT_ROOT, 'data', 'market_data')
+
+BAR_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+# Alpha Vantage TIME_SERIES_DAILY keys for each bar field
+ALPHA_VANTAGE_FIELDS = {'open': '1. open', 'high': '2. high', 'low': '3. low', 'close': '4. close', 'volume': '5. volume'}
+
+MARKET_TIMEZONE = ZoneInfo("America/New_York")
+# Alpha Vantage publishes the day's bar shortly after the 16:00 ET close
+MARKET_DATA_READY_TIME = (16, 30)
+# A symbol checked this recently is not re-requested even if the expected bar is missing
+MARKET_DATA_RECHECK_SECONDS = int(os.getenv("MARKET_DATA_RECHECK_SECONDS", 3600))
+
+
+def latest_trading_day(now: datetime | None = None) -> date:
+    """
+    Most recent weekday whose daily bar should be published by now (US/Eastern).
+    Exchange holidays are not modelled; MarketDataStore.is_fresh() covers them via the last check time.
+    """
+    now = (now or datetime.now(tz=MARKET_TIMEZONE)).astimezone(MARKET_TIMEZONE)
+    day = now.date()
+    if (now.hour, now.minute) < MARKET_DATA_READY_TIME:
+        day -= timedelta(days=1)
+    while day.weekday() >= 5: # Saturday/Sunday
+        day -= timedelta(days=1)
+    return day
+
+
+def bars_from_alpha_vantage(data: dict) -> dict:
+    """
+    Converts Alpha Vantage's {date: {"1. open": "...", ...}} structure into columnar
+    arrays sorted by date: {"dates": datetime64[D], "open": float64, ...}.
+    """
+    dates = sorted(data.keys())
+    bars = {"dates": np.array(dates, dtype='datetime64[D]')}
+    for field, av_key in ALPHA_VANTAGE_FIELDS.items():
+        bars[field] = np.array([float(data[d].get(av_key, 'nan')) for d in dates], dtype=np.float64)
+    return bars
+
+
+def bars_to_alpha_vantage(bars: dict, limit: int | None = None) -> dict:
+    """Inverse of bars_from_alpha_vantage: newest-first {date: {"1. open": "...", ...}}, optionally the last `limit` days."""
+    count = len(bars["dates"])
+    start = max(0, count - limit) if limit else 0
+    data = {}
+    for i in range(count - 1, start - 1, -1):
+        data[str(bars["dates"][i])] = {
+            "1. open": f"{bars['open'][i]:.4f}",
+            "2. high": f"{bars['high'][i]:.4f}",
+            "3. low": f"{bars['low'][i]:.4f}",
+            "4. close": f"{bars['close'][i]:.4f}",
+            "5. volume": f"{bars['volume'][i]:.0f}",
+        }
+    return data
+
+
+def bars_from_columnar(payload: dict) -> dict:
+    """Inverse of bars_to_columnar: {"dates": [...], "open": [...], ...} lists back into NumPy columns."""
+    bars = {"dates": np.array(payload["dates"], dtype='datetime64[D]')}
+    for field in BAR_FIELDS:
+        bars[field] = np.array([np.nan if v is None else v for v in payload[field]], dtype=np.float64)
+    return bars
+
+
+def slice_bars(bars: dict, start: date | None = None, end: date | None = None, limit: int | None = None) -> dict:
+    """
+    Bars with start <= date <= end (inclusive), found by binary search on the sorted date column,
+    optionally capped to the last `limit` rows.
+    """
+    dates = bars["dates"]
+    lo = int(np.searchsorted(dates, np.datetime64(start, 'D'), side='left')) if start else 0
+    hi = int(np.searchsorted(dates, np.datetime64(end, 'D'), side='right')) if end else len(dates)
+    if limit:
+        lo = max(lo, hi - limit)
+    return {name: bars[name][lo:hi] for name in ("dates",) + BAR_FIELDS}
+
+
+def bars_to_columnar(bars: dict) -> dict:
+    """JSON-ready parallel arrays, oldest first: {"dates": ["YYYY-MM-DD", ...], "open": [float, ...], ...}."""
+    columnar = {"dates": np.datetime_as_string(bars["dates"], unit='D').tolist()}
+    for field in BAR_FIELDS:
+        values = bars[field]
+        # JSON has no NaN; missing values become null
+        columnar[field] = [None if v != v else v for v in values.tolist()] if np.isnan(values).any() else values.tolist()
+    return columnar
+
+
+def bars_to_npz_bytes(bars: dict) -> bytes:
+    """The bars as an uncompressed .npz archive (datetime64[D] dates, float64 OHLCV)."""
+    buffer = io.BytesIO()
+    np.savez(buffer, **{name: bars[name] for name in ("dates",) + BAR_FIELDS})
+    return buffer.getvalue()
+
+
+def bars_to_arrow_ipc(bars: dict) -> bytes:
+    """The bars as an Arrow IPC stream (date32 'date' column plus float64 OHLCV). Requires pyarrow."""
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed; the Arrow format is unavailable.")
+    table = pa.table({"date": pa.array(bars["dates"].astype('datetime64[D]'), type=pa.date32()),
+                      **{field: pa.array(bars[field], type=pa.float64()) for field in BAR_FIELDS}})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+class MarketDataStore:
+    """
+    Local columnar store of daily bars, one .npz file per symbol holding a datetime64 date
+    column, float64 OHLCV columns and the time the symbol was last checked against the provider.
+    Loaded symbols are kept in memory and reloaded only when the file changes.
+    """
+
+    def __init__(self, data_dir: str | None = None):
+        self.data_dir = data_dir or os.getenv("MARKET_DATA_DIR", DEFAULT_MARKET_DATA_DIR)
+        os.makedirs(self.data_dir, exist_ok=True)
+        self._memory = {} # symbol -> (file mtime, bars)
+        self._lock = threading.Lock()
+
+    def _path(self, symbol: str) -> str:
+        return os.path.join(self.data_dir, f"{symbol.upper()}.npz")
+
+    def load(self, symbol: str) -> dict | None:
+        """Returns {"dates", "open", "high", "low", "close", "volume", "checked_at"} or None if the symbol is unknown."""
+        path = self._path(symbol)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+        cached = self._memory.get(symbol.upper())
+        if cached and cached[0] == mtime:
+            return cached[1]
+        try:
+            with np.load(path) as npz:
+                bars = {name: npz[name] for name in ("dates",) + BAR_FIELDS}
+                bars["checked_at"] = float(npz["checked_at"])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"MarketDataStore: Ignoring unreadable store file {path}: {e}")
+            return None
+        with self._lock:
+            self._memory[symbol.upper()] = (mtime, bars)
+        return bars
+
+    def save(self, symbol: str, bars: dict):
+        path = self._path(symbol)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, checked_at=np.float64(bars.get("checked_at", time.time())), **{name: bars[name] for name in ("dates",) + BAR_FIELDS})
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._memory[symbol.upper()] = (os.path.getmtime(path), bars)
+
+    def merge(self, symbol: str, new_bars: dict) -> tuple[dict, int]:
+        """
+        Appends bars newer than the last stored date, stamps the check time and saves.
+        Returns (merged bars, number of new rows).
+        """
+        existing = self.load(symbol)
+        if existing is None or len(existing["dates"]) == 0:
+            merged = {name: new_bars[name] for name in ("dates",) + BAR_FIELDS}
+            added = len(merged["dates"])
+        else:
+            newer = new_bars["dates"] > existing["dates"][-1]
+            merged = {name: np.concatenate([existing[name], new_bars[name][newer]]) for name in ("dates",) + BAR_FIELDS}
+            added = int(newer.sum())
+        merged["checked_at"] = time.time()
+        self.save(symbol, merged)
+        return merged, added
+
+    def latest_date(self, symbol: str) -> date | None:
+        bars = self.load(symbol)
+        if bars is None or len(bars["dates"]) == 0:
+            return None
+        return bars["dates"][-1].astype(date)
+
+    def is_fresh(self, symbol: str, now: datetime | None = None) -> bool:
+        """
+        True when the latest trading day's bar is stored, or when the provider was checked
+        within the last MARKET_DATA_RECHECK_SECONDS (covers exchange holidays and late publication).
+        """
+        bars = self.load(symbol)
+        if bars is None or len(bars["dates"]) == 0:
+            return False
+        if bars["dates"][-1].astype(date) >= latest_trading_day(now):
+            return True
+        return time.time() - bars["checked_at"] < MARKET_DATA_RECHECK_SECONDS
+
+    def missing_trading_days(self, symbol: str, now: datetime | None = None) -> int | None:
+        """Weekdays between the last stored bar and the latest trading day, or None if nothing is stored."""
+        last = self.latest_date(symbol)
+        if last is None:
+            return None
+        return int(np.busday_count(last + timedelta(days=1), latest_trading_day(now) + timedelta(days=1)))
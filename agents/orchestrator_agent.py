@@ -1,4 +1,5 @@
 import os
+import sys
 import requests
 import json
 from dotenv import load_dotenv
@@ -6,8 +7,26 @@ from typing import Dict, Any, List
 
 # Add project root to sys.path to allow importing other agents if necessary (though direct import is unlikely here)
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from agents.indicators import compute_indicators
 # load_dotenv(os.path.join(PROJECT_ROOT, '.env')) # .env loading will be handled by the service
 
+# Query words that name a region or sector of the holdings (see agents/holdings_store.py)
+REGION_ALIASES = {
+    "ASIA": "Asia", "ASIAN": "Asia", "EUROPE": "Europe", "EUROPEAN": "Europe",
+    "LATAM": "Latin America",
+}
+SECTOR_ALIASES = {
+    "TECH": "Technology", "TECHNOLOGY": "Technology", "SEMICONDUCTOR": "Technology", "SEMICONDUCTORS": "Technology",
+    "FINANCE": "Financials", "FINANCIAL": "Financials", "FINANCIALS": "Financials", "BANKS": "Financials",
+    "ENERGY": "Energy", "HEALTHCARE": "Health Care", "PHARMA": "Health Care",
+    "UTILITIES": "Utilities", "TELECOM": "Communication Services",
+}
+# Cap on holdings pulled into a region/sector query, largest positions first
+EXPOSURE_MAX_TICKERS = int(os.getenv("EXPOSURE_MAX_TICKERS", 20))
+
 class OrchestratorAgent:
     def __init__(self):
         print("Initializing OrchestratorAgent...")
@@ -57,6 +76,33 @@ class OrchestratorAgent:
             print(f"An unexpected error occurred when calling {url}: {e}")
             return {"error": str(e), "status_code": 500}
 
+    def _summarize_market_data(self, market_data_results: Dict[str, Any], stale_tickers: set) -> Dict[str, Dict[str, Any]]:
+        """
+        Reduces each ticker's daily series to a fixed-size feature record, in one vectorised pass,
+        so only these records (not the series) go to the Analysis Service and into the LLM prompt.
+        """
+        if not market_data_results:
+            return {}
+        stats_by_ticker = compute_indicators(market_data_results, benchmark=None)
+        summaries = {}
+        for ticker, stats in stats_by_ticker.items():
+            return_1d = stats.get("return_1d")
+            summaries[ticker] = {
+                "symbol": ticker,
+                "as_of": stats.get("as_of"),
+                "last_close": stats.get("close"),
+                "change_percent": f"{return_1d * 100:.2f}%" if return_1d is not None else None,
+                "return_1d": return_1d,
+                "return_5d": stats.get("return_5d"),
+                "return_20d": stats.get("return_20d"),
+                "volatility_annualized": stats.get("volatility_annualized"),
+                "drawdown_current": stats.get("drawdown_current"),
+                "drawdown_max": stats.get("drawdown_max"),
+                "risk_flags": stats.get("risk_flags", []),
+                "stale": ticker in stale_tickers,
+            }
+        return summaries
+
     def _parse_user_query(self, user_query: str) -> Dict[str, Any]:
         """
         Uses LanguageService to understand the user query, identify entities, intent, etc.
@@ -69,7 +115,8 @@ class OrchestratorAgent:
             "tickers": [],
             "keywords": [],
             "intent": "general_financial_query", 
-            "target_info": ["risk", "earnings"]
+            "target_info": ["risk", "earnings"],
+            "exposure_filter": None
         }
         
         upper_user_query = user_query.upper()
@@ -86,9 +133,15 @@ class OrchestratorAgent:
             "HOW", "WHY", "WHEN", "WHERE", "WHICH", "WHO", "WILL", "CAN", "COULD", "SHOULD", "WOULD",
             "ME", "MY", "MINE", "YOUR", "YOURS", "HIM", "HIS", "HER", "HERS", "ITS", "WE", "US",
             "THEM", "THEIR", "THEIRS", "THIS", "THAT", "THESE", "THOSE", "A", "AN", "IN", "ON", "AT",
-            "OF", "TO", "WITH", "BY", "AS", "BE", "HAS", "HAVE", "HAD", "DO", "DOES", "DID", "NOT"
+            "OF", "TO", "WITH", "BY", "AS", "BE", "HAS", "HAVE", "HAD", "DO", "DOES", "DID", "NOT",
+            # Contractions, once the apostrophe is stripped ("What's" -> WHATS)
+            "WHATS", "WHATRE", "HOWS", "WHERES", "WHOS", "THATS", "THERES", "LETS", "IM", "IVE", "WEVE", "WERE",
+            "DONT", "DOESNT", "DIDNT", "ISNT", "ARENT", "WONT", "CANT",
+            "ALL", "ABOUT", "SHOW", "GIVE", "LATEST", "BRIEF", "HOLDINGS", "POSITIONS", "EXPOSED"
             # Add more common words or context-specific non-tickers as needed
         }
+        # Region/sector words are resolved against the holdings below, never read as tickers
+        NON_TICKER_WORDS |= set(REGION_ALIASES) | set(SECTOR_ALIASES)
 
         potential_tickers = []
         words = upper_user_query.split()
@@ -111,6 +164,13 @@ class OrchestratorAgent:
 
         if not parsed_elements["tickers"] and "ASIA TECH" in upper_user_query:
             parsed_elements["keywords"].append("asia tech stocks")
+
+        # Region/sector phrases ("Asia tech") are resolved against the holdings in process_query
+        query_words = {''.join(filter(str.isalnum, word)) for word in words}
+        region = next((REGION_ALIASES[w] for w in query_words if w in REGION_ALIASES), None)
+        sector = next((SECTOR_ALIASES[w] for w in query_words if w in SECTOR_ALIASES), None)
+        if region or sector:
+            parsed_elements["exposure_filter"] = {"region": region, "sector": sector}
         
         print(f"Orchestrator: Parsed query elements: {parsed_elements}")
         return parsed_elements
@@ -129,45 +189,86 @@ class OrchestratorAgent:
         tickers = parsed_query.get("tickers", [])
         keywords_for_retrieval = parsed_query.get("keywords", []) + tickers # Use keywords and tickers for retrieval
 
+        # Step 0: Resolve a region/sector query ("Asia tech") into the matching holdings.
+        # Leftover candidate tickers are kept only if they are among those holdings, since
+        # capitalised query words are not reliable tickers.
+        holdings_weights = None
+        exposure = None
+        exposure_filter = parsed_query.get("exposure_filter")
+        if exposure_filter:
+            print(f"Orchestrator: Resolving holdings exposure for {exposure_filter}...")
+            exposure_response = self._call_service(
+                f"{self.api_service_url}/holdings/exposure",
+                params={k: v for k, v in exposure_filter.items() if v}
+            )
+            if isinstance(exposure_response, dict) and not exposure_response.get("error") and isinstance(exposure_response.get("holdings"), list):
+                exposure = {k: v for k, v in exposure_response.items() if k != "holdings"}
+                held = {h["ticker"]: h for h in exposure_response["holdings"]}
+                dropped = [ticker for ticker in tickers if ticker not in held]
+                if dropped:
+                    print(f"Orchestrator: Ignoring query words that are not holdings in {exposure_filter}: {', '.join(dropped)}")
+                top_holdings = exposure_response["holdings"][:EXPOSURE_MAX_TICKERS]
+                tickers = list(dict.fromkeys([h["ticker"] for h in top_holdings] + [t for t in tickers if t in held]))
+                holdings_weights = {t: held[t]["portfolio_weight"] for t in tickers if held[t].get("portfolio_weight")}
+                keywords_for_retrieval = list(dict.fromkeys([k for k in keywords_for_retrieval if k not in dropped] + tickers))
+                print(f"Orchestrator: Exposure {exposure.get('exposure_pct')}% of the portfolio across {len(exposure_response['holdings'])} holdings.")
+            else:
+                print(f"Orchestrator: Failed to resolve holdings exposure: {exposure_response.get('error', 'Unknown error') if isinstance(exposure_response, dict) else 'No response'}")
+
         # Step 1: Gather Data
         market_data_results = {}
+        stale_tickers = set()
         news_articles_content = []
         sec_filings_content = []
         retrieved_docs_content = []
 
-        # 1.1 Get stock data for identified tickers
+        # 1.1 Get stock data for all identified tickers in one batch call
+        tickers = [ticker for ticker in tickers if ticker]
         if not tickers:
             print("Orchestrator: No tickers identified. Skipping stock data fetch.")
-        for ticker in tickers:
-            if not ticker: 
-                print("Orchestrator: Encountered an empty ticker string. Skipping this iteration.")
-                continue 
-
-            target_url = f"{self.api_service_url}/{ticker}"  # MODIFIED: Removed /stock/ prefix again
-            print(f"Orchestrator: Attempting to fetch stock data for ticker '{ticker}' from URL: {target_url}")
-            stock_data = self._call_service(target_url)
-            if stock_data and not stock_data.get("error"):
-                market_data_results[ticker] = stock_data.get("data", stock_data) # API might return {'data': ...}
+        else:
+            target_url = f"{self.api_service_url}/batch"
+            print(f"Orchestrator: Attempting to fetch stock data for {', '.join(tickers)} from URL: {target_url}")
+            stock_response = self._call_service(target_url, params={"symbols": ",".join(tickers), "format": "columnar"})
+            if isinstance(stock_response, dict) and not stock_response.get("error") and isinstance(stock_response.get("results"), list):
+                for stock_data in stock_response["results"]:
+                    ticker = stock_data.get("symbol", "N/A")
+                    if stock_data.get("error"):
+                        print(f"Orchestrator: Failed to get stock data for {ticker}: {stock_data['error']}")
+                        continue
+                    if stock_data.get("stale"):
+                        print(f"Orchestrator: Stock data for {ticker} is stale (Alpha Vantage quota exhausted).")
+                        stale_tickers.add(ticker)
+                    market_data_results[ticker] = stock_data.get("data", {})
             else:
-                print(f"Orchestrator: Failed to get stock data for {ticker}: {stock_data.get('error', 'Unknown error') if stock_data else 'No response'}")
-
-        # 1.2 Get SEC filings for identified tickers
-        for ticker in tickers:
-            print(f"Orchestrator: Fetching SEC filings for {ticker}...")
-            filings_response = self._call_service(f"{self.scraping_service_url}/scrape/filings/{ticker}") # Renamed to avoid conflict
-            if filings_response and not filings_response.get("error") and isinstance(filings_response.get("filings"), list):
-                filings_list = filings_response.get("filings", [])
-                for filing_item in filings_list:
-                    if isinstance(filing_item, dict):
-                        # Construct a descriptive string from metadata
-                        desc = filing_item.get("description", "N/A")
-                        form = filing_item.get("form_type", "N/A")
-                        date = filing_item.get("filing_date", "N/A")
-                        url = filing_item.get("document_url", "#")
-                        sec_filings_content.append(f"Filing for {ticker} ({form} on {date}): {desc}. URL: {url}")
-                print(f"Orchestrator: Processed {len(filings_list)} filing metadata entries for {ticker}.")
+                print(f"Orchestrator: Failed to get stock data: {stock_response.get('error', 'Unknown error') if isinstance(stock_response, dict) else 'No response'}")
+
+        # 1.2 Get SEC filings for all identified tickers in one batch call
+        if tickers:
+            print(f"Orchestrator: Fetching SEC filings for {', '.join(tickers)}...")
+            filings_response = self._call_service(
+                f"{self.scraping_service_url}/scrape/filings/batch",
+                method="POST",
+                json_payload={"tickers": tickers}
+            )
+            if isinstance(filings_response, dict) and not filings_response.get("error") and isinstance(filings_response.get("results"), list):
+                for ticker_filings in filings_response["results"]:
+                    ticker = ticker_filings.get("ticker", "N/A")
+                    if ticker_filings.get("error"):
+                        print(f"Orchestrator: Failed to get SEC filings for {ticker}: {ticker_filings['error']}")
+                        continue
+                    filings_list = ticker_filings.get("filings", [])
+                    for filing_item in filings_list:
+                        if isinstance(filing_item, dict):
+                            # Construct a descriptive string from metadata
+                            desc = filing_item.get("description", "N/A")
+                            form = filing_item.get("form_type", "N/A")
+                            date = filing_item.get("filing_date", "N/A")
+                            url = filing_item.get("document_url", "#")
+                            sec_filings_content.append(f"Filing for {ticker} ({form} on {date}): {desc}. URL: {url}")
+                    print(f"Orchestrator: Processed {len(filings_list)} filing metadata entries for {ticker}.")
             else:
-                print(f"Orchestrator: Failed to get SEC filings for {ticker}: {filings_response.get('error', 'Unknown error') if filings_response else 'No response'}")
+                print(f"Orchestrator: Failed to get SEC filings: {filings_response.get('error', 'Unknown error') if isinstance(filings_response, dict) else 'No response'}")
 
         # 1.3 Retrieve relevant documents/news from Vector Store using keywords
         if keywords_for_retrieval:
@@ -191,19 +292,38 @@ class OrchestratorAgent:
         news_articles_content.extend(retrieved_docs_content)
 
         # Step 2: Analyze Data
-        # Consolidate market info for analysis. For simplicity, if multiple tickers,
-        # we might pass them separately or focus on the primary one.
-        # Here, we'll pass all gathered text and the first ticker's market info if available.
-        analysis_input_market_info = market_data_results.get(tickers[0]) if tickers and market_data_results else None # MODIFIED: ensure market_data_results is not empty
-        
+        # Reduce each series to a small summary record; the raw series never leaves the orchestrator.
+        # The first ticker's summary is the market info for the analysis; all summaries go to the LLM.
+        market_summaries = self._summarize_market_data(market_data_results, stale_tickers)
+        analysis_input_market_info = market_summaries.get(tickers[0]) if tickers else None
+
+        # 1.4 Portfolio risk for risk-exposure queries: the resolved holdings at their portfolio weights,
+        # otherwise the identified tickers as an equal-weight book
+        portfolio_risk = None
+        if tickers and "risk" in parsed_query.get("keywords", []):
+            holdings = holdings_weights or {ticker: 1.0 / len(tickers) for ticker in tickers}
+            print(f"Orchestrator: Evaluating portfolio risk for {', '.join(tickers)}...")
+            risk_response = self._call_service(
+                f"{self.api_service_url}/risk/portfolio",
+                method="POST",
+                json_payload={"holdings": holdings}
+            )
+            if isinstance(risk_response, dict) and not risk_response.get("error"):
+                portfolio_risk = risk_response
+                if exposure:
+                    portfolio_risk["exposure"] = exposure
+            else:
+                print(f"Orchestrator: Failed to evaluate portfolio risk: {risk_response.get('error', 'Unknown error') if isinstance(risk_response, dict) else 'No response'}")
+
         print(f"Orchestrator: Sending data to AnalysisService. News: {len(news_articles_content)}, Filings: {len(sec_filings_content)}")
         analysis_payload = {
             "market_info": analysis_input_market_info,
             "news_articles": news_articles_content,
             "company_filings": sec_filings_content,
-            "company_ticker": tickers[0] if tickers else None
+            "company_ticker": tickers[0] if tickers else None,
+            "portfolio_risk": portfolio_risk
         }
-        print(f"Orchestrator: Analysis payload: {json.dumps(analysis_payload, indent=2)}") # ADDED: Log the payload
+        print(f"Orchestrator: Analysis payload: {json.dumps(analysis_payload, separators=(',', ':'))}") # ADDED: Log the payload
         analysis_result = self._call_service(
             f"{self.analysis_service_url}/analysis/market_data",
             method="POST",
@@ -218,7 +338,9 @@ class OrchestratorAgent:
         # final_context_for_llm = f"User Query: {user_query}\\n\\nAnalysis Results:\\n" # Original context building
         # final_context_for_llm += json.dumps(analysis_result, indent=2) # Original context building
 
-        analysis_result_str = json.dumps(analysis_result, indent=2)
+        # Compact JSON: indentation only costs prompt tokens
+        analysis_result_str = json.dumps(analysis_result, separators=(",", ":"))
+        market_summaries_str = json.dumps(list(market_summaries.values()), separators=(",", ":"))
 
         # This prompt asks the LLM to synthesize a direct answer based on the analysis.
         llm_prompt = (
@@ -227,6 +349,8 @@ class OrchestratorAgent:
             f"User Query: '{user_query}'\\n\\n"
             f"Analysis Results (JSON):\\n"
             f"{analysis_result_str}\\n\\n"
+            f"Market Summaries (JSON, returns and drawdowns as fractions):\\n"
+            f"{market_summaries_str}\\n\\n"
             f"Instructions for response generation:\\n"
             f"- Pay close attention to all sections of the Analysis Results, especially the 'earnings_analysis' section. "
             f"Within 'earnings_analysis', use the 'summary_status', 'confidence', and 'details' fields.\\n"
@@ -290,6 +414,19 @@ if __name__ == '__main__':
         print(f".env file not found at {dotenv_path}. Service URLs might use defaults or be missing for direct test.")
 
     agent = OrchestratorAgent()
+
+    # Region/sector queries must reach the holdings exposure path rather than yield words as tickers
+    for query, expected_filter in [
+        ("What's our risk exposure in Asia tech stocks today?", {"region": "Asia", "sector": "Technology"}),
+        ("What’s our risk exposure in Asia tech stocks today, and highlight any earnings surprises?", {"region": "Asia", "sector": "Technology"}),
+        ("Exposure to Asian semiconductors", {"region": "Asia", "sector": "Technology"}),
+        ("risk in European banks", {"region": "Europe", "sector": "Financials"}),
+    ]:
+        parsed = agent._parse_user_query(query)
+        assert parsed["tickers"] == [], f"{query!r} parsed tickers {parsed['tickers']}"
+        assert parsed["exposure_filter"] == expected_filter, f"{query!r} parsed filter {parsed['exposure_filter']}"
+    print("Query parsing checks passed.")
+
     # Example of how you might call it (requires services to be running)
     # import asyncio
     # user_query_example = "What’s our risk exposure in MSFT today, and highlight any earnings surprises?"
@@ -0,0 +1,183 @@
+import os
+import sys
+import threading
+from statistics import NormalDist
+
+import numpy as np
+
+# Allow `from agents...` imports when this file is run directly
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from agents.indicators import align_bars, TRADING_DAYS_PER_YEAR
+from agents.market_data_store import latest_trading_day
+
+RISK_LOOKBACK_DAYS = int(os.getenv("RISK_LOOKBACK_DAYS", 252))
+RISK_CONFIDENCE = float(os.getenv("RISK_CONFIDENCE", 0.95))
+RISK_CACHE_MAX_ENTRIES = 8
+
+
+class _ReturnsModel:
+    """Daily returns matrix and covariance for a symbol universe, as of one trading day."""
+
+    def __init__(self, symbols: list[str], returns: np.ndarray):
+        self.symbols = symbols
+        self.positions = {symbol: i for i, symbol in enumerate(symbols)}
+        self.returns = returns # (days, symbols), missing days filled with 0
+        self.mean = returns.mean(axis=0) if len(returns) else np.zeros(len(symbols))
+        self.covariance = np.cov(returns, rowvar=False, ddof=1).reshape(len(symbols), len(symbols)) if len(returns) > 1 else np.zeros((len(symbols), len(symbols)))
+
+    def covers(self, symbols) -> bool:
+        return all(symbol in self.positions for symbol in symbols)
+
+    def select(self, symbols: list[str]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(returns, mean, covariance) restricted to `symbols`, in that order."""
+        idx = np.array([self.positions[symbol] for symbol in symbols], dtype=np.intp)
+        return self.returns[:, idx], self.mean[idx], self.covariance[np.ix_(idx, idx)]
+
+
+def returns_matrix(bars_by_symbol: dict, lookback: int = RISK_LOOKBACK_DAYS) -> tuple[list[str], np.ndarray]:
+    """
+    Aligned simple daily returns for the last `lookback` days, shape (days, symbols).
+    Days on which a symbol has no bar contribute a 0 return for it.
+    """
+    symbols, _, matrices = align_bars(bars_by_symbol)
+    close = matrices["close"][-(lookback + 1):]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = close[1:] / close[:-1] - 1.0
+    return symbols, np.nan_to_num(returns, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+class PortfolioRiskEngine:
+    """
+    Parametric and historical VaR/CVaR with per-name risk contributions.
+
+    Returns and the covariance matrix are cached per (trading day, lookback). A request whose
+    symbols are all in a cached universe is evaluated by slicing the cached matrices, so repeated
+    and overlapping portfolios on the same day cost only a few small matrix products.
+    """
+
+    def __init__(self, bars_loader, lookback: int = RISK_LOOKBACK_DAYS):
+        """
+        Args:
+            bars_loader: callable(symbols) -> ({symbol: bars}, errors), e.g. api_agent.get_daily_bars_batch.
+        """
+        self.bars_loader = bars_loader
+        self.lookback = lookback
+        self._models = {} # (trading day, lookback) -> list of _ReturnsModel
+        self._lock = threading.Lock()
+
+    def _model_for(self, symbols: list[str]) -> tuple[_ReturnsModel, list[dict]]:
+        key = (latest_trading_day(), self.lookback)
+        with self._lock:
+            # Entries from earlier trading days are stale as soon as the day rolls over
+            for old_key in [k for k in self._models if k != key]:
+                del self._models[old_key]
+            for model in self._models.get(key, []):
+                if model.covers(symbols):
+                    return model, []
+
+        bars_by_symbol, errors = self.bars_loader(symbols)
+        model = _ReturnsModel(*returns_matrix(bars_by_symbol, self.lookback))
+        with self._lock:
+            models = self._models.setdefault(key, [])
+            models.append(model)
+            del models[:-RISK_CACHE_MAX_ENTRIES]
+        return model, errors
+
+    def evaluate(self, holdings: dict, confidence: float = RISK_CONFIDENCE, horizon_days: int = 1,
+                 portfolio_value: float | None = None) -> dict:
+        """
+        Args:
+            holdings (dict): {symbol: weight}. Weights are fractions of the portfolio (negative for shorts);
+                             they are not renormalised.
+            confidence (float): VaR/CVaR confidence level, e.g. 0.95.
+            horizon_days (int): Horizon; parametric figures scale by sqrt(horizon), historical ones use
+                                overlapping horizon-day returns.
+            portfolio_value (float | None): If given, VaR/CVaR are also reported in currency.
+
+        Returns:
+            dict: Portfolio volatility, parametric and historical VaR/CVaR (as positive loss fractions),
+                  per-position marginal and component risk, and any symbols that could not be priced.
+        """
+        if not 0 < confidence < 1:
+            raise ValueError("confidence must be between 0 and 1.")
+        weights_by_symbol = {}
+        for symbol, weight in holdings.items():
+            weights_by_symbol[symbol.strip().upper()] = weights_by_symbol.get(symbol.strip().upper(), 0.0) + float(weight)
+        if not weights_by_symbol:
+            raise ValueError("No holdings provided.")
+
+        model, errors = self._model_for(list(weights_by_symbol))
+        priced = [symbol for symbol in weights_by_symbol if symbol in model.positions]
+        unpriced = [symbol for symbol in weights_by_symbol if symbol not in model.positions]
+        if not priced:
+            return {"error": "No price history available for any holding.", "unpriced_symbols": unpriced, "errors": errors}
+
+        returns, mean, covariance = model.select(priced)
+        weights = np.array([weights_by_symbol[symbol] for symbol in priced])
+        horizon_days = max(1, int(horizon_days))
+
+        # Parametric (variance-covariance) figures
+        sigma_w = covariance @ weights
+        variance = float(weights @ sigma_w)
+        volatility = np.sqrt(max(variance, 0.0))
+        horizon_volatility = volatility * np.sqrt(horizon_days)
+        horizon_mean = float(weights @ mean) * horizon_days
+        normal = NormalDist()
+        z = normal.inv_cdf(confidence)
+        parametric_var = z * horizon_volatility - horizon_mean
+        parametric_cvar = horizon_volatility * normal.pdf(z) / (1 - confidence) - horizon_mean
+
+        # Historical simulation on the portfolio's own return series
+        portfolio_returns = returns @ weights
+        if horizon_days > 1 and len(portfolio_returns) >= horizon_days:
+            growth = np.cumprod(np.concatenate([[1.0], 1.0 + portfolio_returns]))
+            portfolio_returns = growth[horizon_days:] / growth[:-horizon_days] - 1.0
+        losses = -portfolio_returns
+        if len(losses):
+            historical_var = float(np.quantile(losses, confidence))
+            historical_cvar = float(losses[losses >= historical_var].mean())
+        else:
+            historical_var = historical_cvar = None
+
+        # Euler decomposition: component contributions sum to the portfolio volatility
+        marginal = sigma_w / volatility if volatility > 0 else np.zeros_like(weights)
+        component = weights * marginal
+        positions = [
+            {
+                "symbol": symbol,
+                "weight": round(float(weights[i]), 6),
+                "volatility_annualized": round(float(np.sqrt(max(covariance[i, i], 0.0)) * np.sqrt(TRADING_DAYS_PER_YEAR)), 6),
+                "marginal_volatility": round(float(marginal[i]), 8),
+                "component_volatility": round(float(component[i]), 8),
+                "component_var": round(float(component[i] * z * np.sqrt(horizon_days)), 8),
+                "risk_contribution_pct": round(float(component[i] / volatility * 100), 4) if volatility > 0 else None,
+            }
+            for i, symbol in enumerate(priced)
+        ]
+        positions.sort(key=lambda p: p["component_volatility"], reverse=True)
+
+        result = {
+            "as_of": str(latest_trading_day()),
+            "confidence": confidence,
+            "horizon_days": horizon_days,
+            "observations": int(returns.shape[0]),
+            "gross_exposure": round(float(np.abs(weights).sum()), 6),
+            "net_exposure": round(float(weights.sum()), 6),
+            "volatility_daily": round(float(volatility), 8),
+            "volatility_annualized": round(float(volatility * np.sqrt(TRADING_DAYS_PER_YEAR)), 6),
+            "parametric_var": round(float(parametric_var), 8),
+            "parametric_cvar": round(float(parametric_cvar), 8),
+            "historical_var": round(historical_var, 8) if historical_var is not None else None,
+            "historical_cvar": round(historical_cvar, 8) if historical_cvar is not None else None,
+            "positions": positions,
+            "unpriced_symbols": unpriced,
+            "errors": errors,
+        }
+        if portfolio_value:
+            for key in ("parametric_var", "parametric_cvar", "historical_var", "historical_cvar"):
+                if result[key] is not None:
+                    result[f"{key}_amount"] = round(result[key] * portfolio_value, 2)
+        return result
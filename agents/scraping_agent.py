@@ -1,8 +1,17 @@
 import requests
 from bs4 import BeautifulSoup
 import lxml # Ensure lxml is imported if used as a parser
+import asyncio
 import json
+import numpy as np
 import os # Added for environment variable
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv # Added for environment variable
 
 # Load environment variables, specifically for SEC_USER_AGENT
@@ -12,34 +21,68 @@ DOTENV_PATH = os.path.join(PROJECT_ROOT, '.env')
 if os.path.exists(DOTENV_PATH):
     load_dotenv(dotenv_path=DOTENV_PATH)
 
+# Allow `from agents...` imports when this file is run directly
+if PROJECT_ROOT not in sys.path:
+    sys.path.append(PROJECT_ROOT)
+
+from agents.sec_cache import SECCache
+from agents.sec_rate_limiter import AsyncSECFetcher, sec_get
+from agents.filings_index import FilingsIndex
+
 # SEC requires a User-Agent in the format: Sample Company Name AdminContact@example.com
 # It's good practice to make this configurable, e.g., via an environment variable
 SEC_USER_AGENT = os.getenv("SEC_USER_AGENT", "Financial Assistant Project your_email@example.com")
 
+# How long cached SEC responses are served without revalidation (seconds)
+SEC_TICKERS_TTL = int(os.getenv("SEC_TICKERS_TTL_SECONDS", 24 * 3600))
+SEC_SUBMISSIONS_TTL = int(os.getenv("SEC_SUBMISSIONS_TTL_SECONDS", 3600))
+# After a failed company_tickers.json load, wait this long before trying again
+SEC_LOOKUP_RETRY_SECONDS = int(os.getenv("SEC_LOOKUP_RETRY_SECONDS", 60))
+
+# How long a company's entry in the local filings index is used before it is refreshed (seconds)
+FILINGS_INDEX_REFRESH_SECONDS = int(os.getenv("FILINGS_INDEX_REFRESH_SECONDS", SEC_SUBMISSIONS_TTL))
+
+SEC_COMPANY_TICKERS_URL = "https://www.sec.gov/files/company_tickers.json"
+
+_sec_cache = SECCache(user_agent=SEC_USER_AGENT)
+
+_filings_index = None
+
 _cik_lookup = None
+_cik_lookup_source = None # The company_tickers.json payload _cik_lookup was built from
+_cik_lookup_failed_at = 0.0
 
 def _get_cik_lookup():
     """
-    Fetches and caches the ticker to CIK mapping from SEC.
+    Returns the ticker to CIK mapping from SEC, backed by the on-disk SEC cache
+    so it survives restarts and is revalidated with conditional GETs.
     """
-    global _cik_lookup
-    if _cik_lookup is None:
-        try:
-            headers = {"User-Agent": SEC_USER_AGENT}
-            response = requests.get("https://www.sec.gov/files/company_tickers.json", headers=headers)
-            response.raise_for_status()
-            company_data = response.json()
+    global _cik_lookup, _cik_lookup_source, _cik_lookup_failed_at
+    if _cik_lookup is not None and _cik_lookup_source is None and time.time() - _cik_lookup_failed_at < SEC_LOOKUP_RETRY_SECONDS:
+        return _cik_lookup # Recent failure, don't hammer SEC on every call
+    try:
+        company_data = _sec_cache.get_json(SEC_COMPANY_TICKERS_URL, ttl=SEC_TICKERS_TTL)
+        if company_data is not _cik_lookup_source:
             # The JSON is a dictionary where keys are indices and values are dicts with cik_str, ticker, title
             _cik_lookup = {item['ticker']: str(item['cik_str']).zfill(10) for item in company_data.values() if 'ticker' in item and 'cik_str' in item}
+            _cik_lookup_source = company_data
             print(f"Successfully loaded CIK lookup: {len(_cik_lookup)} tickers found.")
-        except requests.exceptions.RequestException as e:
-            print(f"Error fetching company_tickers.json: {e}")
-            _cik_lookup = {} # Avoid retrying on every call if it fails
-        except json.JSONDecodeError as e:
-            print(f"Error decoding company_tickers.json: {e}")
-            _cik_lookup = {}
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching company_tickers.json: {e}")
+        _cik_lookup, _cik_lookup_source, _cik_lookup_failed_at = {}, None, time.time()
+    except json.JSONDecodeError as e:
+        print(f"Error decoding company_tickers.json: {e}")
+        _cik_lookup, _cik_lookup_source, _cik_lookup_failed_at = {}, None, time.time()
     return _cik_lookup
 
+def _get_submissions(cik: str) -> dict:
+    """
+    Returns the submissions JSON for a 10-digit CIK, served from the SEC cache when fresh.
+    """
+    # The CIK needs to be padded with leading zeros to 10 digits for this specific API endpoint
+    submissions_url = f"https://data.sec.gov/submissions/CIK{cik}.json"
+    return _sec_cache.get_json(submissions_url, ttl=SEC_SUBMISSIONS_TTL)
+
 def get_cik_by_ticker(ticker: str) -> str | None:
     """
     Retrieves the CIK for a given ticker symbol.
@@ -47,19 +90,86 @@ def get_cik_by_ticker(ticker: str) -> str | None:
     lookup = _get_cik_lookup()
     return lookup.get(ticker.upper())
 
-def scrape_page_title(url: str):
+def get_company_profile(ticker: str) -> dict:
+    """
+    Reference data for a ticker from its SEC submissions document: name, SIC code and description,
+    state of incorporation and business-address state/country (EDGAR codes).
+    Returns {"error": ...} if the ticker is unknown or SEC can't be reached.
+    """
+    cik = get_cik_by_ticker(ticker)
+    if not cik:
+        return {"error": f"CIK not found for ticker {ticker}"}
+    try:
+        submissions = _get_submissions(cik)
+    except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+        print(f"Error fetching submissions for {ticker} (CIK {cik}): {e}")
+        return {"error": str(e)}
+    business_address = (submissions.get('addresses') or {}).get('business') or {}
+    return {
+        "ticker": ticker.upper(),
+        "cik": cik,
+        "name": submissions.get('name'),
+        "sic": submissions.get('sic') or None,
+        "sic_description": submissions.get('sicDescription') or None,
+        "state_of_incorporation": submissions.get('stateOfIncorporation') or None,
+        "business_state_or_country": business_address.get('stateOrCountry') or None,
+        "business_country_description": business_address.get('stateOrCountryDescription') or None,
+    }
+
+def _get_filings_index() -> FilingsIndex:
+    global _filings_index
+    if _filings_index is None:
+        _filings_index = FilingsIndex()
+    return _filings_index
+
+def _filing_document_url(cik: str, accession_number: str, primary_document: str) -> str:
+    # https://www.sec.gov/Archives/edgar/data/{CIK}/{ACCESSION_NUMBER_NO_DASHES}/{PRIMARY_DOCUMENT_NAME}
+    return f"https://www.sec.gov/Archives/edgar/data/{cik}/{accession_number.replace('-', '')}/{primary_document}"
+
+# Title scraping reads only as much of the page as it needs
+TITLE_SCAN_MAX_BYTES = int(os.getenv("TITLE_SCAN_MAX_BYTES", 256 * 1024))
+TITLE_SCRAPE_MAX_WORKERS = int(os.getenv("TITLE_SCRAPE_MAX_WORKERS", 16))
+TITLE_SCRAPE_PER_HOST_LIMIT = int(os.getenv("TITLE_SCRAPE_PER_HOST_LIMIT", 4))
+
+_TITLE_HEADERS = {
+    # Using a generic user-agent for non-SEC sites
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+_HEAD_DONE_PATTERN = re.compile(rb'</title\s*>|</head\s*>', re.IGNORECASE)
+
+_title_session = requests.Session()
+_title_session.mount("http://", HTTPAdapter(pool_connections=32, pool_maxsize=TITLE_SCRAPE_PER_HOST_LIMIT))
+_title_session.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=TITLE_SCRAPE_PER_HOST_LIMIT))
+_host_semaphores = {}
+_host_semaphores_lock = threading.Lock()
+
+def _read_page_head(response: requests.Response) -> bytes:
+    """
+    Reads a streamed response only until </title> or </head> has been seen
+    (or TITLE_SCAN_MAX_BYTES is reached) and returns the bytes read so far.
+    """
+    buffer = bytearray()
+    for chunk in response.iter_content(chunk_size=8192):
+        # Only rescan the new chunk plus enough overlap for a tag split across chunks
+        scan_from = max(0, len(buffer) - 16)
+        buffer += chunk
+        if _HEAD_DONE_PATTERN.search(buffer, scan_from) or len(buffer) >= TITLE_SCAN_MAX_BYTES:
+            break
+    return bytes(buffer)
+
+def scrape_page_title(url: str, head_only: bool = True, session: requests.Session | None = None):
     """
     Scrapes the title of a given URL.
+    With head_only (the default) the body is streamed and the download stops as soon as
+    the title is complete, so only the start of the page is transferred and parsed.
     """
     try:
-        headers = {
-            # Using a generic user-agent for non-SEC sites
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=10)
-        response.raise_for_status()  # Raises an HTTPError for bad responses (4XX or 5XX)
+        http = session or _title_session
+        with http.get(url, headers=_TITLE_HEADERS, timeout=10, stream=head_only) as response:
+            response.raise_for_status()  # Raises an HTTPError for bad responses (4XX or 5XX)
+            content = _read_page_head(response) if head_only else response.content
         
-        soup = BeautifulSoup(response.content, 'lxml') # Using lxml parser
+        soup = BeautifulSoup(content, 'lxml') # Using lxml parser
         
         title_tag = soup.find('title')
         if title_tag and title_tag.string:
@@ -74,7 +184,84 @@ def scrape_page_title(url: str):
         print(f"An unexpected error occurred while scraping {url}: {e}")
         return None
 
-def get_latest_filings(ticker: str, num_filings: int = 5, filing_types: list[str] | None = None):
+def _host_semaphore(url: str) -> threading.BoundedSemaphore:
+    host = urlsplit(url).netloc.lower()
+    with _host_semaphores_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(TITLE_SCRAPE_PER_HOST_LIMIT)
+        return _host_semaphores[host]
+
+def scrape_page_titles(urls: list[str], max_workers: int = TITLE_SCRAPE_MAX_WORKERS) -> dict:
+    """
+    Resolves the titles of many URLs concurrently over pooled connections,
+    with at most TITLE_SCRAPE_PER_HOST_LIMIT requests in flight per host.
+    Returns {url: title}, where title is None on failure and "No title found" if the page has none.
+    """
+    unique_urls = list(dict.fromkeys(urls))
+
+    def _scrape(url):
+        with _host_semaphore(url):
+            return scrape_page_title(url)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique_urls)))) as executor:
+        return dict(zip(unique_urls, executor.map(_scrape, unique_urls)))
+
+def _filter_filings(columns: dict, cik: str, num_filings: int, filing_types: list[str] | None = None,
+                    date_from: str | None = None, date_to: str | None = None) -> list[dict]:
+    """
+    Selects filings from a columnar submissions block (e.g. data['filings']['recent']).
+
+    The block is a dictionary of parallel arrays ('accessionNumber', 'filingDate', 'form', ...),
+    newest first. The form/date filters are applied as one vectorized mask over those arrays,
+    and only the selected rows are turned into dicts.
+    Dates are ISO 'YYYY-MM-DD' strings, so they compare correctly as strings.
+    """
+    accession_numbers = columns.get('accessionNumber', [])
+    num_available_filings = len(accession_numbers)
+    if num_available_filings == 0 or num_filings <= 0:
+        return []
+
+    mask = np.ones(num_available_filings, dtype=bool)
+    if filing_types:
+        mask &= np.isin(np.asarray(columns['form'][:num_available_filings]), filing_types)
+    if date_from or date_to:
+        filing_dates = np.asarray(columns['filingDate'][:num_available_filings])
+        if date_from:
+            mask &= filing_dates >= date_from
+        if date_to:
+            mask &= filing_dates <= date_to
+
+    filings_data = []
+    for i in np.flatnonzero(mask)[:num_filings]:
+        # Construct the link to the primary document
+        filing_link = _filing_document_url(cik, accession_numbers[i], columns['primaryDocument'][i])
+        filings_data.append({
+            "form_type": columns['form'][i], # Changed from "type" to "form_type" for clarity
+            "filing_date": columns['filingDate'][i],
+            "report_date": columns['reportDate'][i], # Date the report is for
+            "document_url": filing_link, # Changed from "link" to "document_url"
+            "description": columns.get('primaryDocDescription', [''] * num_available_filings)[i]
+        })
+    return filings_data
+
+def _filings_result(ticker: str, cik: str, data: dict, num_filings: int, filing_types: list[str] | None,
+                    date_from: str | None, date_to: str | None) -> dict:
+    """Builds the get_latest_filings response for one ticker from its submissions JSON."""
+    try:
+        # The filings are in data['filings']['recent']
+        recent_filings = data.get('filings', {}).get('recent', {})
+        filings_data = _filter_filings(recent_filings, cik, num_filings, filing_types, date_from, date_to)
+        return {
+            "ticker": ticker.upper(),
+            "cik": cik,
+            "filings": filings_data
+        }
+    except KeyError as e:
+        print(f"Could not find expected key in SEC response: {e}. Data structure might have changed.")
+        return {"ticker": ticker.upper(), "cik": cik, "filings": [], "error": f"KeyError: {e}"}
+
+def get_latest_filings(ticker: str, num_filings: int = 5, filing_types: list[str] | None = None,
+                       date_from: str | None = None, date_to: str | None = None):
     """
     Fetches the latest filings for a given company ticker from the SEC EDGAR API.
     Args:
@@ -82,6 +269,7 @@ def get_latest_filings(ticker: str, num_filings: int = 5, filing_types: list[str
         num_filings: The maximum number of recent filings to return.
         filing_types: Optional list of filing types to filter for (e.g., ["10-K", "10-Q"]).
                       If None, returns all types.
+        date_from / date_to: Optional inclusive filing date bounds ("YYYY-MM-DD").
     """
     print(f"Fetching latest filings for {ticker} from SEC EDGAR...")
     
@@ -90,76 +278,125 @@ def get_latest_filings(ticker: str, num_filings: int = 5, filing_types: list[str
         print(f"CIK not found for ticker: {ticker}")
         return {"ticker": ticker.upper(), "cik": None, "filings": [], "error": "CIK not found"}
 
-    headers = {"User-Agent": SEC_USER_AGENT}
     try:
-        # Construct the URL for the company's submissions
-        # The CIK needs to be padded with leading zeros to 10 digits for this specific API endpoint
-        submissions_url = f"https://data.sec.gov/submissions/CIK{cik}.json"
-        
-        print(f"Fetching submissions from: {submissions_url}")
-        response = requests.get(submissions_url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-
-        filings_data = []
-        # The filings are in data['filings']['recent']
-        recent_filings = data.get('filings', {}).get('recent', {})
-        
-        # Extracting and formatting filing information
-        # The keys we are interested in are 'accessionNumber', 'filingDate', 'reportDate', 'form', 'primaryDocument', 'primaryDocDescription'
-        
-        count = 0
-        # Iterate through accession numbers, which seem to be the primary way to access individual filing details
-        # The API provides 'form' (e.g., "10-K"), 'filingDate', 'reportDate', 'primaryDocument' (e.g., "aapl-20230930.htm")
-        
-        # The structure of recent_filings is a dictionary where keys are arrays:
-        # 'accessionNumber', 'filingDate', 'reportDate', 'form', 'primaryDocument', 'primaryDocDescription', etc.
-        # We need to iterate based on the length of these arrays.
-        
-        num_available_filings = len(recent_filings.get('accessionNumber', []))
-        
-        for i in range(num_available_filings):
-            form_type = recent_filings.get('form', [])[i]
-            
-            if filing_types and form_type not in filing_types:
-                continue
-
-            filing_date = recent_filings.get('filingDate', [])[i]
-            report_date = recent_filings.get('reportDate', [])[i] # Date the report is for
-            primary_document_name = recent_filings.get('primaryDocument', [])[i]
-            accession_number_no_dashes = recent_filings.get('accessionNumber', [])[i].replace('-','')
-            
-            # Construct the link to the primary document
-            # https://www.sec.gov/Archives/edgar/data/{CIK}/{ACCESSION_NUMBER_NO_DASHES}/{PRIMARY_DOCUMENT_NAME}
-            filing_link = f"https://www.sec.gov/Archives/edgar/data/{cik}/{accession_number_no_dashes}/{primary_document_name}"
-            
-            filings_data.append({
-                "form_type": form_type, # Changed from "type" to "form_type" for clarity
-                "filing_date": filing_date,
-                "report_date": report_date,
-                "document_url": filing_link, # Changed from "link" to "document_url"
-                "description": recent_filings.get('primaryDocDescription', [])[i]
-            })
-            count += 1
-            if count >= num_filings:
-                break
-        
-        return {
-            "ticker": ticker.upper(),
-            "cik": cik,
-            "filings": filings_data
-        }
-
+        data = _get_submissions(cik)
+        return _filings_result(ticker, cik, data, num_filings, filing_types, date_from, date_to)
     except requests.exceptions.RequestException as e:
         print(f"Error fetching SEC data for CIK {cik}: {e}")
         return {"ticker": ticker.upper(), "cik": cik, "filings": [], "error": str(e)}
-    except KeyError as e:
-        print(f"Could not find expected key in SEC response: {e}. Data structure might have changed.")
-        return {"ticker": ticker.upper(), "cik": cik, "filings": [], "error": f"KeyError: {e}"}
     except Exception as e:
         print(f"An unexpected error occurred while fetching filings for {ticker}: {e}")
         return {"ticker": ticker.upper(), "cik": cik, "filings": [], "error": f"Unexpected error: {e}"}
 
+async def get_filings_batch(tickers: list[str], num_filings: int = 5, filing_types: list[str] | None = None,
+                            date_from: str | None = None, date_to: str | None = None) -> list[dict]:
+    """
+    Batch version of get_latest_filings. Submissions for all tickers are fetched
+    concurrently (fresh cached copies are used without a request, misses go through
+    the shared SEC rate limiter). Returns one result per unique ticker, in input order,
+    each shaped like get_latest_filings' return value.
+    """
+    unique_tickers = list(dict.fromkeys(t.upper() for t in tickers if t))
+    print(f"Fetching filings for {len(unique_tickers)} tickers from SEC EDGAR...")
+
+    # The lookup may download SEC's ticker map, so it stays off the event loop
+    ciks = await asyncio.to_thread(lambda: {ticker: get_cik_by_ticker(ticker) for ticker in unique_tickers})
+    ciks_to_fetch = sorted({cik for cik in ciks.values() if cik})
+    submissions = await AsyncSECFetcher().map(_get_submissions, ciks_to_fetch)
+    submissions_by_cik = dict(zip(ciks_to_fetch, submissions))
+
+    results = []
+    for ticker in unique_tickers:
+        cik = ciks[ticker]
+        if not cik:
+            print(f"CIK not found for ticker: {ticker}")
+            results.append({"ticker": ticker, "cik": None, "filings": [], "error": "CIK not found"})
+            continue
+        data = submissions_by_cik[cik]
+        if isinstance(data, Exception):
+            print(f"Error fetching SEC data for CIK {cik}: {data}")
+            results.append({"ticker": ticker, "cik": cik, "filings": [], "error": str(data)})
+            continue
+        results.append(_filings_result(ticker, cik, data, num_filings, filing_types, date_from, date_to))
+    return results
+
+def refresh_filings_index(ticker: str, cik: str | None = None) -> dict:
+    """
+    Incrementally brings the local filings index up to date for one company.
+    The 'recent' block comes from the (cached) submissions JSON; paginated history files
+    listed under filings.files are fetched only the first time they are seen.
+    Raises requests exceptions if SEC cannot be reached.
+    """
+    cik = cik or get_cik_by_ticker(ticker)
+    if not cik:
+        raise ValueError(f"CIK not found for ticker: {ticker}")
+
+    index = _get_filings_index()
+    data = _get_submissions(cik)
+    filings = data.get('filings', {})
+    new_filings, enriched_filings = index.add_filings(cik, filings.get('recent', {}))
+
+    loaded_files = index.loaded_files(cik)
+    for history_file in filings.get('files', []):
+        name = history_file.get('name')
+        if not name or name in loaded_files:
+            continue
+        print(f"Loading filing history file {name} for {ticker}...")
+        response = sec_get(f"https://data.sec.gov/submissions/{name}", headers={"User-Agent": SEC_USER_AGENT})
+        response.raise_for_status()
+        added, enriched = index.add_filings(cik, response.json())
+        new_filings += added
+        enriched_filings += enriched
+        index.mark_file_loaded(cik, name, history_file.get('filingFrom'), history_file.get('filingTo'))
+
+    index.record_company(cik, data.get('name'), data.get('tickers') or [ticker], refreshed_at=time.time())
+    print(f"Filings index refreshed for {ticker} (CIK {cik}): {new_filings} new filing(s), {enriched_filings} enriched.")
+    return {"ticker": ticker.upper(), "cik": cik, "new_filings": new_filings, "enriched_filings": enriched_filings}
+
+def get_filing_history(ticker: str, filing_types: list[str] | None = None, date_from: str | None = None,
+                       date_to: str | None = None, limit: int = 100, offset: int = 0, refresh: bool | None = None) -> dict:
+    """
+    Returns a company's full filing history from the local filings index, newest first.
+    Args:
+        ticker: The company ticker symbol (e.g., "AAPL").
+        filing_types: Optional list of form types to keep (e.g., ["10-K", "10-Q"]).
+        date_from / date_to: Optional inclusive filing date bounds ("YYYY-MM-DD").
+        limit / offset: Pagination over the matching filings.
+        refresh: True forces an index refresh, False never refreshes, None (default)
+                 refreshes only when the company's entry is older than FILINGS_INDEX_REFRESH_SECONDS.
+    """
+    index = _get_filings_index()
+    cik = get_cik_by_ticker(ticker) or index.cik_for_ticker(ticker)
+    if not cik:
+        print(f"CIK not found for ticker: {ticker}")
+        return {"ticker": ticker.upper(), "cik": None, "filings": [], "error": "CIK not found"}
+
+    refreshed_at = index.refreshed_at(cik)
+    stale = refreshed_at is None or time.time() - refreshed_at > FILINGS_INDEX_REFRESH_SECONDS
+    if refresh or (refresh is None and stale):
+        try:
+            refresh_filings_index(ticker, cik)
+        except requests.exceptions.RequestException as e:
+            print(f"Error refreshing filings index for {ticker}: {e}")
+            if refreshed_at is None:
+                return {"ticker": ticker.upper(), "cik": cik, "filings": [], "error": str(e)}
+            print(f"Serving previously indexed filings for {ticker}.")
+
+    rows = index.query(cik, form_types=filing_types, date_from=date_from, date_to=date_to, limit=limit, offset=offset)
+    return {
+        "ticker": ticker.upper(),
+        "cik": cik,
+        "total_indexed": index.count(cik),
+        "filings": [{
+            "form_type": row['form'],
+            "filing_date": row['filing_date'],
+            "report_date": row['report_date'],
+            "accession_number": row['accession_number'],
+            "document_url": _filing_document_url(cik, row['accession_number'], row['primary_document'] or ''),
+            "description": row['description']
+        } for row in rows]
+    }
+
 
 if __name__ == '__main__':
     # Example for scrape_page_title
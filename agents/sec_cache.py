@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+
+from agents.sec_rate_limiter import sec_get
+
+# Cache lives next to the vector store under <project root>/data unless overridden
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_SEC_CACHE_DIR = os.path.join(PROJECT_ROOT, 'data', 'sec_cache')
+
+
+class SECCache:
+    """
+    On-disk HTTP cache for SEC JSON endpoints (company_tickers.json, submissions/CIK*.json).
+
+    Entries are kept as the raw response body plus a small metadata file holding the
+    ETag / Last-Modified validators and the time the entry was last confirmed fresh.
+    Parsed copies are also kept in memory, so a fresh hit never touches the network or disk.
+
+    - age < ttl: served from memory/disk.
+    - ttl <= age < ttl + stale_seconds: the stale copy is served immediately and a
+      conditional GET runs in a background thread to refresh it.
+    - otherwise: a conditional GET is made inline (304 just bumps the timestamp).
+    If the network fails and any cached copy exists, the cached copy is returned.
+    """
+
+    def __init__(self, cache_dir: str | None = None, user_agent: str | None = None, stale_seconds: int | None = None):
+        self.cache_dir = cache_dir or os.getenv("SEC_CACHE_DIR", DEFAULT_SEC_CACHE_DIR)
+        self.user_agent = user_agent
+        self.stale_seconds = stale_seconds if stale_seconds is not None else int(os.getenv("SEC_CACHE_STALE_SECONDS", 7 * 24 * 3600))
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self._memory = {} # url -> {"meta": {...}, "data": parsed json}
+        self._lock = threading.Lock()
+        self._refreshing = set() # urls with a background refresh in flight
+
+    def _paths(self, url: str) -> tuple[str, str]:
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.json"), os.path.join(self.cache_dir, f"{key}.meta.json")
+
+    def _load_from_disk(self, url: str) -> dict | None:
+        body_path, meta_path = self._paths(url)
+        if not (os.path.exists(body_path) and os.path.exists(meta_path)):
+            return None
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                data = json.loads(f.read())
+        except (OSError, ValueError) as e:
+            print(f"SECCache: Ignoring unreadable cache entry for {url}: {e}")
+            return None
+        entry = {"meta": meta, "data": data}
+        with self._lock:
+            self._memory[url] = entry
+        return entry
+
+    def _write_atomic(self, path: str, payload: bytes):
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+    def _store(self, url: str, body: bytes, data, response_headers) -> dict:
+        meta = {
+            "url": url,
+            "etag": response_headers.get("ETag"),
+            "last_modified": response_headers.get("Last-Modified"),
+            "checked_at": time.time(),
+        }
+        body_path, meta_path = self._paths(url)
+        try:
+            self._write_atomic(body_path, body)
+            self._write_atomic(meta_path, json.dumps(meta).encode('utf-8'))
+        except OSError as e:
+            print(f"SECCache: Could not persist cache entry for {url}: {e}")
+        entry = {"meta": meta, "data": data}
+        with self._lock:
+            self._memory[url] = entry
+        return entry
+
+    def _touch(self, url: str, entry: dict):
+        entry["meta"]["checked_at"] = time.time()
+        _, meta_path = self._paths(url)
+        try:
+            self._write_atomic(meta_path, json.dumps(entry["meta"]).encode('utf-8'))
+        except OSError as e:
+            print(f"SECCache: Could not update cache metadata for {url}: {e}")
+
+    def _revalidate(self, url: str, entry: dict | None, timeout: int = 30):
+        headers = {"User-Agent": self.user_agent} if self.user_agent else {}
+        if entry:
+            if entry["meta"].get("etag"):
+                headers["If-None-Match"] = entry["meta"]["etag"]
+            if entry["meta"].get("last_modified"):
+                headers["If-Modified-Since"] = entry["meta"]["last_modified"]
+
+        try:
+            response = sec_get(url, headers=headers, timeout=timeout)
+            if response.status_code == 304 and entry:
+                self._touch(url, entry)
+                return entry["data"]
+            response.raise_for_status()
+            data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            if entry:
+                print(f"SECCache: Refresh of {url} failed ({e}). Serving cached copy.")
+                return entry["data"]
+            raise
+        return self._store(url, response.content, data, response.headers)["data"]
+
+    def _refresh_in_background(self, url: str, entry: dict):
+        with self._lock:
+            if url in self._refreshing:
+                return
+            self._refreshing.add(url)
+
+        def _worker():
+            try:
+                self._revalidate(url, entry)
+            except Exception as e:
+                print(f"SECCache: Background refresh of {url} failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(url)
+
+        threading.Thread(target=_worker, name="sec-cache-refresh", daemon=True).start()
+
+    def get_json(self, url: str, ttl: int):
+        """
+        Returns the parsed JSON body for `url`, using the cache according to `ttl` (seconds).
+        Raises requests/JSON errors only when the fetch fails and nothing is cached.
+        """
+        entry = self._memory.get(url) or self._load_from_disk(url)
+        if entry:
+            age = time.time() - entry["meta"].get("checked_at", 0)
+            if age < ttl:
+                return entry["data"]
+            if age < ttl + self.stale_seconds:
+                self._refresh_in_background(url, entry)
+                return entry["data"]
+        return self._revalidate(url, entry)
+
+    def invalidate(self, url: str):
+        """Drops a single entry from memory and disk."""
+        with self._lock:
+            self._memory.pop(url, None)
+        for path in self._paths(url):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
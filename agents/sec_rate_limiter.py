@@ -0,0 +1,142 @@
+import asyncio
+import os
+import struct
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import fcntl # POSIX only; used to share the bucket between processes
+except ImportError:
+    fcntl = None
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# SEC EDGAR fair-access policy allows about 10 requests/second per client.
+# Default to slightly under that so bursts at window edges never cross the line.
+SEC_MAX_REQUESTS_PER_SECOND = float(os.getenv("SEC_MAX_REQUESTS_PER_SECOND", 9))
+SEC_RATE_LIMIT_BURST = int(os.getenv("SEC_RATE_LIMIT_BURST", 1))
+SEC_MAX_CONCURRENCY = int(os.getenv("SEC_MAX_CONCURRENCY", 8))
+
+_STATE_FORMAT = "<dd" # (tokens, last refill timestamp)
+_STATE_SIZE = struct.calcsize(_STATE_FORMAT)
+
+
+class SECRateLimiter:
+    """
+    Token bucket shared by every process on this machine.
+
+    The bucket state lives in a small file guarded by an exclusive flock, so the Scraping
+    Service, the ingestion script and anything else hitting SEC draw from one budget.
+    Callers reserve a token and are told how long to wait for it, which spaces requests
+    evenly instead of having them spin. Without fcntl (Windows) the bucket is process-local.
+    """
+
+    def __init__(self, rate: float = SEC_MAX_REQUESTS_PER_SECOND, burst: int = SEC_RATE_LIMIT_BURST, state_path: str | None = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = max(1, burst)
+        cache_dir = os.getenv("SEC_CACHE_DIR", os.path.join(PROJECT_ROOT, 'data', 'sec_cache'))
+        self.state_path = state_path or os.getenv("SEC_RATE_LIMIT_STATE_PATH", os.path.join(cache_dir, 'rate_limiter.state'))
+        self._thread_lock = threading.Lock()
+        self._local_state = (float(self.burst), time.time())
+        if fcntl:
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+
+    def _take(self, state: tuple[float, float]) -> tuple[tuple[float, float], float]:
+        tokens, last = state
+        now = time.time()
+        tokens = min(float(self.burst), tokens + max(0.0, now - last) * self.rate) - 1.0
+        wait = 0.0 if tokens >= 0 else -tokens / self.rate
+        return (tokens, now), wait
+
+    def reserve(self) -> float:
+        """Takes one token and returns the number of seconds to wait before using it."""
+        with self._thread_lock:
+            if not fcntl:
+                self._local_state, wait = self._take(self._local_state)
+                return wait
+
+            fd = os.open(self.state_path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                raw = os.pread(fd, _STATE_SIZE, 0)
+                state = struct.unpack(_STATE_FORMAT, raw) if len(raw) == _STATE_SIZE else (float(self.burst), time.time())
+                new_state, wait = self._take(state)
+                os.pwrite(fd, struct.pack(_STATE_FORMAT, *new_state), 0)
+                return wait
+            finally:
+                os.close(fd) # Also releases the flock
+
+    def acquire(self):
+        """Blocks until the caller may issue one request."""
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Async variant of acquire(); sleeps on the event loop instead of blocking it."""
+        # reserve() may wait on the cross-process file lock, so it runs in a worker thread
+        wait = await asyncio.to_thread(self.reserve)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+sec_rate_limiter = SECRateLimiter()
+
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=max(10, SEC_MAX_CONCURRENCY)))
+
+
+def sec_get(url: str, **kwargs) -> requests.Response:
+    """
+    requests.get for SEC hosts: waits for the shared rate limiter, then issues the
+    request over a pooled session. Accepts the same keyword arguments as requests.get.
+    """
+    kwargs.setdefault("timeout", 30)
+    sec_rate_limiter.acquire()
+    return _session.get(url, **kwargs)
+
+
+class AsyncSECFetcher:
+    """
+    Runs many SEC-bound calls concurrently from async code.
+
+    Each call runs in a worker thread and waits on the shared limiter, so with enough
+    concurrency to cover network latency the aggregate rate sits at the limit without exceeding it.
+    """
+
+    def __init__(self, max_concurrency: int = SEC_MAX_CONCURRENCY):
+        self.max_concurrency = max(1, max_concurrency)
+
+    async def fetch(self, url: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", 30)
+        await sec_rate_limiter.acquire_async()
+        return await asyncio.to_thread(_session.get, url, **kwargs)
+
+    async def fetch_many(self, urls: list[str], **kwargs) -> list:
+        """Fetches all URLs; each result is a Response or the exception raised for that URL."""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def _one(url):
+            async with semaphore:
+                return await self.fetch(url, **kwargs)
+
+        return await asyncio.gather(*(_one(url) for url in urls), return_exceptions=True)
+
+    async def map(self, func, items: list) -> list:
+        """
+        Calls the blocking `func(item)` for every item in worker threads, at most
+        max_concurrency at a time. `func` is expected to use sec_get() for its SEC calls.
+        Each result is func's return value or the exception it raised.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def _one(item):
+            async with semaphore:
+                return await asyncio.to_thread(func, item)
+
+        return await asyncio.gather(*(_one(item) for item in items), return_exceptions=True)
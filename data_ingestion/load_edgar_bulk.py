@@ -0,0 +1,177 @@
+import argparse
+import gzip
+import json
+import os
+import re
+import sys
+import time
+import zipfile
+
+# Add project root to sys.path so the agents package can be imported when run as a script
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.append(project_root)
+
+from dotenv import load_dotenv
+
+dotenv_path = os.path.join(project_root, '.env')
+if os.path.exists(dotenv_path):
+    load_dotenv(dotenv_path=dotenv_path)
+
+from agents.filings_index import FilingsIndex
+
+# Members of EDGAR's bulk submissions.zip:
+#   CIK0000320193.json                  -> main document (name, tickers, filings.recent, filings.files)
+#   CIK0000320193-submissions-001.json  -> older filings, as bare columnar arrays
+SUBMISSIONS_MEMBER_PATTERN = re.compile(r'^CIK(\d{10})(-submissions-\d+)?\.json$')
+
+
+def _member_sort_key(name: str):
+    # Main document first, then its history pages, so universe filtering can decide on the main document
+    match = SUBMISSIONS_MEMBER_PATTERN.match(os.path.basename(name))
+    return (match.group(1), match.group(2) or '') if match else ('', name)
+
+
+def load_submissions_zip(zip_path: str, index: FilingsIndex, tickers: set[str] | None = None, commit_every: int = 2000) -> dict:
+    """
+    Populates the filings index from EDGAR's bulk submissions.zip in a single pass.
+    Members are decoded one at a time straight from the archive; nothing is extracted to disk.
+
+    Companies are marked as refreshed at the archive's modification time, and every history page
+    is marked loaded, so the Scraping Service afterwards only fetches what changed since the snapshot.
+    If `tickers` is given, only companies listing one of those tickers are loaded.
+    """
+    snapshot_time = os.path.getmtime(zip_path)
+    stats = {"companies": 0, "history_files": 0, "filings_added": 0, "filings_enriched": 0, "skipped": 0}
+    selected_ciks = set()
+
+    with zipfile.ZipFile(zip_path) as archive, index.bulk_writer(commit_every=commit_every) as writer:
+        member_names = sorted((name for name in archive.namelist() if SUBMISSIONS_MEMBER_PATTERN.match(os.path.basename(name))), key=_member_sort_key)
+        print(f"Found {len(member_names)} submissions documents in {zip_path}.")
+
+        for position, member_name in enumerate(member_names, start=1):
+            cik, page_suffix = SUBMISSIONS_MEMBER_PATTERN.match(os.path.basename(member_name)).groups()
+            is_history_page = page_suffix is not None
+
+            if tickers is not None and is_history_page and cik not in selected_ciks:
+                stats["skipped"] += 1
+                continue
+
+            try:
+                with archive.open(member_name) as member:
+                    document = json.load(member)
+            except (ValueError, zipfile.BadZipFile) as e:
+                print(f"Skipping unreadable member {member_name}: {e}")
+                stats["skipped"] += 1
+                continue
+
+            if is_history_page:
+                writer.add_filings(cik, document)
+                writer.mark_file_loaded(cik, os.path.basename(member_name))
+                stats["history_files"] += 1
+            else:
+                company_tickers = document.get('tickers') or []
+                if tickers is not None:
+                    if not tickers.intersection(t.upper() for t in company_tickers):
+                        stats["skipped"] += 1
+                        continue
+                    selected_ciks.add(cik)
+                writer.add_filings(cik, document.get('filings', {}).get('recent', {}))
+                writer.record_company(cik, document.get('name'), company_tickers, refreshed_at=snapshot_time)
+                stats["companies"] += 1
+
+            if position % 50000 == 0:
+                print(f"  ...{position}/{len(member_names)} documents processed, {writer.filings_added} filings added so far.")
+
+        stats["filings_added"] = writer.filings_added
+        stats["filings_enriched"] = writer.filings_enriched
+    return stats
+
+
+def _open_index_file(path: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='latin-1')
+    return open(path, 'r', encoding='latin-1')
+
+
+def load_master_index(paths: list[str], index: FilingsIndex, form_types: set[str] | None = None, commit_every: int = 20) -> dict:
+    """
+    Populates the filings index from quarterly full-index master.idx files (plain or .gz).
+
+    Each row is "CIK|Company Name|Form Type|Date Filed|edgar/data/<cik>/<accession>.txt". These files
+    carry no primary document name or report date, so the full submission .txt is recorded as the
+    primary document. Loading submissions.zip or the API (before or after) upgrades such rows to the
+    real primary document and report date. Rows are streamed and inserted in batches.
+    """
+    stats = {"files": 0, "filings_added": 0, "filings_enriched": 0, "companies": 0}
+    batch_size = 5000
+
+    with index.bulk_writer(commit_every=commit_every) as writer:
+        for path in paths:
+            print(f"Loading {path}...")
+            companies = {}
+            batch = []
+            with _open_index_file(path) as f:
+                in_header = True
+                for line in f:
+                    if in_header:
+                        # Rows start after the dashed separator line under the column headers
+                        in_header = not line.startswith('-----')
+                        continue
+                    parts = line.rstrip('\n').split('|')
+                    if len(parts) != 5:
+                        continue
+                    cik, company_name, form, date_filed, filename = parts
+                    if form_types and form not in form_types:
+                        continue
+                    cik = cik.zfill(10)
+                    primary_document = os.path.basename(filename)
+                    accession_number = primary_document.rsplit('.', 1)[0]
+                    companies[cik] = company_name
+                    batch.append((accession_number, cik, form, date_filed, None, primary_document, None))
+                    if len(batch) >= batch_size:
+                        writer.add_rows(batch)
+                        batch = []
+            if batch:
+                writer.add_rows(batch)
+            for cik, company_name in companies.items():
+                # Not a complete snapshot of the company, so leave refreshed_at untouched
+                writer.record_company(cik, company_name)
+            stats["files"] += 1
+            stats["companies"] += len(companies)
+        stats["filings_added"] = writer.filings_added
+        stats["filings_enriched"] = writer.filings_enriched
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bootstrap the local SEC filings index from EDGAR bulk archives on disk.")
+    parser.add_argument("--submissions-zip", help="Path to EDGAR's bulk submissions.zip")
+    parser.add_argument("--master-index", nargs="+", default=[], help="Paths to quarterly full-index master.idx files (plain or .gz)")
+    parser.add_argument("--tickers", nargs="+", help="Only load these tickers (submissions.zip only)")
+    parser.add_argument("--form-types", nargs="+", help="Only load these form types (master.idx only)")
+    parser.add_argument("--db-path", help="Filings index path (defaults to FILINGS_INDEX_PATH or data/filings_index/filings.sqlite)")
+    args = parser.parse_args()
+
+    if not args.submissions_zip and not args.master_index:
+        parser.error("Provide --submissions-zip and/or --master-index.")
+
+    index = FilingsIndex(db_path=args.db_path)
+    print(f"--- Loading EDGAR bulk data into {index.db_path} ---")
+    started = time.time()
+
+    if args.submissions_zip:
+        tickers = {t.upper() for t in args.tickers} if args.tickers else None
+        stats = load_submissions_zip(args.submissions_zip, index, tickers=tickers)
+        print(f"submissions.zip: {stats}")
+
+    if args.master_index:
+        form_types = set(args.form_types) if args.form_types else None
+        stats = load_master_index(args.master_index, index, form_types=form_types)
+        print(f"full-index: {stats}")
+
+    print(f"--- Finished in {time.time() - started:.1f}s ---")
+
+
+if __name__ == "__main__":
+    main()
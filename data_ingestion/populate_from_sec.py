@@ -1,6 +1,6 @@
 import requests
 import os
-import time
+import asyncio
 from bs4 import BeautifulSoup
 from dotenv import load_dotenv
 import sys
@@ -19,6 +19,9 @@ if os.path.exists(dotenv_path):
 else:
     print(f"Warning: .env file not found at {dotenv_path}. Service URLs and API keys might be missing.")
 
+# Imported after .env is loaded so the limiter picks up SEC_MAX_REQUESTS_PER_SECOND etc.
+from agents.sec_rate_limiter import sec_get, AsyncSECFetcher
+
 # Configuration from environment variables or defaults
 SCRAPING_SERVICE_BASE_URL = os.getenv("SCRAPING_SERVICE_URL", "http://localhost:8001")
 RETRIEVER_SERVICE_BASE_URL = os.getenv("RETRIEVER_SERVICE_URL", "http://localhost:8002")
@@ -62,7 +65,7 @@ def fetch_document_content_from_url(doc_url):
     headers = {"User-Agent": SEC_USER_AGENT}
     print(f"Fetching content from: {doc_url} with User-Agent: {SEC_USER_AGENT}")
     try:
-        response = requests.get(doc_url, headers=headers, timeout=30)
+        response = sec_get(doc_url, headers=headers, timeout=30) # Shares the SEC rate limit with the Scraping Service
         response.raise_for_status()
         
         content_type = response.headers.get('content-type', '').lower()
@@ -124,17 +127,23 @@ def main_ingestion_loop():
     print(f"Scraping Service URL: {SCRAPING_SERVICE_BASE_URL}")
     print(f"Retriever Service URL: {RETRIEVER_SERVICE_BASE_URL}")
     print(f"Using SEC User-Agent: {SEC_USER_AGENT}")
+    fetcher = AsyncSECFetcher()
+
+    # 1. Get filing URLs for every ticker from the ScrapingService in one batch call
+    filings_endpoint_url = f"{SCRAPING_SERVICE_BASE_URL}/scrape/filings/batch"
+    print(f"Querying ScrapingService for filings: {filings_endpoint_url}")
+    try:
+        scraper_response = requests.post(filings_endpoint_url, json={"tickers": TARGET_TICKERS}, timeout=120)
+        scraper_response.raise_for_status()
+        filings_by_ticker = {result.get("ticker"): result for result in scraper_response.json().get("results", [])}
+    except requests.RequestException as e:
+        print(f"Error communicating with ScrapingService: {e}")
+        return
 
     for ticker in TARGET_TICKERS:
         print(f"\n--- Processing Ticker: {ticker} ---")
         try:
-            # 1. Get filing URLs from the ScrapingService
-            filings_endpoint_url = f"{SCRAPING_SERVICE_BASE_URL}/scrape/filings/{ticker}"
-            print(f"Querying ScrapingService for filings: {filings_endpoint_url}")
-            
-            scraper_response = requests.get(filings_endpoint_url, headers={"User-Agent": SEC_USER_AGENT}, timeout=60)
-            scraper_response.raise_for_status()
-            scraper_data = scraper_response.json()
+            scraper_data = filings_by_ticker.get(ticker.upper())
 
             if not scraper_data or "filings" not in scraper_data or not scraper_data["filings"]:
                 print(f"No filings found or unexpected response for {ticker} from ScrapingService.")
@@ -143,6 +152,7 @@ def main_ingestion_loop():
             filings_to_process = scraper_data["filings"]
             print(f"Found {len(filings_to_process)} filing entries for {ticker}.")
 
+            docs_to_fetch = [] # (form_type, url)
             for filing_info in filings_to_process:
                 # The scraping_agent.py should provide 'document_url' for the primary filing document.
                 # It might also provide 'text_summary_url' for plain text versions if available.
@@ -164,9 +174,18 @@ def main_ingestion_loop():
                 # Ensure the URL is absolute
                 if not doc_url_to_fetch.startswith("http"):
                     doc_url_to_fetch = f"https://www.sec.gov{doc_url_to_fetch}"
-                
+                docs_to_fetch.append((form_type, doc_url_to_fetch))
+
+            # Fetch all documents for this ticker concurrently. Politeness is enforced by the
+            # shared SEC rate limiter rather than fixed sleeps between requests.
+            print(f"Fetching {len(docs_to_fetch)} documents for {ticker} concurrently...")
+            contents = asyncio.run(fetcher.map(fetch_document_content_from_url, [url for _, url in docs_to_fetch]))
+
+            for (form_type, doc_url_to_fetch), content in zip(docs_to_fetch, contents):
                 print(f"Processing {form_type} document: {doc_url_to_fetch}")
-                content = fetch_document_content_from_url(doc_url_to_fetch)
+                if isinstance(content, Exception):
+                    print(f"Error fetching document {doc_url_to_fetch}: {content}")
+                    continue
 
                 if content and len(content.strip()) > 100: # Basic check for meaningful content
                     print(f"Successfully fetched and parsed content. Length: {len(content)} characters.")
@@ -183,15 +202,10 @@ def main_ingestion_loop():
                 else:
                     print(f"Failed to fetch, parse, or content too short from {doc_url_to_fetch}")
 
-                time.sleep(2) # Politeness delay between fetching individual documents
-
-        except requests.RequestException as e:
-            print(f"Error communicating with ScrapingService for {ticker}: {e}")
         except Exception as e:
             print(f"An unexpected error occurred while processing {ticker}: {e}")
         
         print(f"--- Finished processing for {ticker} ---")
-        time.sleep(10) # Politeness delay between processing different tickers
 
     print("\n--- SEC Filings Ingestion Process Finished ---")
 
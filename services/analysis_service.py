@@ -1,13 +1,23 @@
 from fastapi import FastAPI, HTTPException, Body
-from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+import asyncio
+import multiprocessing
 import sys
 import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from typing import List, Dict
 
 # Add the parent directory to the Python path to allow importing from 'agents'
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from agents.analysis_agent import AnalysisAgent
+from agents.analysis_agent import AnalysisAgent, analyze_bundle, init_batch_worker, summarize_analysis_batch
+
+# Each batch worker process holds its own AnalysisAgent, including a sentence-transformer model for the
+# earnings classifier (a few hundred MB resident per worker), so the default stays small
+ANALYSIS_BATCH_WORKERS = int(os.getenv("ANALYSIS_BATCH_WORKERS", min(2, os.cpu_count() or 1)))
+ANALYSIS_BATCH_MAX_ITEMS = int(os.getenv("ANALYSIS_BATCH_MAX_ITEMS", 200))
 
 app = FastAPI(
     title="Analysis Agent Service",
@@ -27,6 +37,10 @@ class MarketAnalysisRequest(BaseModel):
     news_articles: List[str] | None = None
     company_filings: List[str] | None = None
     company_ticker: str | None = None # ADDED
+    portfolio_risk: Dict | None = None # Output of the API Service's /risk/portfolio
+
+class BatchAnalysisRequest(BaseModel):
+    items: List[MarketAnalysisRequest] = Field(..., min_items=1, max_items=ANALYSIS_BATCH_MAX_ITEMS)
 
 class EarningsSurpriseRequest(BaseModel):
     text_snippets: List[str]
@@ -42,28 +56,82 @@ async def startup_event():
         except Exception as e:
             print(f"Failed to initialize AnalysisAgent during startup: {e}")
 
+# Keyword scanning and indicator maths are CPU-bound, so batches fan out over processes rather than threads.
+# "spawn" keeps workers from inheriting the server's threads and sockets.
+batch_process_pool = None
+
+def _get_batch_process_pool() -> ProcessPoolExecutor:
+    global batch_process_pool
+    if batch_process_pool is None:
+        batch_process_pool = ProcessPoolExecutor(
+            max_workers=max(1, ANALYSIS_BATCH_WORKERS),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_batch_worker
+        )
+        print(f"Analysis Service: Started batch process pool with {max(1, ANALYSIS_BATCH_WORKERS)} worker(s).")
+    return batch_process_pool
+
+@app.on_event("shutdown")
+def shutdown_event():
+    global batch_process_pool
+    if batch_process_pool is not None:
+        batch_process_pool.shutdown(wait=False, cancel_futures=True)
+        batch_process_pool = None
+
 @app.post("/analysis/market_data", tags=["Analysis"])
 async def analyze_market_data_endpoint(request: MarketAnalysisRequest = Body(...)):
     if not analysis_agent_instance:
         raise HTTPException(status_code=503, detail="AnalysisAgent not initialized.")
     try:
-        result = analysis_agent_instance.analyze_market_data(
+        # Run off the event loop so one large analysis doesn't stall other requests
+        result = await run_in_threadpool(
+            analysis_agent_instance.analyze_market_data,
             market_info=request.market_info,
-            news_articles=request.news_articles,
-            company_filings=request.company_filings,
-            company_ticker=request.company_ticker # ADDED
+            news_articles=request.news_articles or [],
+            company_filings=request.company_filings or [],
+            company_ticker=request.company_ticker, # ADDED
+            portfolio_risk=request.portfolio_risk
         )
         return result
     except Exception as e:
         print(f"Error in /analysis/market_data: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/analysis/batch", tags=["Analysis"])
+async def analyze_batch_endpoint(request: BatchAnalysisRequest = Body(...)):
+    """
+    Analyzes many ticker bundles (each shaped like an /analysis/market_data request) in parallel.
+    Returns per-ticker results in request order plus a cross-portfolio roll-up.
+    """
+    global batch_process_pool
+    if not analysis_agent_instance:
+        raise HTTPException(status_code=503, detail="AnalysisAgent not initialized.")
+    bundles = [item.model_dump() for item in request.items]
+    loop = asyncio.get_running_loop()
+    try:
+        if len(bundles) == 1:
+            # Not worth the inter-process round trip; reuse the service's own agent
+            results = [await run_in_threadpool(analyze_bundle, bundles[0], analysis_agent_instance)]
+        else:
+            pool = _get_batch_process_pool()
+            results = await asyncio.gather(*(loop.run_in_executor(pool, analyze_bundle, bundle) for bundle in bundles))
+    except BrokenProcessPool as e:
+        # A worker died (e.g. OOM); drop the pool so the next batch starts a fresh one
+        print(f"Error in /analysis/batch: process pool broken: {e}")
+        batch_process_pool = None
+        raise HTTPException(status_code=503, detail="Batch analysis workers are unavailable; please retry.")
+    except Exception as e:
+        print(f"Error in /analysis/batch: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"results": list(results), "rollup": summarize_analysis_batch(list(results))}
+
 @app.post("/analysis/earnings_surprises", tags=["Analysis"])
 async def find_earnings_surprises_endpoint(request: EarningsSurpriseRequest = Body(...)):
     if not analysis_agent_instance:
         raise HTTPException(status_code=503, detail="AnalysisAgent not initialized.")
     try:
-        result = analysis_agent_instance.find_earnings_surprises(
+        result = await run_in_threadpool(
+            analysis_agent_instance.find_earnings_surprises,
             text_snippets=request.text_snippets,
             company_ticker=request.company_ticker
         )
@@ -75,7 +143,9 @@ async def find_earnings_surprises_endpoint(request: EarningsSurpriseRequest = Bo
 @app.get("/analysis/health", tags=["Service Health"])
 async def health_check():
     if analysis_agent_instance:
-        return {"status": "healthy", "message": "AnalysisAgent is initialized."}
+        return {"status": "healthy", "message": "AnalysisAgent is initialized.",
+                "llm_cache": analysis_agent_instance.llm_cache.stats() if analysis_agent_instance.llm_cache else None,
+                "document_cache": analysis_agent_instance.document_cache.stats()}
     return {"status": "unhealthy", "message": "AnalysisAgent not initialized."}
 
 if __name__ == "__main__":
@@ -1,4 +1,9 @@
-from fastapi import FastAPI, HTTPException
+import math
+from datetime import date
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from typing import Dict
 import uvicorn
 import sys
 import os
@@ -10,7 +15,16 @@ parent_dir = os.path.dirname(current_dir)
 agent_dir = os.path.join(parent_dir, 'agents')
 sys.path.append(parent_dir) # Add parent of services to reach agents
 
-from agents.api_agent import get_daily_stock_data, ALPHA_VANTAGE_API_KEY
+from agents.api_agent import (
+    get_daily_bars_range, get_daily_stock_data_batch, get_daily_bars_batch, prefetch_daily_bars,
+    alpha_vantage_scheduler, market_data_store, ALPHA_VANTAGE_API_KEY
+)
+from agents.alpha_vantage_scheduler import AlphaVantageQuotaExceeded
+from agents.market_data_store import bars_to_alpha_vantage, bars_to_columnar, bars_to_npz_bytes, bars_to_arrow_ipc, pa
+from agents.indicators import compute_indicators, DEFAULT_BENCHMARK
+from agents.portfolio_risk import PortfolioRiskEngine, RISK_CONFIDENCE
+from agents.holdings_store import HoldingsStore
+from agents.scraping_agent import get_company_profile
 
 app = FastAPI(
     title="Market Data API Service",
@@ -24,25 +38,197 @@ if not ALPHA_VANTAGE_API_KEY:
     # You might want to raise an exception here or handle it more gracefully
     # For now, it will allow the server to start but endpoints will fail.
 
+API_BATCH_MAX_SYMBOLS = int(os.getenv("API_BATCH_MAX_SYMBOLS", 100))
+RISK_MAX_HOLDINGS = int(os.getenv("RISK_MAX_HOLDINGS", 500))
+
+portfolio_risk_engine = PortfolioRiskEngine(bars_loader=get_daily_bars_batch)
+
+def _last_stored_close(symbol: str) -> float | None:
+    # Valuation reads the local store only; missing symbols are prefetched rather than fetched inline
+    bars = market_data_store.load(symbol)
+    return float(bars["close"][-1]) if bars is not None and len(bars["dates"]) else None
+
+holdings_store = HoldingsStore(profile_loader=get_company_profile, price_loader=_last_stored_close)
+
+class PortfolioRiskRequest(BaseModel):
+    holdings: Dict[str, float] = Field(..., description="Symbol -> portfolio weight (fraction of NAV, negative for shorts)")
+    confidence: float = Field(RISK_CONFIDENCE, gt=0, lt=1)
+    horizon_days: int = Field(1, ge=1, le=60)
+    portfolio_value: float | None = Field(None, gt=0, description="Optional NAV to express VaR/CVaR in currency")
+
+def _parse_symbols(symbols: str) -> list[str]:
+    symbol_list = [s.strip().upper() for s in symbols.split(",") if s.strip()]
+    if not symbol_list:
+        raise HTTPException(status_code=400, detail="No symbols provided.")
+    if len(symbol_list) > API_BATCH_MAX_SYMBOLS:
+        raise HTTPException(status_code=400, detail=f"At most {API_BATCH_MAX_SYMBOLS} symbols per batch request.")
+    return symbol_list
+
+# Time-series wire formats: "alphavantage" (default, {date: {"1. open": "..."}}), "columnar"
+# (parallel JSON arrays), and the binary "npz" / "arrow" (Arrow IPC stream, needs pyarrow)
+JSON_FORMATS = ("alphavantage", "columnar")
+BINARY_MEDIA_TYPES = {"npz": "application/x-npz", "arrow": "application/vnd.apache.arrow.stream"}
+
+def _negotiate_format(format: str | None, accept: str | None, allow_binary: bool = True) -> str:
+    """Explicit ?format= wins; otherwise a binary media type in the Accept header selects it."""
+    if format:
+        fmt = format.lower()
+    else:
+        fmt = next((name for name, media_type in BINARY_MEDIA_TYPES.items() if media_type in (accept or "")), "alphavantage")
+    if fmt not in JSON_FORMATS + (tuple(BINARY_MEDIA_TYPES) if allow_binary else ()):
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{fmt}'.")
+    if fmt == "arrow" and pa is None:
+        raise HTTPException(status_code=406, detail="Arrow format unavailable: pyarrow is not installed on the server.")
+    return fmt
+
+def _check_range(start: date | None, end: date | None):
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end.")
+
+def _quota_exceeded(e: AlphaVantageQuotaExceeded) -> HTTPException:
+    retry_after = e.retry_after if e.retry_after is not None else alpha_vantage_scheduler.retry_after()
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(max(1, math.ceil(retry_after)))})
+
+# Fixed paths are declared before the /{symbol} catch-all so they are not read as tickers
+@app.get("/quota/status")
+async def read_quota_status():
+    """Current Alpha Vantage budget: tokens left this minute, calls used today, queued/running calls."""
+    return alpha_vantage_scheduler.status()
+
+@app.post("/prefetch")
+async def prefetch_symbols(symbols: str = Query(..., description="Comma-separated symbols to refresh in the background")):
+    """
+    Queues background refreshes at low priority; they only use quota not needed by interactive requests.
+    """
+    symbol_list = _parse_symbols(symbols)
+    queued = await run_in_threadpool(prefetch_daily_bars, symbol_list)
+    return {"requested": len(symbol_list), "queued": queued}
+
+@app.get("/batch")
+async def read_stock_data_batch(symbols: str = Query(..., description="Comma-separated symbols, e.g. AAPL,MSFT,TSM"),
+                                format: str | None = Query(None, description="alphavantage (default) or columnar"),
+                                start: date | None = None, end: date | None = None):
+    """
+    Daily stock data for many symbols in one round-trip. Symbols fresh in the local store are served
+    from it; the rest are refreshed concurrently within the Alpha Vantage rate limits.
+    Per-symbol failures are reported inline with a status_code instead of failing the whole batch.
+    """
+    symbol_list = _parse_symbols(symbols)
+    fmt = _negotiate_format(format, None, allow_binary=False)
+    _check_range(start, end)
+    if not ALPHA_VANTAGE_API_KEY:
+        raise HTTPException(status_code=500, detail="API key for Alpha Vantage is not configured on the server.")
+
+    print(f"APIService: Received batch request for {len(symbol_list)} symbols.")
+    results = await run_in_threadpool(get_daily_stock_data_batch, symbol_list, start=start, end=end, columnar=fmt == "columnar")
+    return {"format": fmt, "results": results}
+
+def _indicators_for(symbol_list: list[str], benchmark: str | None) -> dict:
+    fetch_symbols = symbol_list + ([benchmark] if benchmark and benchmark not in symbol_list else [])
+    bars_by_symbol, errors = get_daily_bars_batch(fetch_symbols)
+    indicators = compute_indicators(bars_by_symbol, benchmark=benchmark)
+    return {
+        "benchmark": benchmark if benchmark in bars_by_symbol else None,
+        "indicators": {symbol: indicators[symbol] for symbol in symbol_list if symbol in indicators},
+        "errors": errors
+    }
+
+@app.get("/indicators")
+async def read_indicators(symbols: str = Query(..., description="Comma-separated symbols, e.g. AAPL,MSFT,TSM"),
+                          benchmark: str = Query(DEFAULT_BENCHMARK, description="Index symbol for beta; empty to skip")):
+    """
+    Returns, per symbol, returns, rolling volatility, drawdowns, moving averages, gap and volume z-scores,
+    beta against the benchmark and the risk flags they trigger, computed in one vectorised pass.
+    """
+    symbol_list = _parse_symbols(symbols)
+    if not ALPHA_VANTAGE_API_KEY:
+        raise HTTPException(status_code=500, detail="API key for Alpha Vantage is not configured on the server.")
+    print(f"APIService: Computing indicators for {len(symbol_list)} symbols (benchmark: {benchmark or 'none'}).")
+    return await run_in_threadpool(_indicators_for, symbol_list, benchmark.strip().upper() or None)
+
+@app.post("/risk/portfolio")
+async def evaluate_portfolio_risk(request: PortfolioRiskRequest):
+    """
+    Portfolio volatility, parametric and historical VaR/CVaR, and marginal/component risk per holding,
+    from a covariance matrix over the local daily-bar store (cached per trading day).
+    """
+    if not request.holdings:
+        raise HTTPException(status_code=400, detail="No holdings provided.")
+    if len(request.holdings) > RISK_MAX_HOLDINGS:
+        raise HTTPException(status_code=400, detail=f"At most {RISK_MAX_HOLDINGS} holdings per request.")
+    print(f"APIService: Evaluating portfolio risk for {len(request.holdings)} holdings.")
+    result = await run_in_threadpool(
+        portfolio_risk_engine.evaluate, request.holdings,
+        confidence=request.confidence, horizon_days=request.horizon_days, portfolio_value=request.portfolio_value
+    )
+    if result.get("error"):
+        raise HTTPException(status_code=404, detail=result)
+    return result
+
+def _holdings_query(query):
+    try:
+        result = query()
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if result.get("unpriced"):
+        # Value these positions on a later call once their bars are stored
+        prefetch_daily_bars(result["unpriced"])
+    return result
+
+@app.get("/holdings/exposure")
+async def read_holdings_exposure(region: str | None = Query(None, description="e.g. Asia, Europe, North America"),
+                                 sector: str | None = Query(None, description="e.g. Technology, Financials")):
+    """
+    Portfolio exposure to a region and/or sector (sector from SIC, region from the EDGAR business address),
+    with the matching positions. Without filters, returns the region/sector breakdown.
+    """
+    if not region and not sector:
+        return await run_in_threadpool(_holdings_query, holdings_store.breakdown)
+    return await run_in_threadpool(_holdings_query, lambda: holdings_store.exposure(region=region, sector=sector))
+
 @app.get("/{symbol}") # MODIFIED: Path changed to /{symbol}
-async def read_stock_data(symbol: str):
+async def read_stock_data(symbol: str, request: Request,
+                          format: str | None = Query(None, description="alphavantage (default), columnar, npz or arrow"),
+                          start: date | None = Query(None, description="First date (inclusive), YYYY-MM-DD"),
+                          end: date | None = Query(None, description="Last date (inclusive), YYYY-MM-DD")):
     """
     Endpoint to get daily stock data for a given symbol.
+    Without start/end, returns the last 100 trading days. The format can also be negotiated with
+    Accept: application/x-npz or application/vnd.apache.arrow.stream.
     """
     print(f"APIService: Received request for symbol: {symbol}") # ADDED_LINE: Log received symbol
     if not ALPHA_VANTAGE_API_KEY:
         raise HTTPException(status_code=500, detail="API key for Alpha Vantage is not configured on the server.")
-    
-    data, meta_data = get_daily_stock_data(symbol)
-    if not data:
-        print(f"APIService: No data returned from get_daily_stock_data for symbol: {symbol}") # ADDED_LINE
+    fmt = _negotiate_format(format, request.headers.get("accept"))
+    _check_range(start, end)
+
+    try:
+        # Blocks while a refresh waits for an Alpha Vantage call slot, so keep it off the event loop
+        bars, stale = await run_in_threadpool(get_daily_bars_range, symbol, start, end)
+    except AlphaVantageQuotaExceeded as e:
+        print(f"APIService: Alpha Vantage quota exhausted for symbol: {symbol}: {e}")
+        raise _quota_exceeded(e)
+    if bars is None:
+        print(f"APIService: No data returned for symbol: {symbol}") # ADDED_LINE
         raise HTTPException(status_code=404, detail=f"Data not found for symbol {symbol}")
     print(f"APIService: Successfully fetched data for symbol: {symbol}") # ADDED_LINE
-    return {"symbol": meta_data['2. Symbol'] if meta_data else symbol, "data": data}
+
+    if fmt in BINARY_MEDIA_TYPES:
+        content = bars_to_npz_bytes(bars) if fmt == "npz" else bars_to_arrow_ipc(bars)
+        return Response(content=content, media_type=BINARY_MEDIA_TYPES[fmt],
+                        headers={"X-Symbol": symbol.upper(), "X-Stale": str(stale).lower()})
+    return {
+        "symbol": symbol.upper(),
+        "format": fmt,
+        "data": bars_to_columnar(bars) if fmt == "columnar" else bars_to_alpha_vantage(bars),
+        "stale": stale
+    }
 
 @app.get("/")
 async def read_root():
-    return {"message": "Welcome to the Market Data API Service. Use /{symbol} to get data."} # MODIFIED: Updated message
+    return {"message": "Welcome to the Market Data API Service. Use /{symbol} or /batch?symbols=A,B to get data."} # MODIFIED: Updated message
 
 if __name__ == "__main__":
     # Get host and port from environment variables or use defaults
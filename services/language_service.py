@@ -1,6 +1,10 @@
 # filepath: /Users/kartik/Desktop/Raga_Assignemnt/services/language_service.py
-from fastapi import FastAPI, HTTPException, Body
+from fastapi import FastAPI, HTTPException, Body, Header, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+import itertools
+import json
 import sys
 import os
 
@@ -8,6 +12,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from agents.language_agent import LanguageAgent
+from agents.llm_executor import LLMExecutorBusy, PRIORITY_CLASSES, PRIORITY_INTERACTIVE
 
 app = FastAPI(
     title="Language Agent Service",
@@ -24,6 +29,19 @@ except Exception as e:
     # or have the endpoints return an error if the agent isn't loaded.
     language_agent_instance = None
 
+def _llm_busy(e: LLMExecutorBusy) -> HTTPException:
+    headers = {"Retry-After": str(int(e.retry_after) + 1)} if e.retry_after is not None else None
+    return HTTPException(status_code=503, detail=str(e), headers=headers)
+
+def _request_priority(x_request_priority: str | None) -> str:
+    """Scheduling class from the X-Request-Priority header; requests without one are interactive."""
+    if not x_request_priority:
+        return PRIORITY_INTERACTIVE
+    priority = x_request_priority.strip().lower()
+    if priority not in PRIORITY_CLASSES:
+        raise HTTPException(status_code=400, detail=f"Unsupported X-Request-Priority '{x_request_priority}'. Use one of: {', '.join(PRIORITY_CLASSES)}.")
+    return priority
+
 class GenerationRequest(BaseModel):
     prompt: str
     system_prompt: str | None = None
@@ -48,43 +66,140 @@ async def startup_event():
             # Consider a more robust way to handle this, e.g., a health check endpoint
 
 @app.post("/language/generate", tags=["Language Model"])
-async def generate_text(request: GenerationRequest = Body(...)):
+async def generate_text(request: GenerationRequest = Body(...), x_request_priority: str | None = Header(None)):
     """
     Generates text using the language model based on a given prompt.
+    Send `X-Request-Priority: background` for non-user-facing work so it yields to interactive requests.
     """
     if not language_agent_instance:
         raise HTTPException(status_code=503, detail="LanguageAgent not initialized. Please check service logs.")
+    priority = _request_priority(x_request_priority)
     try:
-        response = language_agent_instance.generate_response(
+        # The LLM call blocks; run it off the event loop so other requests keep being served
+        response = await run_in_threadpool(
+            language_agent_instance.generate_response,
             prompt=request.prompt,
-            system_prompt=request.system_prompt
+            system_prompt=request.system_prompt,
+            priority=priority
         )
         return {"response": response}
+    except LLMExecutorBusy as e:
+        raise _llm_busy(e)
     except Exception as e:
         print(f"Error in /language/generate: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/language/generate_with_context", tags=["Language Model"])
-async def generate_text_with_context(request: RAGRequest = Body(...)):
+async def generate_text_with_context(request: RAGRequest = Body(...), x_request_priority: str | None = Header(None)):
     """
     Generates text using the language model. If use_rag is True (default),
     it first fetches context internally and incorporates it into the prompt.
     """
     if not language_agent_instance:
         raise HTTPException(status_code=503, detail="LanguageAgent not initialized. Please check service logs.")
+    priority = _request_priority(x_request_priority)
     try:
         # Call the updated generate_rag_response method
-        response = language_agent_instance.generate_rag_response(
+        response = await run_in_threadpool(
+            language_agent_instance.generate_rag_response,
             prompt=request.prompt,
             use_rag=request.use_rag,
             top_k_retrieval=request.top_k_retrieval,
-            system_prompt=request.system_prompt
+            system_prompt=request.system_prompt,
+            priority=priority
         )
         return {"response": response}
+    except LLMExecutorBusy as e:
+        raise _llm_busy(e)
     except Exception as e:
         print(f"Error in /language/generate_with_context: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+STREAM_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "sse": "text/event-stream"}
+
+def _negotiate_stream_format(format: str | None, accept: str | None) -> str:
+    """`format` query parameter wins; otherwise SSE if the client accepts text/event-stream, else NDJSON."""
+    if format:
+        if format not in STREAM_MEDIA_TYPES:
+            raise HTTPException(status_code=400, detail=f"Unsupported stream format '{format}'. Use one of: {', '.join(STREAM_MEDIA_TYPES)}.")
+        return format
+    return "sse" if accept and "text/event-stream" in accept else "ndjson"
+
+def _start_stream(chunks, route: str):
+    """
+    Pulls the first chunk before the response starts, so a full queue, a shed call or an LLM failure
+    up to that point gets a 503/500 status like the non-streaming endpoints. Later errors go in-stream.
+    """
+    try:
+        first = next(chunks)
+    except StopIteration:
+        return iter(())
+    except LLMExecutorBusy as e:
+        raise _llm_busy(e)
+    except Exception as e:
+        print(f"Error in {route}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return itertools.chain([first], chunks)
+
+def _stream_events(chunks, stream_format: str, route: str):
+    """
+    Wraps a LanguageAgent text-chunk generator as NDJSON lines or SSE events:
+    {"type": "token", "text"} per chunk, then {"type": "done", "text": full response},
+    or {"type": "error", "detail"} if generation fails part-way.
+    """
+    def encode(event: dict) -> str:
+        if stream_format == "sse":
+            return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        return json.dumps(event) + "\n"
+
+    parts = []
+    try:
+        for chunk in chunks:
+            parts.append(chunk)
+            yield encode({"type": "token", "text": chunk})
+        yield encode({"type": "done", "text": "".join(parts)})
+    except LLMExecutorBusy as e:
+        print(f"{route}: LLM busy: {e}")
+        yield encode({"type": "error", "detail": str(e), "retry_after": e.retry_after})
+    except Exception as e:
+        print(f"Error in {route}: {e}")
+        yield encode({"type": "error", "detail": str(e)})
+
+@app.post("/language/generate/stream", tags=["Language Model"])
+def generate_text_stream(request: GenerationRequest = Body(...), format: str | None = Query(None, description="ndjson (default) or sse"),
+                         accept: str | None = Header(None), x_request_priority: str | None = Header(None)):
+    """
+    Streams generated text as it is produced, as NDJSON (default) or server-sent events.
+    """
+    if not language_agent_instance:
+        raise HTTPException(status_code=503, detail="LanguageAgent not initialized. Please check service logs.")
+    stream_format = _negotiate_stream_format(format, accept)
+    priority = _request_priority(x_request_priority)
+    route = "/language/generate/stream"
+    chunks = _start_stream(language_agent_instance.stream_response(prompt=request.prompt, system_prompt=request.system_prompt, priority=priority), route)
+    # A sync generator is iterated in the thread pool, so the event loop stays free between chunks
+    return StreamingResponse(_stream_events(chunks, stream_format, route), media_type=STREAM_MEDIA_TYPES[stream_format])
+
+@app.post("/language/generate_with_context/stream", tags=["Language Model"])
+def generate_text_with_context_stream(request: RAGRequest = Body(...), format: str | None = Query(None, description="ndjson (default) or sse"),
+                                      accept: str | None = Header(None), x_request_priority: str | None = Header(None)):
+    """
+    Streaming variant of /language/generate_with_context. Retrieval runs before the first token.
+    """
+    if not language_agent_instance:
+        raise HTTPException(status_code=503, detail="LanguageAgent not initialized. Please check service logs.")
+    stream_format = _negotiate_stream_format(format, accept)
+    priority = _request_priority(x_request_priority)
+    route = "/language/generate_with_context/stream"
+    chunks = _start_stream(language_agent_instance.stream_rag_response(
+        prompt=request.prompt,
+        use_rag=request.use_rag,
+        top_k_retrieval=request.top_k_retrieval,
+        system_prompt=request.system_prompt,
+        priority=priority
+    ), route)
+    return StreamingResponse(_stream_events(chunks, stream_format, route), media_type=STREAM_MEDIA_TYPES[stream_format])
+
 @app.get("/language/health", tags=["Service Health"])
 async def health_check():
     """
@@ -93,7 +208,10 @@ async def health_check():
     if language_agent_instance and hasattr(language_agent_instance, 'llm'):
         # Basic check: is the agent instance and its llm attribute initialized?
         # More sophisticated checks could involve a dummy call to the LLM.
-        return {"status": "healthy", "message": "LanguageAgent is initialized."}
+        cache = language_agent_instance.response_cache
+        return {"status": "healthy", "message": "LanguageAgent is initialized.",
+                "response_cache": cache.stats() if cache else None,
+                "llm_executor": language_agent_instance.llm_executor.stats()}
     return {"status": "unhealthy", "message": "LanguageAgent not initialized or LLM not available."}
 
 if __name__ == "__main__":
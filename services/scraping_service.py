@@ -1,15 +1,18 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Body
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
 import uvicorn
 import sys
 import os
-from typing import Optional
+from datetime import date
+from typing import List, Optional
 
 # Add the parent directory of 'agents' to the Python path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 sys.path.append(parent_dir) # Add parent of services to reach agents
 
-from agents.scraping_agent import scrape_page_title, get_latest_filings
+from agents.scraping_agent import scrape_page_title, scrape_page_titles, get_latest_filings, get_filings_batch, get_filing_history
 
 app = FastAPI(
     title="Scraping Service",
@@ -17,6 +20,16 @@ app = FastAPI(
     version="0.1.0"
 )
 
+class TitlesBatchRequest(BaseModel):
+    urls: List[str] = Field(..., description="URLs to scrape titles from.", min_items=1, max_items=500)
+
+class FilingsBatchRequest(BaseModel):
+    tickers: List[str] = Field(..., description="Ticker symbols to fetch filings for.", min_items=1)
+    num_filings: int = Field(default=5, description="Maximum filings to return per ticker.", gt=0)
+    filing_types: Optional[List[str]] = Field(default=None, description="Form types to keep, e.g. [\"10-K\", \"10-Q\"].")
+    date_from: Optional[date] = Field(default=None, description="Earliest filing date (inclusive).")
+    date_to: Optional[date] = Field(default=None, description="Latest filing date (inclusive).")
+
 @app.get("/scrape/title")
 async def read_scrape_title(url: str = Query(..., description="The URL to scrape the title from")):
     """
@@ -33,6 +46,23 @@ async def read_scrape_title(url: str = Query(..., description="The URL to scrape
         raise HTTPException(status_code=404, detail=f"No title found at {url}")
     return {"url": url, "title": title}
 
+@app.post("/scrape/titles")
+async def read_scrape_titles(request: TitlesBatchRequest = Body(...)):
+    """
+    Endpoint to scrape the titles of many URLs in one call. URLs are resolved concurrently
+    with a per-host connection limit; each result carries its own status.
+    """
+    titles = await run_in_threadpool(scrape_page_titles, request.urls)
+    results = []
+    for url, title in titles.items():
+        if title is None:
+            results.append({"url": url, "title": None, "status": "error"})
+        elif title == "No title found":
+            results.append({"url": url, "title": None, "status": "no_title"})
+        else:
+            results.append({"url": url, "title": title, "status": "ok"})
+    return {"results": results}
+
 @app.get("/scrape/filings/{ticker}")
 async def read_scrape_filings(ticker: str):
     """
@@ -45,9 +75,58 @@ async def read_scrape_filings(ticker: str):
         raise HTTPException(status_code=404, detail=f"Filings not found for ticker {ticker}")
     return filings_data
 
+@app.post("/scrape/filings/batch")
+async def read_scrape_filings_batch(request: FilingsBatchRequest = Body(...)):
+    """
+    Endpoint to get the latest filings for many tickers in one call.
+    Per-ticker failures are reported in that ticker's "error" field rather than failing the batch.
+    """
+    if request.date_from and request.date_to and request.date_from > request.date_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to.")
+    results = await get_filings_batch(
+        request.tickers,
+        num_filings=request.num_filings,
+        filing_types=request.filing_types,
+        date_from=request.date_from.isoformat() if request.date_from else None,
+        date_to=request.date_to.isoformat() if request.date_to else None
+    )
+    return {"results": results}
+
+@app.get("/scrape/filings/{ticker}/history")
+async def read_filing_history(
+    ticker: str,
+    form_types: Optional[List[str]] = Query(None, description="Form types to keep; repeat the parameter for several, e.g. form_types=10-K&form_types=10-Q"),
+    date_from: Optional[date] = Query(None, description="Earliest filing date (inclusive)."),
+    date_to: Optional[date] = Query(None, description="Latest filing date (inclusive)."),
+    limit: int = Query(100, gt=0, le=1000),
+    offset: int = Query(0, ge=0),
+    refresh: Optional[bool] = Query(None, description="Force (true) or skip (false) refreshing the local index; by default it refreshes when stale.")
+):
+    """
+    Endpoint to query a company's full filing history from the local SQLite filings index,
+    including filings older than the ~1000 entries in SEC's 'recent' block.
+    """
+    if date_from and date_to and date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to.")
+    history = await run_in_threadpool(
+        get_filing_history,
+        ticker,
+        filing_types=form_types,
+        date_from=date_from.isoformat() if date_from else None,
+        date_to=date_to.isoformat() if date_to else None,
+        limit=limit,
+        offset=offset,
+        refresh=refresh
+    )
+    if history.get("error") == "CIK not found":
+        raise HTTPException(status_code=404, detail=f"CIK not found for ticker {ticker}")
+    if history.get("error"):
+        raise HTTPException(status_code=502, detail=f"Could not load filing history for {ticker}: {history['error']}")
+    return history
+
 @app.get("/")
 async def read_root():
-    return {"message": "Welcome to the Scraping Service. Use /scrape/title?url=... or /scrape/filings/{ticker}"}
+    return {"message": "Welcome to the Scraping Service. Use /scrape/title?url=..., POST /scrape/titles, /scrape/filings/{ticker} or POST /scrape/filings/batch"}
 
 if __name__ == "__main__":
     api_host = os.getenv("API_HOST", "0.0.0.0")